@@ -0,0 +1,58 @@
+from django.db import transaction
+
+from .models import CreditCard, Customer, Requirement
+from .reports import data_changed
+from .search import index_customers
+
+# Creation of many new leads at once, for the imports.
+#
+# A lead is a customer with a requirement and a credit card, as created by the new lead form. They are inserted with
+# bulk_create, a few queries for the whole batch instead of three inserts and their signals per lead. bulk_create
+# sends no post_save signal: the search index and the report data version, kept up to date by customer/signals.py
+# for the leads saved one by one, are updated here.
+
+BATCH_SIZE = 500
+
+
+def bulk_create_leads(customers, status='CREATED', batch_size=BATCH_SIZE, requirements=None):
+    """Creates new leads in bulk.
+
+    Args:
+        customers: Unsaved Customer instances.
+        status: Status of their requirements.
+        batch_size: Maximum number of rows inserted by a query.
+        requirements: Optional. Unsaved Requirement of each customer, in the same order, their customer is set here.
+            By default each customer gets a new requirement with status.
+
+    Returns:
+        The customers, with their id set.
+    """
+    customers = list(customers)
+    if not customers:
+        return customers
+
+    with transaction.atomic():
+        for customer in customers:
+            # Done by Customer.save(), which bulk_create does not call
+            customer.update_duplicate_keys()
+        Customer.objects.bulk_create(customers, batch_size=batch_size)
+        if customers[0].pk is None:
+            # The database does not return the ids of the inserted rows, e.g. SQLite: read them back. They are the
+            # last ones, the inserts of the transaction keep the other connections from inserting meanwhile
+            ids = Customer.objects.order_by('-id').values_list('id', flat=True)[:len(customers)]
+            for customer, pk in zip(customers, reversed(list(ids))):
+                customer.pk = pk
+
+        if requirements is None:
+            requirements = [Requirement(status=status) for customer in customers]
+        for customer, requirement in zip(customers, requirements):
+            requirement.customer = customer
+            # Done by Requirement.save(), which bulk_create does not call
+            requirement.update_last_amount_balance_due()
+        Requirement.objects.bulk_create(requirements, batch_size=batch_size)
+        CreditCard.objects.bulk_create([CreditCard(customer=customer) for customer in customers],
+                                       batch_size=batch_size)
+
+        index_customers(customers)
+        data_changed()
+    return customers
@@ -0,0 +1,170 @@
+import datetime
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.template.defaultfilters import floatformat, linebreaksbr
+
+from customer.models import Requirement
+
+# Cells of the rows of requirement-rows.html, computed before rendering.
+#
+# compile_columns() turns a columns definition into one accessor per column, once: the path of the column is
+# parsed into an attrgetter and its formatting is picked from the model field it points to. Rendering a page then
+# only calls the accessors, instead of parsing the path and checking the type of the value for every cell.
+#
+# Columns are displayed as follows:
+#   booleans as Yes/No, dates as dd/mm/yyyy, empty values as '-' and line breaks of text as <br>
+#   'Last amount' and 'STC': amount in dollars with 2 decimals
+#   'Finance': Yes/No, '-' for other values
+#   'Order', when the OrderFlag list flag is set: Requirement.order_state
+#   'Installer', when the installer_flag list flag is set: 'Paid' or the installer amount in dollars
+#   'Supplier', when the supplierFlag list flag is set: one cell per supplier, padded with '-' to supplierMax cells
+
+
+def display_value(value):
+    """Returns the cell displaying a value of any type"""
+    # convert boolean to YES/NO string
+    if isinstance(value, bool):
+        value = 'Yes' if value else 'No'
+
+    # convert datetime object to string format dd/mm/yyyy
+    if isinstance(value, datetime.date):
+        value = value.strftime('%d/%m/%Y')
+
+    return linebreaksbr(value if value else '-', autoescape=True)
+
+
+def display_bool(value):
+    """Returns the cell displaying the value of a boolean field"""
+    if value is None:
+        return '-'
+    return 'Yes' if value else 'No'
+
+
+def display_date(value):
+    """Returns the cell displaying the value of a date or datetime field"""
+    return value.strftime('%d/%m/%Y') if value else '-'
+
+
+def display_text(value):
+    """Returns the cell displaying the value of any other field"""
+    return linebreaksbr(value if value else '-', autoescape=True)
+
+
+def display_amount(value):
+    """Returns the cell displaying an amount in dollars"""
+    return '$ ' + floatformat(linebreaksbr(value, autoescape=True), 2)
+
+
+def field_display(path):
+    """Returns the display function of the model field a column path points to, or display_value if it is not
+    a model field"""
+    model = Requirement
+    *relations, name = path.split('.')
+    try:
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+            if model is None:
+                return display_value
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return display_value
+    if isinstance(field, (models.BooleanField, models.NullBooleanField)):
+        return display_bool
+    if isinstance(field, (models.DateField, models.DateTimeField)):
+        return display_date
+    return display_text
+
+
+def path_accessor(path):
+    """Returns an accessor displaying the value of path, e.g. 'customer.customer_name', of a requirement"""
+    get = attrgetter(path)
+    display = field_display(path)
+
+    def accessor(requirement, context):
+        try:
+            return display(get(requirement))
+        except AttributeError:
+            # The path does not exist, or goes through an empty relation
+            return '-'
+    return accessor
+
+
+def order_accessor(requirement, context):
+    return requirement.order_state
+
+
+def last_amount_accessor(requirement, context):
+    return display_amount(requirement.last_amount_balance_due)
+
+
+def stc_accessor(requirement, context):
+    return display_amount(requirement.stc_amount_payment)
+
+
+def installer_accessor(requirement, context):
+    if requirement.installer_date_paid is not None:
+        return 'Paid'
+    amount = floatformat(linebreaksbr(requirement.installer_amount, autoescape=True), 2)
+    return '$ ' + amount if amount else '$ 0.00'
+
+
+def finance_accessor(requirement, context):
+    return requirement.finance if requirement.finance in ('Yes', 'No') else '-'
+
+
+def suppliers_accessor(requirement, context):
+    cells = []
+    for supplier in requirement.supplier_set.all():
+        if supplier.supplier_date_paid is None and supplier.supplier_amount is not None:
+            cells.append('$ ' + floatformat(supplier.supplier_amount, 2))
+        elif supplier.supplier_amount is None:
+            cells.append('-')
+        else:
+            cells.append('Paid')
+    return cells + ['-'] * (context['supplierMax'] - len(cells))
+
+
+def compile_columns(columns, flags):
+    """Returns the accessors of a columns definition.
+
+    Args:
+        columns: Columns definition of a stage, title: path of the value in the requirement.
+        flags: 'list_context' flags of the stage, enabling its special columns.
+
+    Returns:
+        Tuple of (accessor, expands) in the order of the columns. accessor(requirement, context) returns the cell
+        of the column, or the list of its cells when expands is True.
+    """
+    accessors = []
+    for key, value in columns.items():
+        if flags.get('supplierFlag') and key == 'Supplier':
+            accessors.append((suppliers_accessor, True))
+        elif flags.get('OrderFlag') and key == 'Order':
+            accessors.append((order_accessor, False))
+        elif key == 'Last amount':
+            accessors.append((last_amount_accessor, False))
+        elif key == 'STC':
+            accessors.append((stc_accessor, False))
+        elif flags.get('installer_flag') and key == 'Installer':
+            accessors.append((installer_accessor, False))
+        elif key == 'Finance':
+            accessors.append((finance_accessor, False))
+        else:
+            accessors.append((path_accessor(value), False))
+    return tuple(accessors)
+
+
+def display_rows(requirements, accessors, context):
+    """Returns the list of (requirement, cells) to render, cells being the list of the cells of the row"""
+    rows = []
+    for requirement in requirements:
+        cells = []
+        for accessor, expands in accessors:
+            if expands:
+                cells.extend(accessor(requirement, context))
+            else:
+                cells.append(accessor(requirement, context))
+        rows.append((requirement, cells))
+    return rows
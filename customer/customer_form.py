@@ -0,0 +1,371 @@
+import logging
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+
+from customer.models import CreditCard, Customer, Requirement
+
+# Save of the customer form, customer/customer-full-form.html, posted to the requirement view.
+#
+# The form posts the fields of its sections only: a field not posted keeps its value, an empty field is cleared.
+# Each posted value is converted by the field of FORM_FIELDS it is stored in and compared to the saved value, the
+# values changed are validated by their model field. Nothing is saved if one is not valid.
+# The customer, its requirement and its credit card are read locked, in a single transaction with the save: two
+# staff saving the same customer are saved one after the other, the status and the amounts computed from the values
+# saved by the other one. SQLite has no row locks: the transaction writes first, so the second of two saves waits for
+# the database lock instead of failing, and a save still waiting after the timeout of the database is not saved.
+# Each row is updated only if one of its fields changed, and only the changed fields, so saving a section doesn't
+# write back the other ones. The status buttons, see STATUS_BUTTONS, are checked against the new values.
+# The options of the selects are not read to validate them: a removed option fails the save at the database.
+
+# Formats of the dates and months in the form
+DATE_FORMAT = '%d/%m/%Y'
+MONTH_FORMAT = '%m/%Y'
+
+CHECKBOX = 'checkbox'
+
+
+def _text(value):
+    return value
+
+
+def _date(value):
+    try:
+        return datetime.strptime(value, DATE_FORMAT).date()
+    except ValueError:
+        raise ValidationError('Enter a date as dd/mm/yyyy.')
+
+
+def _month(value):
+    """Returns the first day of a month"""
+    try:
+        return datetime.strptime(value, MONTH_FORMAT).date()
+    except ValueError:
+        raise ValidationError('Enter a month as mm/yyyy.')
+
+
+def _number(value):
+    """Returns a number of the form, with decimals, for an integer field"""
+    try:
+        return float(value)
+    except ValueError:
+        raise ValidationError('Enter a number.')
+
+
+# Set fields of the form.
+# IMPORTANT: to set fields in the tuples, the first value is the name of the input in the form, the second the model
+# and the third the name of the field it is stored in. The last one converts the posted value before the field, or
+# is CHECKBOX for the checkboxes, not posted when unchecked
+FORM_FIELDS = (
+    ('leads_from', Customer, 'leads_from', _text),
+    ('sales_person', Customer, 'sales_person', _text),
+    ('agm', Customer, 'agm', _text),
+    ('date_signed', Customer, 'date_signed', _date),
+    ('customer_name', Customer, 'customer_name', _text),
+    ('customer_address', Customer, 'customer_address', _text),
+    ('customer_email', Customer, 'customer_email', _text),
+    ('phone_number', Customer, 'phone_number', _text),
+    ('follow_up', Customer, 'follow_up', _text),
+    ('customer_notes', Customer, 'customer_notes', _text),
+    ('customer_check', Customer, 'customer_check', CHECKBOX),
+    ('kw', Requirement, 'kw', _text),
+    ('panel', Requirement, 'panel', _text),
+    ('panel_pcs', Requirement, 'panel_pcs', _text),
+    ('inverter', Requirement, 'inverter', _text),
+    ('inverter_pcs', Requirement, 'inverter_pcs', _text),
+    ('roof_type', Requirement, 'roof_type', _text),
+    ('storey', Requirement, 'storey', _text),
+    ('electric_power', Requirement, 'electric_power', _text),
+    ('installation_notes', Requirement, 'installation_notes', _text),
+    ('extra_amount', Requirement, 'extra_amount', _text),
+    ('total_price', Requirement, 'total_price', _text),
+    ('deposit_amount', Requirement, 'deposit_amount', _text),
+    ('last_amount', Requirement, 'last_amount', _text),
+    ('system_price', Requirement, 'system_price', _text),
+    ('MNI', Requirement, 'MNI', _text),
+    ('finance', Requirement, 'finance', _text),
+    ('Application', Requirement, 'application', CHECKBOX),
+    ('installation_date', Requirement, 'installation_date', _date),
+    ('installer', Requirement, 'installer', _text),
+    ('installer_date_paid', Requirement, 'installer_date_paid', _date),
+    ('installer_amount', Requirement, 'installer_amount', _text),
+    ('installer_notes', Requirement, 'Installer_notes', _text),
+    ('deposit_date_paid', Requirement, 'deposit_date_paid', _date),
+    ('deposit_payment', Requirement, 'deposit_payment', _text),
+    ('Unit', Requirement, 'unit', _number),
+    ('unit_price', Requirement, 'unit_price', _text),
+    ('Stc_Application', Requirement, 'stc_application', CHECKBOX),
+    ('Balance_due', Requirement, 'balance_due', _date),
+    ('stc_notes', Requirement, 'stc_notes', _text),
+    ('Stc', Requirement, 'stc_amount', _text),
+    ('stc_date_paid', Requirement, 'stc_date_paid', _date),
+    ('STC_PAYMENT', Requirement, 'STC_PAYMENT', _text),
+    ('last_amount_paid_date', Requirement, 'last_amount_paid_date', _date),
+    ('last_amount_payment', Requirement, 'last_amount_payment', _text),
+    ('last_amount_balance_due', Requirement, 'last_amount_balance_due', _text),
+    ('last_amount_payment_method', Requirement, 'last_amount_payment_method', _text),
+    ('last_amount_notes', Requirement, 'last_amount_notes', _text),
+    ('power_connection', Requirement, 'power_connection', _text),
+    ('meter_connection', Requirement, 'meter_connection', _text),
+    ('credit_card', CreditCard, 'credit_card', _text),
+    ('expires', CreditCard, 'expires', _month),
+)
+
+# Fields set by the save, returned with the posted ones
+COMPUTED_FIELDS = (
+    (Requirement, 'status'),
+    (Requirement, 'order_paid'),
+    (Requirement, 'stc_amount_payment'),
+)
+
+MISSING_DEPOSIT = 'You need complete the "Deposite Data" section'
+
+logger = logging.getLogger(__name__)
+
+
+def _deposit_paid(requirement):
+    return requirement.finance != "Yes" and all([requirement.deposit_payment_id, requirement.deposit_date_paid])
+
+
+def _already_signed(customer, requirement):
+    return 'DEPOSIT', None
+
+
+def _deposit_received(customer, requirement):
+    if _deposit_paid(requirement):
+        return 'ON_FILE', None
+    return None, MISSING_DEPOSIT
+
+
+def _payment_order(customer, requirement):
+    if not customer.customer_check:
+        return None, 'Customer has to be checked before promoting to order'
+    if _deposit_paid(requirement):
+        return 'ORDER', None
+    return None, MISSING_DEPOSIT
+
+
+def _confirm_all(customer, requirement):
+    if not (all([customer.customer_check, requirement.deposit_date_paid]) or requirement.finance == "Yes"):
+        return None, 'Customer has to be checked and deposit has to be paid before confirming'
+    # Set even if the deposit data is not complete
+    requirement.order_paid = True
+    if _deposit_paid(requirement):
+        return 'INSTALLATION', None
+    return None, MISSING_DEPOSIT
+
+
+def _order_paid(customer, requirement):
+    if requirement.deposit_date_paid or requirement.finance == "Yes":
+        requirement.order_paid = True
+        return 'INSTALLATION', None
+    return None, 'Deposit has to be paid before finishing'
+
+
+def _finish_installation(customer, requirement):
+    if _deposit_paid(requirement):
+        return 'ACCOUNT', None
+    return None, MISSING_DEPOSIT
+
+
+def _all_paid(customer, requirement):
+    # The customers added in the account list are finished without their payments
+    if customer.created_from_account or all([
+            requirement.deposit_date_paid, requirement.stc_date_paid, requirement.last_amount_paid_date,
+            requirement.installer_date_paid, requirement.suppliers_paid]):
+        return 'FINISHED', None
+    return None, 'All amounts have to be paid before finishing'
+
+
+def _move_to(status):
+    return lambda customer, requirement: (status, None)
+
+
+# Status buttons of the form, checked in this order, and the function returning (new status, error message) of the
+# requirement, the status None if it can't move
+STATUS_BUTTONS = (
+    ('btn_already_signed', _already_signed),
+    ('btn_deposit_paid', _deposit_received),
+    ('btn_payment_order', _payment_order),
+    ('btn_confirm_all', _confirm_all),
+    ('btn_order_paid', _order_paid),
+    ('btn_finish_installation', _finish_installation),
+    ('btn_all_paid', _all_paid),
+    ('btn_service', _move_to('SERVICE')),
+    ('btn_delivered', _move_to('DELIVERED')),
+    ('btn_delivered_home', _move_to('DELIVERED_HOME')),
+    ('btn_service_home', _move_to('SERVICE_HOME')),
+)
+
+# Read-only page also showing the customers moved by a button
+READ_ONLY_STATUSES = {
+    'btn_already_signed': 'SIGNED',
+}
+
+
+class FormSave:
+    """Result of a save of the customer form.
+
+    Attributes:
+        customer, requirement, credit_card: The rows, with the new values if saved.
+        errors: dict of form field name: message of the values not valid. Nothing is saved if not empty.
+        changed: list of the form and computed fields updated.
+        status: Status the requirement moved to, None if it didn't move.
+        read_only_status: Read-only page also showing the requirement, e.g. 'SIGNED'.
+        status_error: Why the requirement didn't move to the status of the button, None if it did.
+    """
+
+    def __init__(self, customer, requirement, credit_card):
+        self.customer = customer
+        self.requirement = requirement
+        self.credit_card = credit_card
+        self.errors = {}
+        self.changed = []
+        self.status = None
+        self.read_only_status = None
+        self.status_error = None
+
+    @property
+    def saved(self):
+        return not self.errors
+
+    def state(self):
+        """Returns the values of the form fields and the computed fields, for the AJAX callers"""
+        rows = {Customer: self.customer, Requirement: self.requirement, CreditCard: self.credit_card}
+        state = {}
+        fields = [(name, model, field) for name, model, field, parse in FORM_FIELDS] + [
+            (field, model, field) for model, field in COMPUTED_FIELDS]
+        for name, model, field in fields:
+            if rows[model] is not None:
+                state[name] = getattr(rows[model], model._meta.get_field(field).attname)
+        return state
+
+
+def _posted_value(data, name, parse, field):
+    """Returns the value of a form field converted for its model field.
+
+    Raises:
+        ValidationError if the value can't be converted.
+    """
+    if parse == CHECKBOX:
+        return bool(data.get(name))
+    value = data.get(name)
+    if not value:
+        return None
+    value = parse(value)
+    if field.is_relation:
+        # Id of the option
+        return field.target_field.to_python(value)
+    return field.to_python(value)
+
+
+def save_customer_form(customer_id, data):
+    """Saves the fields posted by the customer form, and moves the requirement to the status of the button pressed.
+
+    Args:
+        customer_id: Id of the customer.
+        data: Posted data, e.g. request.POST.
+
+    Returns:
+        FormSave.
+
+    Raises:
+        Requirement.DoesNotExist if the customer has no requirement.
+    """
+    try:
+        with transaction.atomic():
+            return _save(customer_id, data)
+    except IntegrityError:
+        # The options are checked when the transaction commits
+        result = FormSave(*_rows(customer_id))
+        result.errors[''] = 'An option selected was removed, reload the customer'
+        return result
+    except OperationalError as e:
+        # Waited for the save of another connection longer than the timeout of SQLite
+        if 'database is locked' not in str(e):
+            raise
+        logger.warning('Customer %s not saved: %s', customer_id, e)
+        result = FormSave(*_rows(customer_id))
+        result.errors[''] = 'The customer is being saved by someone else, save again'
+        return result
+
+
+def _rows(customer_id, lock=False):
+    """Returns the customer, its requirement and its credit card.
+
+    Args:
+        customer_id: Id of the customer.
+        lock: Lock the rows until the end of the transaction, see _lock().
+    """
+    if lock:
+        _lock(customer_id)
+    requirements = Requirement.objects.select_related('customer')
+    credit_cards = CreditCard.objects.all()
+    if lock:
+        requirements, credit_cards = requirements.select_for_update(), credit_cards.select_for_update()
+    requirement = requirements.filter(customer_id=customer_id).first()
+    if requirement is None:
+        raise Requirement.DoesNotExist('No requirement for customer {}'.format(customer_id))
+    credit_card = credit_cards.filter(customer_id=customer_id).first()
+    return requirement.customer, requirement, credit_card
+
+
+def _lock(customer_id):
+    """Takes the database lock of SQLite, ignoring select_for_update(), before the transaction reads. Two transactions
+    reading then writing fail with "database is locked", the write of one waits for the other one instead"""
+    if not connection.features.has_select_for_update:
+        Customer.objects.filter(pk=customer_id).update(customer_check=F('customer_check'))
+
+
+def _save(customer_id, data):
+    customer, requirement, credit_card = _rows(customer_id, lock=True)
+    result = FormSave(customer, requirement, credit_card)
+    rows = {Customer: customer, Requirement: requirement, CreditCard: credit_card}
+
+    changes = {Customer: {}, Requirement: {}, CreditCard: {}}
+    for name, model, field_name, parse in FORM_FIELDS:
+        if rows[model] is None or (parse != CHECKBOX and name not in data):
+            continue
+        field = model._meta.get_field(field_name)
+        try:
+            value = _posted_value(data, name, parse, field)
+            if value == getattr(rows[model], field.attname):
+                continue
+            if not field.is_relation:
+                field.clean(value, rows[model])
+        except ValidationError as e:
+            result.errors[name] = ' '.join(e.messages)
+            continue
+        changes[model][field.attname] = value
+    if result.errors:
+        return result
+
+    for model, values in changes.items():
+        for attname, value in values.items():
+            setattr(rows[model], attname, value)
+
+    stc_amount_payment = (requirement.stc_amount or 0) - (requirement.STC_PAYMENT or 0)
+    if stc_amount_payment != requirement.stc_amount_payment:
+        requirement.stc_amount_payment = changes[Requirement]['stc_amount_payment'] = stc_amount_payment
+
+    order_paid = requirement.order_paid
+    for button, move in STATUS_BUTTONS:
+        if button in data:
+            result.status, result.status_error = move(customer, requirement)
+            result.read_only_status = READ_ONLY_STATUSES.get(button) if result.status else None
+            break
+    if result.status and result.status != requirement.status:
+        requirement.status = changes[Requirement]['status'] = result.status
+    if requirement.order_paid != order_paid:
+        changes[Requirement]['order_paid'] = requirement.order_paid
+
+    for model, values in changes.items():
+        if values:
+            # save() adds the fields it computes from these ones
+            rows[model].save(update_fields=list(values))
+    result.changed = [name for name, model, field_name, parse in FORM_FIELDS
+                      if model._meta.get_field(field_name).attname in changes[model]]
+    result.changed += [field for model, field in COMPUTED_FIELDS if field in changes[model]]
+    return result
@@ -0,0 +1,52 @@
+from django.db.models import Prefetch
+from django.http import Http404
+
+from customer.models import CreditCard, Requirement
+
+# Lists of a customer a detail view can load with customer_dossier(), and the prefetch reading each of them
+DOSSIER_RELATED = {
+    'credit_card': Prefetch('customer__creditcard_set', queryset=CreditCard.objects.order_by('id')),
+    'files': 'customer__file_set',
+    'suppliers': 'supplier_set',
+    'service_notes': 'servicenote_set',
+}
+
+
+def customer_dossier(pk, *related):
+    """Returns everything a detail view displays about a customer.
+
+    The customer and its requirement are read in one query, then each list of related in one more query.
+
+    Args:
+        pk: Customer ID.
+        related: Names of the lists to load among 'credit_card', 'files', 'suppliers' and 'service_notes'.
+
+    Returns:
+        Dict to add to the context of the view, with 'customer', 'requirement' and each name of related.
+        'credit_card' is the first credit card of the customer or None, the others are lists.
+
+    Raises:
+        Http404: the customer does not exist or has no requirement.
+    """
+    requirement = (Requirement.objects.filter(customer_id=pk)
+                   .select_related('customer')
+                   .prefetch_related(*[DOSSIER_RELATED[name] for name in related])
+                   .order_by('id')
+                   .first())
+    if requirement is None:
+        raise Http404('Customer not found')
+
+    customer = requirement.customer
+    dossier = {
+        'customer': customer,
+        'requirement': requirement,
+    }
+    if 'credit_card' in related:
+        dossier['credit_card'] = next(iter(customer.creditcard_set.all()), None)
+    if 'files' in related:
+        dossier['files'] = list(customer.file_set.all())
+    if 'suppliers' in related:
+        dossier['suppliers'] = list(requirement.supplier_set.all())
+    if 'service_notes' in related:
+        dossier['service_notes'] = list(requirement.servicenote_set.all())
+    return dossier
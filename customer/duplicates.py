@@ -0,0 +1,142 @@
+import re
+
+# Likely duplicates of the customers added by the new lead and add customer forms, the mails and the imports.
+#
+# Customer.save() keeps normalized keys of the AGM, phone number and address in indexed columns, see
+# Customer.update_duplicate_keys(): the same customer typed differently, e.g. "+61 412 345 678" and "0412345678",
+# has the same keys. CustomerQuerySet.duplicate_candidates() reads the customers sharing any key with the new ones
+# in a single query on these indexes, and DuplicateIndex scores each candidate by the keys it shares, the name and
+# email only adding to the score of the candidates found by a key.
+# bulk_create skips save(): call update_duplicate_keys() on the customers before, as customer/bulk.py does.
+
+# Customer field of each key column
+KEY_FIELDS = {
+    'agm_key': 'agm',
+    'phone_key': 'phone_number',
+    'address_key': 'customer_address',
+}
+
+# Score of each key, or compared field, shared with another customer
+WEIGHTS = {
+    'agm_key': 50,
+    'phone_key': 40,
+    'address_key': 40,
+    'customer_email': 30,
+    'customer_name': 20,
+}
+
+# Description of each key in the messages
+LABELS = {
+    'agm_key': 'AGM',
+    'phone_key': 'phone number',
+    'address_key': 'address',
+    'customer_email': 'email',
+    'customer_name': 'name',
+}
+
+# Score from which a customer is considered the same as another one, out of 100. e.g. the same AGM, or the same
+# phone number or address and name
+DUPLICATE_SCORE = 50
+
+
+def normalize_agm(agm):
+    """Returns the AGM in upper case without spaces, None if empty"""
+    return re.sub(r'\s+', '', agm or '').upper() or None
+
+
+def normalize_phone(phone_number):
+    """Returns the digits of a phone number in the national format, e.g. 0412345678 for +61 412 345 678. None if
+    there is no digit"""
+    digits = re.sub(r'\D', '', phone_number or '')
+    if digits.startswith('0061'):
+        digits = '0' + digits[4:]
+    elif digits.startswith('61') and len(digits) == 11:
+        digits = '0' + digits[2:]
+    elif len(digits) == 9 and not digits.startswith('0'):
+        # Leading 0 lost by a spreadsheet reading the number as a number
+        digits = '0' + digits
+    return digits or None
+
+
+def normalize_address(address):
+    """Returns the words of an address in lower case, without punctuation. None if it has no number, e.g. "N/A" or
+    only the suburb, not telling the customers apart"""
+    words = re.findall(r'\w+', (address or '').lower())
+    if not any(word[0].isdigit() for word in words):
+        return None
+    return ' '.join(words)
+
+
+def normalize_text(value):
+    """Returns the words of a name or email in lower case, None if empty"""
+    return ' '.join((value or '').lower().split()) or None
+
+
+NORMALIZE = {
+    'agm_key': normalize_agm,
+    'phone_key': normalize_phone,
+    'address_key': normalize_address,
+}
+
+
+def duplicate_keys(customer):
+    """Returns the value of each key column for a customer, or any object with the customer fields"""
+    return {key: NORMALIZE[key](getattr(customer, field, None)) for key, field in KEY_FIELDS.items()}
+
+
+class DuplicateIndex:
+    """Customers by key, finding the ones likely to be the same as another customer.
+
+    The customers must have their keys, see Customer.update_duplicate_keys().
+    """
+
+    def __init__(self, customers=()):
+        self.customers = {key: {} for key in KEY_FIELDS}
+        for customer in customers:
+            self.add(customer)
+
+    def add(self, customer):
+        for key, customers in self.customers.items():
+            value = getattr(customer, key)
+            if value is not None:
+                customers.setdefault(value, []).append(customer)
+
+    def matches(self, customer):
+        """Returns the customers sharing a key with customer, as a list of (score, customer, shared keys), best
+        first"""
+        candidates = {}
+        for key, customers in self.customers.items():
+            value = getattr(customer, key)
+            for candidate in customers.get(value, ()) if value is not None else ():
+                if candidate is not customer:
+                    candidates[id(candidate)] = candidate
+        matches = []
+        for candidate in candidates.values():
+            points, shared = score(customer, candidate)
+            matches.append((points, candidate, shared))
+        matches.sort(key=lambda match: -match[0])
+        return matches
+
+    def duplicate(self, customer, min_score=DUPLICATE_SCORE):
+        """Returns (score, customer, shared keys) of the best match of customer, None if none scores min_score"""
+        matches = self.matches(customer)
+        if matches and matches[0][0] >= min_score:
+            return matches[0]
+        return None
+
+
+def score(customer, candidate):
+    """Returns (score out of 100, list of the shared keys) of candidate as a duplicate of customer"""
+    shared = [key for key in KEY_FIELDS
+              if getattr(customer, key) is not None and getattr(customer, key) == getattr(candidate, key)]
+    for field in ('customer_email', 'customer_name'):
+        value = normalize_text(getattr(customer, field))
+        if value is not None and value == normalize_text(getattr(candidate, field)):
+            shared.append(field)
+    return min(100, sum(WEIGHTS[key] for key in shared)), shared
+
+
+def describe(match):
+    """Returns the description of a match returned by DuplicateIndex, e.g. 'John Smith (90%, same AGM, name)'"""
+    points, customer, shared = match
+    return '{} ({}%, same {})'.format(customer.customer_name, points, ', '.join(LABELS[key] for key in shared))
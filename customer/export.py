@@ -0,0 +1,202 @@
+import csv
+from itertools import islice
+
+import xlwt
+from django.db.models import Count
+
+from customer.models import Supplier
+from customer.stages import stage_requirements
+
+# Rows of the reports download, shared by the xls export, the streaming csv export and the report jobs in
+# customer/reports.py.
+#
+# The report has one section per stage: a title row, a blank row, the header row and one row per requirement,
+# with two blank rows between sections.
+# Requirements are read with .iterator() in chunks of CHUNK_SIZE, so the rows are produced while they are read and
+# memory does not grow with the number of requirements.
+# .iterator() ignores prefetch_related, the suppliers of the Account section are read once per chunk instead.
+
+CHUNK_SIZE = 500
+
+# Marks the column expanded to one column per supplier in the Account section
+SUPPLIER_COLUMN = 'Supplier'
+
+
+def _date(value):
+    return '-' if value is None else value.strftime("%m/%d/%Y")
+
+
+def _yes_no(value):
+    return 'Yes' if value == True else 'No'
+
+
+def _money(value):
+    return '$ ' + str(value)
+
+
+def _installer_amount(requirement):
+    if requirement.installer_amount is None:
+        return '$ 0.0'
+    if requirement.installer_date_paid is not None:
+        return 'Paid'
+    return _money(requirement.installer_amount)
+
+
+def _supplier_state(supplier):
+    if supplier.supplier_amount is None:
+        return '-'
+    if supplier.supplier_date_paid is None:
+        return _money(round(supplier.supplier_amount, 2))
+    return 'Paid'
+
+
+# Set columns of each section.
+# IMPORTANT: to set columns in the tuples, the first value is the title of the column and the second
+# a function returning the value of the cell from the requirement object,
+# e.g. to get the customer name use lambda r: r.customer.customer_name
+SECTIONS = (
+    ('On File', 'on_file', (
+        ('Data signed', lambda r: _date(r.customer.date_signed)),
+        ('Sales', lambda r: str(r.customer.sales_person)),
+        ('AGM', lambda r: r.customer.agm),
+        ('Customer Name', lambda r: r.customer.customer_name),
+        ('Phone', lambda r: r.customer.phone_number),
+        ('Address', lambda r: r.customer.customer_address),
+        ('Deposit', lambda r: r.deposit_paid),
+        ('Finance', lambda r: r.finance),
+        ('Customer Check', lambda r: _yes_no(r.customer.customer_check)),
+        ('Con/ap', lambda r: _yes_no(r.application)),
+        ('Install notes', lambda r: r.installation_notes),
+    )),
+    ('Order', 'order', (
+        ('Installation Date', lambda r: _date(r.installation_date)),
+        ('Sales', lambda r: str(r.customer.sales_person)),
+        ('AGM', lambda r: r.customer.agm),
+        ('Customer Name', lambda r: r.customer.customer_name),
+        ('Phone', lambda r: r.customer.phone_number),
+        ('Address', lambda r: r.customer.customer_address),
+        ('Order', lambda r: r.order_state),
+        ('Customer Check', lambda r: _yes_no(r.customer.customer_check)),
+        ('Con/ap', lambda r: _yes_no(r.application)),
+        ('Install notes', lambda r: str(r.installation_notes)),
+    )),
+    ('Installation', 'installation', (
+        ('Installation Date', lambda r: _date(r.installation_date)),
+        ('Installer', lambda r: str(r.installer)),
+        ('AGM', lambda r: r.customer.agm),
+        ('Customer Name', lambda r: r.customer.customer_name),
+        ('Phone', lambda r: r.customer.phone_number),
+        ('Address', lambda r: r.customer.customer_address),
+        ('Order', lambda r: r.order_state),
+        ('Customer Check', lambda r: _yes_no(r.customer.customer_check)),
+        ('Con/ap', lambda r: _yes_no(r.application)),
+        ('Install notes', lambda r: str(r.installation_notes)),
+    )),
+    ('Account', 'account', (
+        ('Installation Date', lambda r: _date(r.installation_date)),
+        ('AGM', lambda r: r.customer.agm),
+        ('Customer Name', lambda r: r.customer.customer_name),
+        ('Phone', lambda r: r.customer.phone_number),
+        ('STC/ap', lambda r: 'YES' if r.stc_application else 'No'),
+        ('Last amount', lambda r: _money('0.00' if r.last_amount_balance_due is None else r.last_amount_balance_due)),
+        ('STC', lambda r: _money('0.00' if r.stc_amount_payment == '' else r.stc_amount_payment)),
+        ('Installer', _installer_amount),
+        (SUPPLIER_COLUMN, lambda r: [_supplier_state(supplier) for supplier in r.export_suppliers]),
+        ('Payment notes', lambda r: '-' if r.last_amount_notes is None else str(r.last_amount_notes)),
+    )),
+)
+
+
+def report_total(user):
+    """Returns the number of requirement rows in the report of user"""
+    return sum(stage_requirements(stage, user).count() for title, stage, columns in SECTIONS)
+
+
+def supplier_max():
+    """Returns the highest number of suppliers of a requirement, the number of supplier columns in the Account section"""
+    counts = Supplier.objects.values('requirement').order_by().annotate(Count('requirement'))
+    return max([x['requirement__count'] for x in counts] + [0])
+
+
+def chunks(requirements, size=CHUNK_SIZE):
+    """Yields lists of at most size requirements read with a single .iterator() over the queryset"""
+    iterator = requirements.iterator(chunk_size=size)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def with_suppliers(chunk):
+    """Sets 'export_suppliers' on every requirement of chunk to the list of its suppliers, with a single query"""
+    suppliers = {}
+    for supplier in Supplier.objects.filter(requirement__in=chunk).order_by('id'):
+        suppliers.setdefault(supplier.requirement_id, []).append(supplier)
+    for requirement in chunk:
+        requirement.export_suppliers = suppliers.get(requirement.id, [])
+    return chunk
+
+
+def report_rows(user, chunk_size=CHUNK_SIZE):
+    """Yields the rows of the reports download.
+
+    Args:
+        user: User downloading the report, only the requirements visible to them are exported.
+        chunk_size: Number of requirements read from the database at a time.
+
+    Returns:
+        Generator of tuples (cells, heading). cells is the list of cell values of the row, empty for blank rows.
+        heading is True for the section title and header rows.
+    """
+    supplier_columns = supplier_max()
+
+    for number, (title, stage, columns) in enumerate(SECTIONS):
+        if number:
+            yield [], False
+            yield [], False
+        yield [title], True
+        yield [], False
+
+        header = []
+        for key, value in columns:
+            if key == SUPPLIER_COLUMN:
+                header += [key + str(x + 1) for x in range(supplier_columns)]
+            else:
+                header.append(key)
+        yield header, True
+
+        for chunk in chunks(stage_requirements(stage, user).prefetch_related(None), chunk_size):
+            if any(key == SUPPLIER_COLUMN for key, value in columns):
+                with_suppliers(chunk)
+            for requirement in chunk:
+                cells = []
+                for key, value in columns:
+                    if key == SUPPLIER_COLUMN:
+                        # Pad so the columns after the suppliers stay aligned
+                        states = value(requirement)
+                        cells += states + [None] * (supplier_columns - len(states))
+                    else:
+                        cells.append(value(requirement))
+                yield cells, False
+
+
+def write_csv(rows, file):
+    """Writes the rows returned by report_rows to a text file as csv"""
+    writer = csv.writer(file)
+    for cells, heading in rows:
+        writer.writerow(cells)
+
+
+def write_xls(rows, file):
+    """Writes the rows returned by report_rows to a binary file as an excel workbook.
+    The workbook is built in memory, and an xls sheet holds at most 65536 rows"""
+    wb = xlwt.Workbook(encoding='utf-8')
+    ws = wb.add_sheet('Reports', cell_overwrite_ok=True)
+    heading_style = xlwt.XFStyle()
+    heading_style.font.bold = True
+    font_style = xlwt.XFStyle()
+    for row_num, (cells, heading) in enumerate(rows):
+        for col_num, value in enumerate(cells):
+            ws.write(row_num, col_num, value, heading_style if heading else font_style)
+    wb.save(file)
@@ -0,0 +1,387 @@
+import csv
+import math
+import os
+from datetime import date, datetime
+from itertools import islice, zip_longest
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, models
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+from customer.bulk import bulk_create_leads
+from customer.duplicates import DuplicateIndex, describe
+from customer.models import Customer, ElectricPower, Lead, Payment, Requirement, RoofType, Storey
+from customer.stages import STAGES
+
+# Import of customers from a spreadsheet, e.g. the book of a previous CRM, run by `manage.py import_customers`.
+#
+# The first row of the sheet has the headings of the columns: the titles of COLUMNS or the names of the fields, in
+# any order and case. Unknown columns are ignored. Each following row is a customer and its requirement.
+# The rows are read one at a time from the file, csv or xlsx, and checked by the model fields: every cell is
+# converted and validated by the field of its column, the lead sources, payment methods and the other options are
+# found by name and the users by username, in maps read once before the import. A row likely the same as an existing
+# customer or a previous row, see customer/duplicates.py, is skipped.
+# The valid rows are inserted with customer/bulk.py by chunks of CHUNK_SIZE, each in its own transaction.
+# The rows not imported are listed with the reason in the ImportReport, see write_error_report().
+
+CHUNK_SIZE = 1000
+
+# Formats of the dates in text cells, tried after the ISO format. The customer forms use the first one
+DATE_FORMATS = ('%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y')
+
+TRUE_VALUES = {'yes', 'y', 'true', '1', 'x'}
+FALSE_VALUES = {'no', 'n', 'false', '0', '-'}
+
+# Requirement statuses of the stages
+STATUSES = {status for definition in STAGES.values() for status in definition['statuses'] or ()}
+
+# Set columns of the import.
+# IMPORTANT: to set columns in the tuples, the first value is the heading of the column, the second the model and
+# the third the name of the field the cells are stored in
+COLUMNS = (
+    ('Lead From', Customer, 'leads_from'),
+    ('Sales', Customer, 'sales_person'),
+    ('AGM', Customer, 'agm'),
+    ('Date signed', Customer, 'date_signed'),
+    ('Customer Name', Customer, 'customer_name'),
+    ('Address', Customer, 'customer_address'),
+    ('Email', Customer, 'customer_email'),
+    ('Phone', Customer, 'phone_number'),
+    ('Follow up', Customer, 'follow_up'),
+    ('Notes', Customer, 'customer_notes'),
+    ('Customer Check', Customer, 'customer_check'),
+    ('Status', Requirement, 'status'),
+    ('kW', Requirement, 'kw'),
+    ('Panel', Requirement, 'panel'),
+    ('Panel pcs', Requirement, 'panel_pcs'),
+    ('Inverter', Requirement, 'inverter'),
+    ('Inverter pcs', Requirement, 'inverter_pcs'),
+    ('Roof type', Requirement, 'roof_type'),
+    ('Storey', Requirement, 'storey'),
+    ('Electric power', Requirement, 'electric_power'),
+    ('Install notes', Requirement, 'installation_notes'),
+    ('Finance', Requirement, 'finance'),
+    ('System price', Requirement, 'system_price'),
+    ('Extra amount', Requirement, 'extra_amount'),
+    ('Total price', Requirement, 'total_price'),
+    ('Deposit', Requirement, 'deposit_amount'),
+    ('Deposit date paid', Requirement, 'deposit_date_paid'),
+    ('Deposit payment', Requirement, 'deposit_payment'),
+    ('Installation Date', Requirement, 'installation_date'),
+    ('Installer', Requirement, 'installer'),
+    ('Installer amount', Requirement, 'installer_amount'),
+    ('Installer date paid', Requirement, 'installer_date_paid'),
+    ('Installer notes', Requirement, 'Installer_notes'),
+    ('Con/ap', Requirement, 'application'),
+    ('Unit', Requirement, 'unit'),
+    ('Unit price', Requirement, 'unit_price'),
+    ('STC/ap', Requirement, 'stc_application'),
+    ('STC', Requirement, 'stc_amount'),
+    ('STC date paid', Requirement, 'stc_date_paid'),
+    ('STC notes', Requirement, 'stc_notes'),
+    ('Last amount', Requirement, 'last_amount'),
+    ('Last amount payment', Requirement, 'last_amount_payment'),
+    ('Last amount payment method', Requirement, 'last_amount_payment_method'),
+    ('Last amount paid date', Requirement, 'last_amount_paid_date'),
+    ('Payment notes', Requirement, 'last_amount_notes'),
+    ('Power connection', Requirement, 'power_connection'),
+    ('Meter connection', Requirement, 'meter_connection'),
+    ('MNI', Requirement, 'MNI'),
+)
+
+
+class ImportFileError(Exception):
+    """Raised when the file cannot be imported at all, e.g. unknown format or missing customer name column"""
+
+
+def reference_maps():
+    """Returns the id of each option and user by lower case name, for each model the foreign keys point to"""
+    maps = {model: {} for model in (Lead, Payment, RoofType, Storey, ElectricPower)}
+    for model, ids in maps.items():
+        # The first one of the options with the same name
+        for pk, name in model.objects.values_list('id', 'name').order_by('id'):
+            ids.setdefault(name.strip().lower(), pk)
+    User = get_user_model()
+    maps[User] = {username.lower(): pk for pk, username in User.objects.values_list('id', User.USERNAME_FIELD)}
+    return maps
+
+
+def _empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _text(value):
+    """Returns the text of a cell, whole numbers read from xlsx without their decimals"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = _text(value)
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    raise ValidationError('Enter a valid date, e.g. 31/12/2020.')
+
+
+def _boolean(value):
+    text = _text(value).lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValidationError('Enter Yes or No.')
+
+
+def _number(value):
+    """Returns the number of a cell, amounts can have a currency sign and thousands separators"""
+    if not isinstance(value, (int, float)):
+        try:
+            value = float(_text(value).lstrip('$').replace(',', ''))
+        except ValueError:
+            raise ValidationError('Enter a number.')
+    if not math.isfinite(value):
+        raise ValidationError('Enter a number.')
+    return value
+
+
+def _integer(value):
+    number = _number(value)
+    if isinstance(number, float) and not number.is_integer():
+        raise ValidationError('Enter a whole number.')
+    return int(number)
+
+
+def _status(value):
+    status = _text(value).upper().replace(' ', '_')
+    if status not in STATUSES:
+        raise ValidationError('Unknown status {}.'.format(_text(value)))
+    return status
+
+
+class ImportColumn:
+    """Column of the sheet, converting its cells to the value of a field"""
+
+    def __init__(self, heading, model, name):
+        self.heading = heading
+        self.model = model
+        self.field = model._meta.get_field(name)
+        self.attname = self.field.attname
+        # Function reading the value of a cell, chosen once for the whole file
+        if self.field.is_relation:
+            self.parse = self._reference
+        elif name == 'status':
+            self.parse = _status
+        elif isinstance(self.field, models.BooleanField):
+            self.parse = _boolean
+        elif isinstance(self.field, models.DateField):
+            self.parse = _date
+        elif isinstance(self.field, models.IntegerField):
+            self.parse = _integer
+        elif isinstance(self.field, models.FloatField):
+            self.parse = _number
+        else:
+            self.parse = _text
+        # The references and statuses are checked by parse, the field validators check the other values, e.g.
+        # the length of the texts, the email addresses and the phone numbers
+        self.validate = not (self.field.is_relation or name == 'status')
+        self.references = None
+
+    def _reference(self, value):
+        pk = self.references[self.field.related_model].get(_text(value).lower())
+        if pk is None:
+            raise ValidationError('Unknown {} {}.'.format(self.field.verbose_name, _text(value)))
+        return pk
+
+    def convert(self, value):
+        """Returns the value of the field for a cell.
+
+        Raises:
+            ValidationError if the cell is not a valid value of the field.
+        """
+        if _empty(value):
+            if isinstance(self.field, models.BooleanField):
+                return False
+            # Fails for the required fields
+            value = None if self.field.null else ''
+        else:
+            value = self.parse(value)
+        return self.field.clean(value, None) if self.validate else value
+
+
+def header_columns(header, references):
+    """Returns the ImportColumn of each cell of the header row, None for the unknown columns.
+
+    Args:
+        header: Cells of the first row.
+        references: Maps returned by reference_maps(), used to find the foreign keys.
+
+    Raises:
+        ImportFileError if there is no customer name column.
+    """
+    known = {}
+    for heading, model, name in COLUMNS:
+        known[heading.lower()] = known[name.lower()] = (heading, model, name)
+    columns = [ImportColumn(*known[heading]) if heading in known else None
+               for heading in (_text(cell).lower() if cell is not None else '' for cell in header)]
+    if not any(column and column.attname == 'customer_name' for column in columns):
+        raise ImportFileError('The first row must have the headings of the columns, with a "Customer Name" column')
+    for column in columns:
+        if column is not None:
+            column.references = references
+    return columns
+
+
+def read_csv(path):
+    """Yields the rows of a csv file, as lists of strings"""
+    # utf-8-sig skips the byte order mark Excel writes at the start of the csv files
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        yield from csv.reader(file)
+
+
+def read_xlsx(path):
+    """Yields the rows of the first sheet of an xlsx workbook, as tuples of cell values"""
+    if openpyxl is None:
+        raise ImportFileError('Reading xlsx files needs openpyxl')
+    # The read only mode reads the rows from the file as they are iterated instead of loading the sheet
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+# Reader of each file extension
+READERS = {
+    '.csv': read_csv,
+    '.xlsx': read_xlsx,
+}
+
+
+def read_rows(path):
+    """Yields the rows of a csv or xlsx file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ImportFileError('Unknown file type {}, expected one of {}'.format(extension, ', '.join(READERS)))
+    return READERS[extension](path)
+
+
+class ImportReport:
+    """Result of an import.
+
+    Attributes:
+        rows: number of rows read, without the header and the blank rows.
+        created: number of customers created.
+        duplicates: number of rows skipped as existing customers.
+        errors: list of (row number, column heading, message) of the rows not imported.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.duplicates = 0
+        self.errors = []
+
+    @property
+    def rejected(self):
+        """Number of rows not imported"""
+        return len({row for row, heading, message in self.errors})
+
+
+def import_customers(path, creator=None, status='CREATED', chunk_size=CHUNK_SIZE, dry_run=False):
+    """Creates a customer, with its requirement and credit card, for each row of a spreadsheet.
+
+    Args:
+        path: Path of the csv or xlsx file.
+        creator: Optional. User set as creator of the customers.
+        status: Status of the requirements of the rows without status.
+        chunk_size: Number of rows inserted in a transaction.
+        dry_run: If True, the rows are checked but nothing is saved.
+
+    Returns:
+        ImportReport.
+
+    Raises:
+        ImportFileError if the file cannot be imported.
+    """
+    report = ImportReport()
+    rows = enumerate(read_rows(path), 1)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('The file is empty')
+    columns = header_columns(header[1], reference_maps())
+    # Customers of the previous rows
+    previous = DuplicateIndex()
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return report
+
+        leads = []
+        for number, cells in chunk:
+            if all(_empty(cell) for cell in cells):
+                continue
+            report.rows += 1
+            customer_fields, requirement_fields, errors = {}, {'status': status}, []
+            # The missing cells of the rows shorter than the header are empty
+            for column, value in zip_longest(columns, cells[:len(columns)]):
+                if column is None or (column.attname == 'status' and _empty(value)):
+                    continue
+                try:
+                    fields = customer_fields if column.model is Customer else requirement_fields
+                    fields[column.attname] = column.convert(value)
+                except ValidationError as e:
+                    errors.append((number, column.heading, ' '.join(e.messages)))
+            if errors:
+                report.errors += errors
+                continue
+            leads.append((number, Customer(creator=creator, **customer_fields), Requirement(**requirement_fields)))
+
+        # Duplicates of the existing customers and of the previous rows
+        for number, customer, requirement in leads:
+            customer.update_duplicate_keys()
+        existing = Customer.objects.duplicate_candidates([customer for number, customer, requirement in leads])
+        new_leads = []
+        for number, customer, requirement in leads:
+            match = existing.duplicate(customer) or previous.duplicate(customer)
+            if match:
+                report.duplicates += 1
+                report.errors.append((number, 'Customer Name', 'Customer {} already exists.'.format(describe(match))))
+                continue
+            previous.add(customer)
+            new_leads.append((number, customer, requirement))
+
+        if dry_run or not new_leads:
+            continue
+        try:
+            bulk_create_leads([customer for number, customer, requirement in new_leads],
+                              requirements=[requirement for number, customer, requirement in new_leads])
+        except DatabaseError as e:
+            # The transaction of the chunk is rolled back, the other chunks are imported
+            report.errors += [(number, '', 'Not saved: {}'.format(e)) for number, customer, requirement in new_leads]
+            continue
+        report.created += len(new_leads)
+
+
+def write_error_report(report, file):
+    """Writes the rows not imported of an ImportReport to a text file as csv, by row number"""
+    writer = csv.writer(file)
+    writer.writerow(['Row', 'Column', 'Error'])
+    writer.writerows(sorted(report.errors, key=lambda error: error[0]))
@@ -0,0 +1,65 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from customer.models import ElectricPower, Lead, Payment, RoofType, Storey
+
+# Option lists of the customer forms, cached in the process.
+#
+# The lists change rarely but every detail view displays all of them. They are read once and kept with the lookup
+# version they were read at. The version is in the Django cache and replaced by the signals in customer/signals.py
+# whenever one of the tables, a user or a profile is saved or deleted, so the next render reads the lists again.
+# With the default local memory cache the version is not shared between processes: other server processes see
+# changes after LOOKUP_CACHE_TIMEOUT seconds. Configure a shared cache (CACHES) to see them immediately everywhere.
+
+VERSION_KEY = 'customer_lookup_version'
+
+TIMEOUT = getattr(settings, 'LOOKUP_CACHE_TIMEOUT', 60)
+
+# Context name of each list and the query reading it
+LOOKUPS = {
+    'leads': lambda: Lead.objects.all(),
+    'roof_types': lambda: RoofType.objects.all(),
+    'storeys': lambda: Storey.objects.all(),
+    'electric_powers': lambda: ElectricPower.objects.all(),
+    'payments': lambda: Payment.objects.all(),
+    'sales_people': lambda: get_user_model().objects.filter(profile__title='salesman'),
+    'installers': lambda: get_user_model().objects.filter(profile__title='installer'),
+}
+
+# name: (version, time read, list)
+_lists = {}
+
+
+def lookup_version():
+    """Returns the current lookup version"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = bump_lookup_version()
+    return version
+
+
+def bump_lookup_version():
+    """Replaces the lookup version, so the lists are read again on their next use. Returns the new version"""
+    version = time.time()
+    cache.set(VERSION_KEY, version, None)
+    return version
+
+
+def lookup(name):
+    """Returns a cached option list.
+
+    Args:
+        name: Key of LOOKUPS, e.g. 'leads'.
+
+    Returns:
+        List of model instances. It is shared with other requests and must not be modified.
+    """
+    version = lookup_version()
+    cached = _lists.get(name)
+    if cached is None or cached[0] != version or time.time() - cached[1] > TIMEOUT:
+        cached = (version, time.time(), list(LOOKUPS[name]()))
+        _lists[name] = cached
+    return cached[2]
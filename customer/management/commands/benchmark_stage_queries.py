@@ -0,0 +1,127 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from customer.models import Customer, Requirement, Supplier
+from customer.pagination import keyset_queryset
+from customer.stages import PAGE_SIZE, STAGES, stage_requirements
+
+# Indexes of migrations 0060 and 0061, dropped to measure the queries without them
+BENCHMARK_MODELS = (Customer, Requirement)
+
+# Statuses given to the seeded requirements
+SEED_STATUSES = sorted({status for definition in STAGES.values() for status in definition['statuses'] or ()})
+
+
+class Command(BaseCommand):
+    help = ('Shows the query plans and timings of the first page of every stage list and of the duplicate check of '
+            'the new customers, without and then with the stage list indexes. Everything done by the benchmark, '
+            'seeded rows included, is rolled back at the end')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Number of customers, with their requirement and suppliers, to add before measuring')
+        parser.add_argument('--user', help='Username the lists are loaded for. Default: the first superuser')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of runs of each query, the best one is kept')
+
+    def handle(self, *args, **options):
+        user_model = get_user_model()
+        users = user_model.objects.order_by('id')
+        user = users.filter(username=options['user']).first() if options['user'] else users.filter(
+            is_superuser=True).first()
+        if user is None:
+            raise CommandError('User not found')
+
+        with transaction.atomic():
+            if options['seed']:
+                seed(options['seed'], list(users))
+                self.stdout.write('{} customers seeded'.format(options['seed']))
+            queries = benchmark_queries(user)
+
+            set_indexes(False)
+            without = [measure(queryset, options['repeat']) for name, queryset in queries]
+            set_indexes(True)
+            with_indexes = [measure(queryset, options['repeat']) for name, queryset in queries]
+
+            transaction.set_rollback(True)
+
+        for (name, queryset), before, after in zip(queries, without, with_indexes):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for title, (duration, plan) in (('without indexes', before), ('with indexes', after)):
+                self.stdout.write('  {:<16}{:8.1f} ms'.format(title, duration * 1000))
+                for line in plan.splitlines():
+                    self.stdout.write('      ' + line)
+        self.stdout.write(self.style.SUCCESS('Total: {:.1f} ms without indexes, {:.1f} ms with indexes'.format(
+            sum(duration for duration, plan in without) * 1000,
+            sum(duration for duration, plan in with_indexes) * 1000)))
+
+
+def seed(count, users):
+    """Adds count customers, each with a requirement in a random status and up to 3 suppliers"""
+    today = date.today()
+    customers = [Customer(
+        sales_person=random.choice(users),
+        agm=str(100000 + i),
+        date_signed=today - timedelta(days=random.randint(0, 2000)),
+        customer_name='Benchmark customer {}'.format(i),
+        customer_address='{} Benchmark Street'.format(i),
+        phone_number=str(400000000 + i),
+    ) for i in range(count)]
+    for customer in customers:
+        customer.update_duplicate_keys()
+    Customer.objects.bulk_create(customers)
+    # bulk_create does not return the ids on every database, read them back
+    customer_ids = Customer.objects.order_by('-id').values_list('id', flat=True)[:count]
+    Requirement.objects.bulk_create(Requirement(
+        customer_id=customer_id,
+        status=random.choice(SEED_STATUSES),
+        installation_date=today + timedelta(days=random.randint(-1000, 100)) if random.random() > 0.1 else None,
+        installer=random.choice(users),
+    ) for customer_id in customer_ids)
+    requirement_ids = Requirement.objects.order_by('-id').values_list('id', flat=True)[:count]
+    Supplier.objects.bulk_create(Supplier(
+        requirement_id=requirement_id,
+        supplier_amount=random.choice((None, 100.0, 250.5)),
+        supplier_date_paid=random.choice((None, today)),
+    ) for requirement_id in requirement_ids for i in range(random.randint(0, 3)))
+
+
+def benchmark_queries(user):
+    """Returns the list of (name, queryset) to measure: the first page of each stage list as loaded for user, and
+    the duplicate check of the new customers for an existing customer"""
+    queries = [(stage, keyset_queryset(stage_requirements(stage, user), definition['ordering'])[:PAGE_SIZE + 1])
+               for stage, definition in STAGES.items()]
+    customer = Customer.objects.order_by('id').first()
+    if customer is not None:
+        queries.append(('duplicate customer', Customer.objects.sharing_duplicate_keys([customer])))
+    return queries
+
+
+def set_indexes(enabled):
+    """Creates the indexes of BENCHMARK_MODELS that are missing if enabled, otherwise drops the ones that exist"""
+    schema_editor = connection.schema_editor()
+    with connection.cursor() as cursor:
+        for model in BENCHMARK_MODELS:
+            existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+            for index in model._meta.indexes:
+                if enabled and index.name not in existing:
+                    cursor.execute(str(index.create_sql(model, schema_editor)))
+                elif not enabled and index.name in existing:
+                    cursor.execute(str(index.remove_sql(model, schema_editor)))
+        if connection.vendor == 'sqlite':
+            # Let the query planner know the rows and indexes it now has, as migrations 0060 and 0061 do
+            cursor.execute('ANALYZE')
+
+
+def measure(queryset, repeat):
+    """Returns (duration in seconds of the fastest of repeat runs of queryset, query plan)"""
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        list(queryset.all())
+        durations.append(time.perf_counter() - start)
+    return min(durations), queryset.explain()
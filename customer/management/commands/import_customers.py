@@ -0,0 +1,47 @@
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from customer.imports import CHUNK_SIZE, STATUSES, ImportFileError, import_customers, write_error_report
+
+
+class Command(BaseCommand):
+    help = ('Imports customers from a csv or xlsx file, one customer and its requirement per row. The first row has '
+            'the headings of the columns, see COLUMNS in customer/imports.py. The rows not imported are written to '
+            'an error report')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='csv or xlsx file')
+        parser.add_argument('--creator', help='Username of the user set as creator of the customers')
+        parser.add_argument('--status', default='CREATED', choices=sorted(STATUSES),
+                            help='Status of the requirements of the rows without status. Default: CREATED')
+        parser.add_argument('--errors', help='csv file the rows not imported are written to. Default: <file name>.errors.csv')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows inserted in a transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Check the rows without saving anything')
+
+    def handle(self, *args, **options):
+        creator = None
+        if options['creator']:
+            try:
+                creator = get_user_model().objects.get_by_natural_key(options['creator'])
+            except get_user_model().DoesNotExist:
+                raise CommandError('Unknown user {}'.format(options['creator']))
+
+        start = time.perf_counter()
+        try:
+            report = import_customers(options['file'], creator=creator, status=options['status'],
+                                      chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        except (ImportFileError, OSError) as e:
+            raise CommandError(e)
+        self.stdout.write('{} rows read, {} customers {}, {} duplicates, {} rows with errors in {:.1f}s'.format(
+            report.rows, report.created if not options['dry_run'] else report.rows - report.rejected,
+            'created' if not options['dry_run'] else 'to create', report.duplicates, report.rejected,
+            time.perf_counter() - start))
+
+        if report.errors:
+            errors = options['errors'] or os.path.splitext(options['file'])[0] + '.errors.csv'
+            with open(errors, 'w', newline='', encoding='utf-8') as file:
+                write_error_report(report, file)
+            self.stdout.write('Errors written to {}'.format(errors))
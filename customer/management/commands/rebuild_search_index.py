@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from customer.search import rebuild_index, search_index_available
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the customer search index used by the list searches'
+
+    def handle(self, *args, **options):
+        if not search_index_available():
+            raise CommandError('The customer search index is not available in this database')
+        with transaction.atomic():
+            count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS('{} customers indexed'.format(count)))
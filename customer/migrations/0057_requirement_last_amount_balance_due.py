@@ -0,0 +1,22 @@
+from django.db import migrations
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+
+
+def update_last_amount_balance_due(apps, schema_editor):
+    """Fills last_amount_balance_due of the requirements with a payment, as Requirement.save() does from now on.
+    It was previously computed by the account list and the xls export when they were displayed"""
+    Requirement = apps.get_model('customer', 'Requirement')
+    Requirement.objects.filter(last_amount_payment__isnull=False).update(
+        last_amount_balance_due=Coalesce(F('last_amount'), Value(0.0)) - F('last_amount_payment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0056_auto_20200525_2341'),
+    ]
+
+    operations = [
+        migrations.RunPython(update_last_amount_balance_due, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+import logging
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ('customer_name', 'customer_address', 'customer_email', 'phone_number', 'agm')
+
+
+def create_customer_search(apps, schema_editor):
+    """Creates and fills the customer_search FTS5 table used by customer/search.py. Only on SQLite with FTS5 and the
+    trigram tokenizer (SQLite 3.34+). Otherwise searches keep using "contains" lookups"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute('CREATE VIRTUAL TABLE customer_search USING fts5({}, tokenize="trigram")'.format(
+            ', '.join(SEARCH_FIELDS)))
+    except OperationalError as e:
+        logger.warning('customer_search index not created, searches use "contains" lookups: %s', e)
+        return
+    schema_editor.execute('INSERT INTO customer_search (rowid, {fields}) SELECT id, {fields} FROM customer_customer'.format(
+        fields=', '.join(SEARCH_FIELDS)))
+    # Checked again by customer/search.py
+    schema_editor.connection.customer_search_available = None
+
+
+def drop_customer_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS customer_search')
+        schema_editor.connection.customer_search_available = None
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0057_requirement_last_amount_balance_due'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_customer_search, drop_customer_search),
+    ]
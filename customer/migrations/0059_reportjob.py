@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('customer', '0058_customer_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('scope', models.CharField(max_length=50)),
+                ('data_version', models.CharField(max_length=50)),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('xls', 'Excel')], default='csv', max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('progress', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('file_name', models.CharField(blank=True, max_length=200)),
+                ('error', models.TextField(blank=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='reportjob',
+            index=models.Index(fields=['scope', 'data_version', 'format'], name='customer_re_scope_dc6ee8_idx'),
+        ),
+    ]
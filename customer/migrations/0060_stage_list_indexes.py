@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+def analyze(apps, schema_editor):
+    """Collects the table statistics the SQLite query planner uses to choose between the new indexes. Only on
+    SQLite, other databases keep their statistics up to date on their own"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('ANALYZE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0059_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_date'], name='customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['date_signed'], name='customer_signed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requirement',
+            index=models.Index(fields=['installation_date', 'status'], name='requirement_install_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requirement',
+            index=models.Index(fields=['customer', 'status'], name='requirement_cust_status_idx'),
+        ),
+        migrations.RunPython(analyze, migrations.RunPython.noop),
+    ]
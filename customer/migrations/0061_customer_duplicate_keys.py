@@ -0,0 +1,88 @@
+import re
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+# Normalization of customer/duplicates.py when the keys were added, copied so later changes don't change this migration
+
+def normalize_agm(agm):
+    return re.sub(r'\s+', '', agm or '').upper() or None
+
+
+def normalize_phone(phone_number):
+    digits = re.sub(r'\D', '', phone_number or '')
+    if digits.startswith('0061'):
+        digits = '0' + digits[4:]
+    elif digits.startswith('61') and len(digits) == 11:
+        digits = '0' + digits[2:]
+    elif len(digits) == 9 and not digits.startswith('0'):
+        digits = '0' + digits
+    return digits or None
+
+
+def normalize_address(address):
+    words = re.findall(r'\w+', (address or '').lower())
+    if not any(word[0].isdigit() for word in words):
+        return None
+    return ' '.join(words)
+
+
+def fill_duplicate_keys(apps, schema_editor):
+    """Sets the duplicate keys of the existing customers"""
+    Customer = apps.get_model('customer', 'Customer')
+    last_id = 0
+    while True:
+        # By batches of ids, so memory does not grow with the number of customers
+        customers = list(Customer.objects.filter(id__gt=last_id).order_by('id').only(
+            'id', 'agm', 'phone_number', 'customer_address')[:BATCH_SIZE])
+        if not customers:
+            break
+        for customer in customers:
+            customer.agm_key = normalize_agm(customer.agm)
+            customer.phone_key = normalize_phone(customer.phone_number)
+            customer.address_key = normalize_address(customer.customer_address)
+        Customer.objects.bulk_update(customers, ['agm_key', 'phone_key', 'address_key'])
+        last_id = customers[-1].id
+    if schema_editor.connection.vendor == 'sqlite':
+        # Statistics of the new indexes for the query planner, see migration 0060
+        schema_editor.execute('ANALYZE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0060_stage_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='agm_key',
+            field=models.CharField(blank=True, editable=False, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_key',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='address_key',
+            field=models.CharField(blank=True, editable=False, max_length=200, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['agm_key'], name='customer_agm_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['phone_key'], name='customer_phone_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['address_key'], name='customer_address_key_idx'),
+        ),
+        migrations.RunPython(fill_duplicate_keys, migrations.RunPython.noop),
+    ]
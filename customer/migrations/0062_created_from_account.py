@@ -0,0 +1,102 @@
+# Generated by Django 3.0.6 on 2026-10-18 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0061_customer_duplicate_keys'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='customer',
+            options={'ordering': ['-created_date'], 'permissions': [('customer_list', 'Can view New Customer List page'), ('customer_view', 'Can view New Customer details'), ('deposit_list', 'Can view Deposit List page'), ('deposit_view', 'Can view Deposit details'), ('on_file_list', 'Can view On File List page'), ('on_file_view', 'Can view On File details'), ('order_list', 'Can view Order List page'), ('order_view', 'Can view Order details'), ('installation_list', 'Can view Installation List page'), ('installation_view', 'Can view Installation details'), ('account_list', 'Can view Account List page'), ('account_view', 'Can view Account details'), ('service_list', 'Can view Service List page'), ('service_view', 'Can view Service details'), ('finished_list', 'Can view Finished List page'), ('finished_view', 'Can view Finished details'), ('customer_view_others', 'Can view Customers of other users'), ('delete_customer_data', 'Can delete Customer data'), ('add_new_customer_via_account', 'Add new customer via account'), ('sales_signed', 'See already signed customer'), ('view_reports', 'Can view reports')]},
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='created_from_account',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='title',
+            field=models.CharField(choices=[('user', 'User'), ('Installation', 'Installation'), ('installer', 'Installer'), ('salesman', 'Salesman'), ('account', 'Account')], default='user', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='Installer_notes',
+            field=models.CharField(blank=True, default='', max_length=500, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='STC_PAYMENT',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='deposit_amount',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='extra_amount',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='finance',
+            field=models.CharField(blank=True, default='No', max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='installer_amount',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='last_amount',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='last_amount_balance_due',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='last_amount_payment',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='stc_amount',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='stc_amount_payment',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='system_price',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='total_price',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='requirement',
+            name='unit_price',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+        migrations.AlterField(
+            model_name='supplier',
+            name='supplier_amount',
+            field=models.FloatField(blank=True, default=0.0, null=True),
+        ),
+    ]
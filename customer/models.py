@@ -1,6 +1,10 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from customer.duplicates import KEY_FIELDS, DuplicateIndex, duplicate_keys
 
 numeric = RegexValidator(r'^[0-9]*$', 'Only numeric characters are allowed.')
 
@@ -37,7 +41,37 @@ class Payment(models.Model):
         return self.name if self.name else ''
 
 
+class CustomerQuerySet(models.QuerySet):
+
+    def sharing_duplicate_keys(self, customers):
+        """Returns the customers sharing a duplicate key with any of customers, a single query on the key indexes.
+
+        Args:
+            customers: Customers, saved or not, with their keys, see Customer.update_duplicate_keys().
+        """
+        condition = Q()
+        for key in KEY_FIELDS:
+            values = {getattr(customer, key) for customer in customers} - {None}
+            if values:
+                condition |= Q(**{key + '__in': values})
+        if not condition:
+            return self.none()
+        return self.filter(condition).only('id', 'customer_name', 'customer_email', *KEY_FIELDS).order_by('id')
+
+    def duplicate_candidates(self, customers):
+        """Returns a DuplicateIndex of the customers sharing a duplicate key with any of customers"""
+        return DuplicateIndex(self.sharing_duplicate_keys(customers))
+
+    def likely_duplicates(self, customer):
+        """Returns the customers likely to be the same as customer, as a list of (score, customer, shared keys), best
+        first. See customer/duplicates.py"""
+        customer.update_duplicate_keys()
+        return self.duplicate_candidates([customer]).matches(customer)
+
+
 class Customer(models.Model):
+    objects = CustomerQuerySet.as_manager()
+
     creator = models.ForeignKey(get_user_model(
     ), on_delete=models.CASCADE, null=True, blank=True, related_name='customer_creator')
     created_date = models.DateTimeField(auto_now_add=True)
@@ -62,13 +96,39 @@ class Customer(models.Model):
     customer_check = models.BooleanField(default=False)
     
     created_from_account = models.BooleanField(default=False) # for adding customer via account
-    
+
+    # Normalized AGM, phone number and address finding the duplicates, see customer/duplicates.py
+    agm_key = models.CharField(max_length=50, blank=True, null=True, editable=False)
+    phone_key = models.CharField(max_length=20, blank=True, null=True, editable=False)
+    address_key = models.CharField(max_length=200, blank=True, null=True, editable=False)
 
     def __str__(self):
         return self.customer_name if self.customer_name else ''
 
+    def save(self, *args, **kwargs):
+        """Keeps the duplicate keys up to date with the AGM, phone number and address"""
+        self.update_duplicate_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(KEY_FIELDS.values()) & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | set(KEY_FIELDS)
+        super().save(*args, **kwargs)
+
+    def update_duplicate_keys(self):
+        """Sets the duplicate keys from the AGM, phone number and address"""
+        for key, value in duplicate_keys(self).items():
+            setattr(self, key, value)
+
     class Meta:
         ordering = ['-created_date']
+        indexes = [
+            # Stage lists ordered by creation or signature date
+            models.Index(fields=['created_date'], name='customer_created_idx'),
+            models.Index(fields=['date_signed'], name='customer_signed_idx'),
+            # Duplicate checks of the new customers, see customer/duplicates.py
+            models.Index(fields=['agm_key'], name='customer_agm_key_idx'),
+            models.Index(fields=['phone_key'], name='customer_phone_key_idx'),
+            models.Index(fields=['address_key'], name='customer_address_key_idx'),
+        ]
         permissions = [
             ("customer_list", "Can view New Customer List page"),
             ("customer_view", "Can view New Customer details"),
@@ -135,10 +195,66 @@ class ElectricPower(models.Model):
         return self.name if self.name else ''
 
 
+class RequirementQuerySet(models.QuerySet):
+
+    def visible_to(self, user):
+        """Returns the requirements user can see: all of them with 'customer.customer_view_others', otherwise
+        the ones they sell or install.
+
+        The sales person is matched with a subquery on the indexed customer sales person instead of a join, so
+        the filter never duplicates rows and no DISTINCT is needed.
+        """
+        if user.has_perm('customer.customer_view_others'):
+            return self
+        return self.filter(Q(installer_id=user.pk) |
+                           Q(customer_id__in=Customer.objects.filter(sales_person_id=user.pk).values('id')))
+
+    def with_supplier_rollup(self):
+        """Annotates each requirement with a summary of its suppliers, computed in the same query:
+            supplier_count: number of suppliers
+            supplier_priced_count: number of suppliers that are paid or have an amount
+            supplier_unpaid_amount: sum of the amounts of the suppliers not paid yet. None if there is none
+        Used by Requirement.order_state.
+
+        Each value is read by a subquery on the suppliers of the requirement rather than a join and GROUP BY, so
+        the list can still be read in the order of the installation date index and stop at the page size.
+        """
+        suppliers = Supplier.objects.filter(requirement=OuterRef('pk')).order_by().values('requirement')
+        priced = suppliers.filter(Q(supplier_date_paid__isnull=False) | Q(supplier_amount__isnull=False))
+        return self.annotate(
+            supplier_count=Coalesce(Subquery(suppliers.annotate(count=Count('id')).values('count')), 0),
+            supplier_priced_count=Coalesce(Subquery(priced.annotate(count=Count('id')).values('count')), 0),
+            supplier_unpaid_amount=Subquery(suppliers.filter(supplier_date_paid=None).annotate(
+                total=Sum('supplier_amount')).values('total')),
+        )
+
+    def account_summary(self):
+        """Returns the totals of the account summary of the requirements, computed in a single query.
+
+        Returns:
+            total_stc: STC amounts to receive
+            total_last_amount: customer balances due
+            total_installers: installer amounts not paid yet
+            total_suppliers: supplier amounts not paid yet
+        """
+        # Summing the suppliers in a subquery keeps the supplier join from repeating the requirement amounts
+        unpaid_suppliers = Supplier.objects.filter(requirement=OuterRef('pk'), supplier_date_paid=None).order_by(
+            ).values('requirement').annotate(total=Sum('supplier_amount')).values('total')
+        totals = self.annotate(unpaid_suppliers=Subquery(unpaid_suppliers)).aggregate(
+            total_stc=Sum('stc_amount_payment'),
+            total_last_amount=Sum('last_amount_balance_due'),
+            total_installers=Sum('installer_amount', filter=Q(installer_date_paid=None)),
+            total_suppliers=Sum('unpaid_suppliers'),
+        )
+        return {name: total or 0 for name, total in totals.items()}
+
+
 class Requirement(models.Model):
     """
     Users create a customer and the information is stored in a database.
     """
+    objects = RequirementQuerySet.as_manager()
+
     created_date = models.DateTimeField(auto_now_add=True)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     kw = models.CharField(max_length=50, null=True, blank=True)
@@ -211,6 +327,23 @@ class Requirement(models.Model):
     def __str__(self):
         return self.customer.customer_name if self.customer.customer_name else ''
 
+    def save(self, *args, **kwargs):
+        """Keeps last_amount_balance_due up to date with last_amount and last_amount_payment, so lists and reports
+        only have to read it"""
+        self.update_last_amount_balance_due()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'last_amount', 'last_amount_payment'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'last_amount_balance_due'}
+        super().save(*args, **kwargs)
+
+    def update_last_amount_balance_due(self):
+        """Sets last_amount_balance_due to the last amount left to pay once a payment is registered"""
+        # Values may still be the strings posted in the customer form
+        last_amount_payment = self._meta.get_field('last_amount_payment').to_python(self.last_amount_payment)
+        if last_amount_payment is not None:
+            last_amount = self._meta.get_field('last_amount').to_python(self.last_amount)
+            self.last_amount_balance_due = (last_amount or 0) - last_amount_payment
+
     @property
     def supplier_status(self):
         """Summarizes suppliers information to display in account list view"""
@@ -224,6 +357,23 @@ class Requirement(models.Model):
     def suppliers_paid(self):
         return all([True if supplier.supplier_date_paid else False for supplier in self.supplier_set.all()])
 
+    @property
+    def order_state(self):
+        """Summarizes suppliers payments to display in the 'Order' column: '_' if no supplier is paid or has an
+        amount, 'Paid' if nothing is left to pay, or the amount left to pay as '$ x'.
+        Reads the with_supplier_rollup() annotations, or queries them if the requirement was loaded without them."""
+        if not hasattr(self, 'supplier_unpaid_amount'):
+            rollup = Requirement.objects.filter(pk=self.pk).with_supplier_rollup().values(
+                'supplier_count', 'supplier_priced_count', 'supplier_unpaid_amount').get()
+            self.__dict__.update(rollup)
+
+        if self.supplier_count == 0 or self.supplier_priced_count == 0:
+            return '_'
+        elif not self.supplier_unpaid_amount:
+            return 'Paid'
+        else:
+            return '$ ' + str(self.supplier_unpaid_amount)
+
     @property
     def installation_paid(self):
         """Returns whether the installation has a pay date or not"""
@@ -243,6 +393,12 @@ class Requirement(models.Model):
 
     class Meta:
         ordering = ['-customer__created_date']
+        indexes = [
+            # Stage lists ordered by installation date, and the requirements of the customers read in the order
+            # of the customer indexes, both checking the status in the index
+            models.Index(fields=['installation_date', 'status'], name='requirement_install_status_idx'),
+            models.Index(fields=['customer', 'status'], name='requirement_cust_status_idx'),
+        ]
     # content_type =   models.ForeignKey(ContentType, on_delete=models.CASCADE)
     # object_id = models.PositiveIntegerField()
     # content_object=GenericForeignKey('object_id')
@@ -299,3 +455,43 @@ class AppData(models.Model):
 
     def __str__(self):
         return self.name if self.name else ''
+
+
+REPORT_JOB_STATUS = [
+    ('PENDING', 'Pending'),
+    ('RUNNING', 'Running'),
+    ('DONE', 'Done'),
+    ('FAILED', 'Failed'),
+]
+
+REPORT_FORMATS = [
+    ('csv', 'CSV'),
+    ('xls', 'Excel'),
+]
+
+
+class ReportJob(models.Model):
+    """
+    Reports download generated in the background, see customer/reports.py.
+    The file is shared by every job with the same scope, data version and format.
+    """
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    # Requirements visible to the user, 'all' or 'user-<id>'
+    scope = models.CharField(max_length=50)
+    data_version = models.CharField(max_length=50)
+    format = models.CharField(max_length=10, choices=REPORT_FORMATS, default='csv')
+    status = models.CharField(max_length=20, choices=REPORT_JOB_STATUS, default='PENDING')
+    # Number of requirements written and to write
+    progress = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    # Path of the report relative to MEDIA_ROOT
+    file_name = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['scope', 'data_version', 'format'])]
+
+    def __str__(self):
+        return '{} {} {}'.format(self.scope, self.format, self.status)
@@ -0,0 +1,131 @@
+import base64
+import json
+from datetime import date, datetime
+
+from django.db import connections
+from django.db.models import F, Q
+
+
+def encode_cursor(value, pk):
+    """Encodes the position of a row in a keyset ordered list.
+
+    Args:
+        value: Value of the ordering field of the row. None, str, int, float, date or datetime.
+        pk: Primary key of the row, used as tiebreaker.
+
+    Returns:
+        Url safe string to send to the client.
+    """
+    if isinstance(value, (date, datetime)):
+        # isoformat keeps microseconds and the UTC offset, so the value compares equal once parsed back
+        value = value.isoformat()
+    data = json.dumps([value, pk]).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor, field):
+    """Decodes a cursor made by encode_cursor.
+
+    Args:
+        cursor: String returned by encode_cursor.
+        field: Model field the list is ordered by, used to parse the value back to python.
+
+    Returns:
+        Tuple (value, pk).
+
+    Raises:
+        ValueError: cursor is not valid.
+    """
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if value is not None:
+            value = field.to_python(value)
+        return value, int(pk)
+    except Exception as e:
+        raise ValueError('Invalid cursor {}'.format(cursor)) from e
+
+
+def get_field(model, path):
+    """Returns the model field referenced by a lookup path like 'customer__date_signed'"""
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def get_value(obj, path):
+    """Returns the value referenced by a lookup path like 'customer__date_signed' from a model instance"""
+    for attr in path.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, attr)
+    return obj
+
+
+def keyset_queryset(queryset, ordering, cursor=None):
+    """Returns a queryset ordered for keyset (seek) pagination, starting after the row of cursor.
+
+    Rows are ordered by 'ordering' and then by id, nulls first when ascending and last when descending.
+
+    Args:
+        queryset: Queryset to paginate. Any previous ordering is replaced.
+        ordering: Lookup path of the field to order by, prefixed with '-' for descending order.
+        cursor: Optional. Cursor returned with the previous page. If None the queryset starts at the first row.
+
+    Returns:
+        Ordered queryset, to be sliced to the size of the page.
+
+    Raises:
+        ValueError: cursor is not valid.
+    """
+    descending = ordering.startswith('-')
+    path = ordering.lstrip('-')
+
+    if not connections[queryset.db].features.nulls_order_largest:
+        # Nulls already sort first when ascending and last when descending, so the list can be read in the order
+        # of an index on the field instead of being sorted on an 'IS NULL' expression
+        queryset = queryset.order_by(ordering, '-id' if descending else 'id')
+    elif descending:
+        queryset = queryset.order_by(F(path).desc(nulls_last=True), '-id')
+    else:
+        queryset = queryset.order_by(F(path).asc(nulls_first=True), 'id')
+
+    if cursor:
+        value, pk = decode_cursor(cursor, get_field(queryset.model, path))
+        after = 'lt' if descending else 'gt'
+        if value is None:
+            after_cursor = Q(**{path + '__isnull': True, 'id__' + after: pk})
+            if not descending:
+                after_cursor |= Q(**{path + '__isnull': False})
+        else:
+            after_cursor = Q(**{path + '__' + after: value}) | Q(**{path: value, 'id__' + after: pk})
+            if descending:
+                after_cursor |= Q(**{path + '__isnull': True})
+        queryset = queryset.filter(after_cursor)
+    return queryset
+
+
+def keyset_page(queryset, ordering, cursor=None, size=100):
+    """Returns a page of a queryset using keyset (seek) pagination.
+
+    Rows are ordered as by keyset_queryset, so the cost of a page does not depend on how many rows come before
+    it, unlike OFFSET pagination.
+
+    Args:
+        queryset: Queryset to paginate. Any previous ordering is replaced.
+        ordering: Lookup path of the field to order by, prefixed with '-' for descending order.
+        cursor: Optional. Cursor returned with the previous page. If None the first page is returned.
+        size: Maximum number of rows in the page.
+
+    Returns:
+        Tuple (rows, next_cursor). next_cursor is None when there are no more rows.
+
+    Raises:
+        ValueError: cursor is not valid.
+    """
+    # Fetch one more row than needed to know if there is a next page
+    rows = list(keyset_queryset(queryset, ordering, cursor=cursor)[:size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, encode_cursor(get_value(rows[-1], ordering.lstrip('-')), rows[-1].pk)
@@ -0,0 +1,171 @@
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from customer.export import CHUNK_SIZE, report_rows, report_total, write_csv, write_xls
+from customer.models import AppData, ReportJob
+
+# Reports download generated in the background.
+#
+# start_report_job() records a ReportJob and runs it in a pool of worker threads, the page polls the job for its
+# progress and downloads the file once it is done.
+# Files are written under MEDIA_ROOT/reports/, named after the scope of the user (the requirements they can see)
+# and the data version, so every user with the same scope downloads the same file until the data changes.
+# The data version is a random value in AppData, replaced by the signals in customer/signals.py once the transaction
+# saving or deleting a customer, requirement, supplier or user is committed, see data_changed(). Queryset update()
+# and bulk operations skip signals: call data_changed() after them.
+
+REPORTS_DIR = 'reports'
+
+DATA_VERSION = 'report_data_version'
+
+WORKERS = getattr(settings, 'REPORT_JOB_WORKERS', 2)
+
+# A pending or running job not updated for this long is considered lost (e.g. the server restarted) and started again
+STALE_AFTER = timedelta(minutes=getattr(settings, 'REPORT_JOB_STALE_MINUTES', 10))
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='report-job')
+
+logger = logging.getLogger(__name__)
+
+
+def data_version():
+    """Returns the current data version"""
+    app_data = AppData.objects.filter(name=DATA_VERSION).first()
+    if app_data is None:
+        return bump_data_version()
+    return app_data.value
+
+
+def bump_data_version():
+    """Replaces the data version, so the next reports are generated again. Returns the new version"""
+    value = uuid.uuid4().hex
+    if not AppData.objects.filter(name=DATA_VERSION).update(value=value):
+        AppData.objects.create(name=DATA_VERSION, value=value)
+    return value
+
+
+def data_changed():
+    """Replaces the data version once the current transaction is committed, a single time however many rows it
+    changes. Replaced at once outside a transaction"""
+    # Callbacks of the transaction, dropped by Django if it is rolled back
+    if not any(callback[1] is bump_data_version for callback in connection.run_on_commit):
+        transaction.on_commit(bump_data_version)
+
+
+def report_scope(user):
+    """Returns the name of the set of requirements user can see in the reports"""
+    if user.has_perm('customer.customer_view_others'):
+        return 'all'
+    return 'user-{}'.format(user.pk)
+
+
+def report_path(job):
+    """Returns the absolute path of the file of a job"""
+    return os.path.join(settings.MEDIA_ROOT, job.file_name)
+
+
+def start_report_job(user, format='csv'):
+    """Returns the job making the report of user, starting a new one only if needed.
+
+    Args:
+        user: User downloading the report.
+        format: 'csv' or 'xls'.
+
+    Returns:
+        ReportJob. A done job when the report of the current data is already generated, or the job already
+        generating it, or a new pending job.
+    """
+    scope, version = report_scope(user), data_version()
+    jobs = ReportJob.objects.filter(scope=scope, data_version=version, format=format)
+
+    done = jobs.filter(status='DONE').order_by('-id').first()
+    if done is not None and os.path.exists(report_path(done)):
+        return done
+
+    running = jobs.filter(status__in=['PENDING', 'RUNNING'],
+                          updated_date__gte=timezone.now() - STALE_AFTER).order_by('-id').first()
+    if running is not None:
+        return running
+
+    job = ReportJob.objects.create(user=user, scope=scope, data_version=version, format=format)
+    # The worker reads the job from the database, wait for the request transaction if any
+    transaction.on_commit(lambda: _executor.submit(run_report_job, job.pk))
+    return job
+
+
+def _with_progress(job, rows):
+    """Yields rows, saving the number of requirement rows in job.progress every CHUNK_SIZE rows"""
+    progress = 0
+    for cells, heading in rows:
+        if cells and not heading:
+            progress += 1
+            if progress % CHUNK_SIZE == 0:
+                # update() skips auto_now, updated_date tells the job is alive
+                ReportJob.objects.filter(pk=job.pk).update(progress=progress, updated_date=timezone.now())
+        yield cells, heading
+
+
+def run_report_job(pk):
+    """Writes the report of a job to its file. Runs in a worker thread"""
+    temp_path = None
+    try:
+        job = ReportJob.objects.select_related('user').get(pk=pk)
+        job.status = 'RUNNING'
+        job.total = report_total(job.user)
+        job.save(update_fields=['status', 'total', 'updated_date'])
+
+        job.file_name = os.path.join(REPORTS_DIR, '{}-{}.{}'.format(job.scope, job.data_version, job.format))
+        path = report_path(job)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first, so a file under the final name is always complete
+        temp_path = '{}.{}.tmp'.format(path, job.pk)
+        rows = _with_progress(job, report_rows(job.user))
+        if job.format == 'xls':
+            with open(temp_path, 'wb') as file:
+                write_xls(rows, file)
+        else:
+            with open(temp_path, 'w', newline='', encoding='utf-8') as file:
+                write_csv(rows, file)
+        os.replace(temp_path, path)
+
+        job.status = 'DONE'
+        job.progress = job.total
+        job.save(update_fields=['status', 'progress', 'file_name', 'updated_date'])
+        delete_old_reports(job)
+    except Exception as e:
+        # The executor drops the exceptions of its threads
+        logger.exception('Report job %s failed', pk)
+        _failed(pk, e)
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+    finally:
+        # Worker threads open their own connection, don't leave it open between jobs
+        connection.close()
+
+
+def _failed(pk, error):
+    """Records the failure of a job, shown by the page polling it"""
+    try:
+        # update() doesn't depend on the state of the job in memory when it failed
+        ReportJob.objects.filter(pk=pk).update(status='FAILED', error='{}: {}'.format(type(error).__name__, error),
+                                               updated_date=timezone.now())
+    except Exception:
+        logger.exception('Report job %s failure not recorded', pk)
+
+
+def delete_old_reports(job):
+    """Deletes the files of the previous data versions of the report of a job"""
+    old_jobs = ReportJob.objects.filter(scope=job.scope, format=job.format, status='DONE').exclude(
+        data_version=job.data_version)
+    for old_job in old_jobs:
+        if old_job.file_name and os.path.exists(report_path(old_job)):
+            os.remove(report_path(old_job))
+    old_jobs.update(file_name='')
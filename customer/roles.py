@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Group membership of the users, for the role checks of the views and templates.
+#
+# The names of the groups of a user are read once and kept on the user object for the rest of the request, and in
+# the Django cache for the following requests, under the current groups version. The version is replaced by the
+# signals in customer/signals.py when users are added to or removed from groups, or a group is renamed or deleted.
+# With the default local memory cache the version is not shared between processes: other server processes see
+# changes after GROUPS_CACHE_TIMEOUT seconds, like the option lists of customer/lookups.py.
+# Permissions need no cache here: the authentication backend already loads them once per request.
+
+VERSION_KEY = 'customer_groups_version'
+
+TIMEOUT = getattr(settings, 'GROUPS_CACHE_TIMEOUT', 60)
+
+
+def groups_version():
+    """Returns the current groups version"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = bump_groups_version()
+    return version
+
+
+def bump_groups_version():
+    """Replaces the groups version, so group memberships are read again. Returns the new version"""
+    version = time.time()
+    cache.set(VERSION_KEY, version, None)
+    return version
+
+
+def user_groups(user):
+    """Returns the frozenset of the names of the groups of user. Empty for anonymous users"""
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, '_group_names', None)
+    if names is None:
+        key = 'customer_groups:{}:{}'.format(groups_version(), user.pk)
+        names = cache.get(key)
+        if names is None:
+            names = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(key, names, TIMEOUT)
+        user._group_names = names
+    return names
+
+
+def user_in_group(user, group_name):
+    """Returns whether user belongs to the group named group_name"""
+    return group_name in user_groups(user)
@@ -0,0 +1,119 @@
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Full text index of the customer fields the searches look into.
+#
+# On SQLite it is the FTS5 virtual table 'customer_search' created by migration 0058, with the trigram tokenizer so a
+# search still matches any part of a field, case insensitive, like the "contains" lookups it replaces, but reads the
+# index instead of scanning every customer.
+# Rows use the customer id as rowid and are kept in sync by the Customer signals in customer/signals.py.
+# Bulk operations skip signals: call index_customers() after them, or run "manage.py rebuild_search_index".
+#
+# On other databases, or before the table exists, searches fall back to "contains" lookups.
+
+SEARCH_TABLE = 'customer_search'
+
+# Customer fields in the index, in the order of the table columns
+SEARCH_FIELDS = ('customer_name', 'customer_address', 'customer_email', 'phone_number', 'agm')
+
+# The trigram tokenizer can only match strings of 3 or more characters
+MIN_MATCH_LENGTH = 3
+
+
+def search_index_available():
+    """Returns whether the search index table exists in the database. Checked once per database connection, so a
+    connection opened after the table is created or dropped, e.g. by a migration or for the test database, sees it"""
+    available = getattr(connection, 'customer_search_available', None)
+    if available is None:
+        available = connection.vendor == 'sqlite' and SEARCH_TABLE in connection.introspection.table_names()
+        connection.customer_search_available = available
+    return available
+
+
+def _reset_search_index_available(sender, connection, **kwargs):
+    connection.customer_search_available = None
+
+
+connection_created.connect(_reset_search_index_available)
+
+
+def match_expression(search_value):
+    """Returns the FTS5 MATCH expression finding search_value as a substring of any indexed field"""
+    # A quoted phrase of trigrams matches consecutive characters inside a single column
+    return '"{}"'.format(search_value.replace('"', '""'))
+
+
+def contains_filter(search_value):
+    """Returns a Q object matching requirements whose customer name, address, email, phone or AGM contain search_value"""
+    return (Q(customer__customer_name__contains=search_value) |
+            Q(customer__customer_address__contains=search_value) |
+            Q(customer__customer_email__contains=search_value) |
+            Q(customer__phone_number__contains=search_value) |
+            Q(customer__agm__contains=search_value))
+
+
+def search_filter(search_value):
+    """Returns a Q object matching requirements whose customer name, address, email, phone or AGM contain search_value.
+    Uses the search index when available"""
+    if len(search_value) < MIN_MATCH_LENGTH or not search_index_available():
+        return contains_filter(search_value)
+    return Q(customer_id__in=RawSQL(
+        'SELECT rowid FROM {} WHERE {} MATCH %s'.format(SEARCH_TABLE, SEARCH_TABLE), [match_expression(search_value)]))
+
+
+def ranked_filter(requirements, search_value):
+    """Returns the requirements whose customer matches search_value, joined with the search index so they can be
+    ordered by rank in the same query.
+
+    Args:
+        requirements: Requirement queryset.
+        search_value: Text to find in the customer name, address, email, phone or AGM.
+
+    Returns:
+        The requirements with a 'search_rank' column, bm25 rank of their customer, lower is better. None if the
+        search index cannot be used for search_value.
+    """
+    if len(search_value) < MIN_MATCH_LENGTH or not search_index_available():
+        return None
+    # The rank is only available in the query matching the index, not in a subquery
+    return requirements.extra(
+        select={'search_rank': '{}.rank'.format(SEARCH_TABLE)},
+        tables=[SEARCH_TABLE],
+        where=['{} MATCH %s'.format(SEARCH_TABLE),
+               '{}.rowid = {}.customer_id'.format(SEARCH_TABLE, requirements.model._meta.db_table)],
+        params=[match_expression(search_value)],
+    )
+
+
+def index_customers(customers):
+    """Adds or updates customers in the search index"""
+    if not search_index_available():
+        return
+    rows = [(customer.pk, *[getattr(customer, field) for field in SEARCH_FIELDS]) for customer in customers]
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM {} WHERE rowid = %s'.format(SEARCH_TABLE), [(row[0],) for row in rows])
+        cursor.executemany('INSERT INTO {} (rowid, {}) VALUES ({})'.format(
+            SEARCH_TABLE, ', '.join(SEARCH_FIELDS), ', '.join(['%s'] * (len(SEARCH_FIELDS) + 1))), rows)
+
+
+def unindex_customer(pk):
+    """Removes a customer from the search index"""
+    if not search_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(SEARCH_TABLE), [pk])
+
+
+def rebuild_index():
+    """Rebuilds the whole search index from the customer table. Returns the number of customers indexed"""
+    from customer.models import Customer
+
+    if not search_index_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {}'.format(SEARCH_TABLE))
+        cursor.execute('INSERT INTO {table} (rowid, {fields}) SELECT id, {fields} FROM {customer_table}'.format(
+            table=SEARCH_TABLE, fields=', '.join(SEARCH_FIELDS), customer_table=Customer._meta.db_table))
+        return cursor.rowcount
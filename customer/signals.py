@@ -1,9 +1,15 @@
 from allauth.account.signals import user_signed_up
-from django.contrib.auth.models import Permission, User
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group, Permission, User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
-from .models import Profile
+from .lookups import bump_lookup_version
+from .models import (Customer, ElectricPower, Lead, Payment, Profile, Requirement, RoofType, Storey,
+                     Supplier)
+from .reports import data_changed
+from .roles import bump_groups_version
+from .search import index_customers, unindex_customer
 
 permissions = [
     "customer_list",
@@ -39,3 +45,74 @@ def user_post_save(sender, instance, **kwargs):
     if not Profile.objects.filter(user_id=instance.id).exists():
         profile = Profile(user=instance)
         profile.save()
+
+
+@receiver(post_save, sender=Customer)
+def customer_post_save(sender, instance, **kwargs):
+    """Keep the customer search index in sync"""
+    index_customers([instance])
+
+
+@receiver(post_delete, sender=Customer)
+def customer_post_delete(sender, instance, **kwargs):
+    """Remove a deleted customer from the search index"""
+    unindex_customer(instance.pk)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Requirement)
+@receiver(post_delete, sender=Requirement)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_delete, sender=User)
+def report_data_changed(sender, instance, **kwargs):
+    """Make the next reports download generate a new file, once the change is committed"""
+    data_changed()
+
+
+@receiver(post_save, sender=User)
+def report_user_changed(sender, instance, update_fields=None, **kwargs):
+    """Make the next reports download generate a new file once the change is committed, unless only the last login of
+    the user changed"""
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        data_changed()
+
+
+@receiver(post_save, sender=Lead)
+@receiver(post_delete, sender=Lead)
+@receiver(post_save, sender=RoofType)
+@receiver(post_delete, sender=RoofType)
+@receiver(post_save, sender=Storey)
+@receiver(post_delete, sender=Storey)
+@receiver(post_save, sender=ElectricPower)
+@receiver(post_delete, sender=ElectricPower)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=User)
+def lookup_changed(sender, instance, **kwargs):
+    """Make the forms read the option lists again, once the change is committed"""
+    transaction.on_commit(bump_lookup_version)
+
+
+@receiver(post_save, sender=User)
+def lookup_user_changed(sender, instance, update_fields=None, **kwargs):
+    """Make the forms read the salesman and installer lists again, unless only the last login of the user changed"""
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        transaction.on_commit(bump_lookup_version)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, action, **kwargs):
+    """Make the role checks read the group memberships again, once the change is committed"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(bump_groups_version)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """Make the role checks read the group memberships again when a group is renamed or deleted"""
+    transaction.on_commit(bump_groups_version)
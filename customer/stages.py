@@ -0,0 +1,431 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Count
+from django.urls import reverse
+
+from customer.columns import compile_columns, display_rows
+from customer.models import Requirement, Supplier
+from customer.pagination import keyset_page
+from customer.search import ranked_filter, search_filter
+
+# Pipeline stages shown in requirement-list.html.
+#
+# Every list, search and export view loads its requirements through
+# stage_requirements() so the queryset always carries the relations the
+# columns read, and rendering a page costs a fixed number of queries no
+# matter how many rows it has.
+#
+# Each stage declares:
+#   statuses: Requirement.status values in the stage. None means every status.
+#   search_statuses: Optional. Statuses used by the stage search when they differ from 'statuses'. None means every status.
+#   permission: permission needed to see the stage list. None means any logged in user.
+#   url_view: name of the url of the customer form of the stage. None to use the url of the stage of each requirement status.
+#   ordering: field the list is ordered by, prefixed with '-' for descending order. Lists are paginated on it.
+#   columns: columns to display in the list.
+#   search_columns: Optional. Columns to display in search results when they differ from 'columns'.
+#   prefetch_related: reverse relations read while rendering the stage.
+#   supplier_rollup: Optional. If True, requirements are annotated with RequirementQuerySet.with_supplier_rollup().
+#   list_context: Optional. Flags enabling the special columns of the list, see customer/columns.py.
+#
+# IMPORTANT: to set columns in dict "columns",
+# 'key' is the title of the column and 'value' is the field in requirement object,
+# e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
+# so to retrieve it you will use 'customer.customer_name'
+
+# Forward relations read by the columns of every stage
+LIST_RELATED = ('customer', 'customer__sales_person', 'installer')
+
+# Rows per page of the stage lists. Following pages are loaded by the infinite scroll of requirement-list.html
+PAGE_SIZE = getattr(settings, 'REQUIREMENT_PAGE_SIZE', 100)
+
+# Default and maximum number of type-ahead search suggestions
+SUGGESTIONS_LIMIT = 10
+SUGGESTIONS_MAX_LIMIT = 50
+
+STAGES = {
+    'created': {
+        'statuses': ['CREATED'],
+        'permission': 'customer.customer_list',
+        'url_view': 'newLead-view',
+        'ordering': '-customer__created_date',
+        'columns': {
+            'Creation Date': 'customer.created_date',
+            'Sales': 'customer.sales_person',
+            'Lead Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Follow Up': 'customer.follow_up',
+            'Notes': 'customer.customer_notes',
+        },
+        'search_columns': {
+            'Creation Date': 'customer.created_date',
+            'Sales': 'customer.sales_person',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Follow Up': 'customer.follow_up',
+            'Notes': 'customer.customer_notes',
+        },
+        'prefetch_related': (),
+    },
+    'signed': {
+        'statuses': ['DEPOSIT', 'ON_FILE', 'ORDER', 'ACCOUNT', 'INSTALLATION', 'SERVICE', 'FINISHED'],
+        'search_statuses': None,
+        'permission': 'customer.sales_signed',
+        'url_view': 'signed-view',
+        'ordering': '-customer__date_signed',
+        'columns': {
+            'Date signed': 'customer.date_signed',
+            'Sales': 'customer.sales_person',
+            'Lead Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Follow Up': 'customer.follow_up',
+            'Notes': 'customer.customer_notes',
+        },
+        'search_columns': {
+            'Date signed': 'customer.date_signed',
+            'Sales': 'customer.sales_person',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Deposit': 'deposit_paid',
+            'Finance': 'finance',
+            'Customer Check': 'customer.customer_check',
+            'Install notes': 'installation_notes',
+        },
+        'prefetch_related': (),
+    },
+    'deposit': {
+        'statuses': ['DEPOSIT'],
+        'permission': 'customer.deposit_list',
+        'url_view': 'deposit-view',
+        'ordering': 'customer__date_signed',
+        'columns': {
+            'Data signed': 'customer.date_signed',
+            'Sales': 'customer.sales_person',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Deposit': 'deposit_paid',
+            'Finance': 'finance',
+            'Customer Check': 'customer.customer_check',
+            'Install notes': 'installation_notes',
+        },
+        'prefetch_related': (),
+    },
+    'on_file': {
+        'statuses': ['ON_FILE'],
+        'permission': 'customer.on_file_list',
+        'url_view': 'on-file-view',
+        'ordering': 'customer__date_signed',
+        'columns': {
+            'Data signed': 'customer.date_signed',
+            'Sales': 'customer.sales_person',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Deposit': 'deposit_paid',
+            'Finance': 'finance',
+            'Customer Check': 'customer.customer_check',
+            'Con/ap': 'application',
+            'Install notes': 'installation_notes',
+        },
+        'search_columns': {
+            'Data signed': 'customer.date_signed',
+            'Sales': 'customer.sales_person',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Deposit': 'deposit_paid',
+            'Customer Check': 'customer.customer_check',
+            'Con/ap': 'application',
+            'Install notes': 'installation_notes',
+        },
+        'prefetch_related': (),
+    },
+    'order': {
+        'statuses': ['ORDER'],
+        'permission': 'customer.order_list',
+        'url_view': 'order-view',
+        'ordering': 'installation_date',
+        'columns': {
+            'Installation Date': 'installation_date',
+            'Sales': 'customer.sales_person',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Order': 'True',
+            'Customer Check': 'customer.customer_check',
+            'Con/ap': 'application',
+            'Install notes': 'installation_notes',
+        },
+        'search_columns': {
+            'Installation Date': 'installation_date',
+            'Sales': 'customer.sales_person',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Customer Check': 'customer.customer_check',
+            'Con/ap': 'application',
+            'Install notes': 'installation_notes',
+        },
+        'prefetch_related': (),
+        'supplier_rollup': True,
+        'list_context': {'OrderFlag': True},
+    },
+    'installation': {
+        'statuses': ['ORDER', 'INSTALLATION'],
+        'permission': 'customer.installation_list',
+        'url_view': 'installation-view',
+        'ordering': 'installation_date',
+        'columns': {
+            'Installation Date': 'installation_date',
+            'Installer': 'installer',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Order': 'True',
+            'Customer Check': 'customer.customer_check',
+            'Con/ap': 'application',
+            'Install notes': 'installation_notes',
+        },
+        'search_columns': {
+            'Installation Date': 'installation_date',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Customer Check': 'customer.customer_check',
+            'Con/ap': 'application',
+            'Install notes': 'installation_notes',
+        },
+        'prefetch_related': (),
+        'supplier_rollup': True,
+        'list_context': {'OrderFlag': True},
+    },
+    'account': {
+        'statuses': ['ACCOUNT'],
+        'search_statuses': ['ORDER', 'INSTALLATION', 'ACCOUNT'],
+        'permission': 'customer.account_list',
+        'url_view': 'account-view',
+        'ordering': 'installation_date',
+        'columns': {
+            'Installation Date': 'installation_date',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'STC/ap': 'stc_application',
+            'Last amount': 'last_amount_balance_due',
+            'STC': 'stc_amount_payment',
+            'Installer': 'installer_amount',
+            'Supplier': 'Supplier',
+            'Payment notes': 'last_amount_notes',
+        },
+        'search_columns': {
+            'Installation Date': 'installation_date',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'STC/ap': 'stc_application',
+            'Last amount': 'last_amount_balance_due',
+            'STC': 'balance_due',
+            'Installer': 'installer_amount',
+            'Payment notes': 'last_amount_notes',
+        },
+        'prefetch_related': ('supplier_set',),
+        'list_context': {'supplierFlag': True, 'installer_flag': True},
+    },
+    'service': {
+        'statuses': ['SERVICE', 'SERVICE_HOME'],
+        'permission': 'customer.service_list',
+        'url_view': 'service-view',
+        'ordering': 'installation_date',
+        'columns': {
+            'Installation Date': 'installation_date',
+            'Sales': 'customer.sales_person',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'SERIVCE notes': 'service_notes',
+        },
+        'prefetch_related': (),
+    },
+    'finished': {
+        'statuses': ['FINISHED', 'DELIVERED', 'DELIVERED_HOME'],
+        'permission': 'customer.finished_list',
+        'url_view': 'finished-view',
+        'ordering': '-customer__created_date',
+        'columns': {
+            'Installation Date': 'installation_date',
+            'Sales': 'customer.sales_person',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Email': 'customer.customer_email',
+            'Total amount': 'total_price',
+            'KW': 'kw',
+        },
+        'prefetch_related': (),
+    },
+    # Global search across every status
+    'all': {
+        'statuses': None,
+        'permission': None,
+        'url_view': None,
+        'ordering': '-customer__created_date',
+        'columns': {
+            'Created Date': 'customer.created_date',
+            'Sales': 'customer.sales_person',
+            'AGM': 'customer.agm',
+            'Customer Name': 'customer.customer_name',
+            'Phone': 'customer.phone_number',
+            'Address': 'customer.customer_address',
+            'Email': 'customer.customer_email',
+            'Status': 'status',
+        },
+        'prefetch_related': (),
+    },
+}
+
+
+def stage_allowed(stage, user):
+    """Returns whether the user can see the list of a stage"""
+    permission = STAGES[stage]['permission']
+    return permission is None or user.has_perm(permission)
+
+
+def stage_columns(stage, search=False):
+    """Returns the columns definition of a stage list or of its search results"""
+    definition = STAGES[stage]
+    if search:
+        return definition.get('search_columns', definition['columns'])
+    return definition['columns']
+
+
+def stage_requirements(stage, user, search_value=None, ranked=False):
+    """Returns the requirements of a stage that the user can see, ready to be rendered in requirement-list.html.
+
+    Args:
+        stage: Key of STAGES.
+        user: User requesting the list. Users without 'customer.customer_view_others' only get the requirements
+            they sell or install.
+        search_value: Optional. If provided, only requirements whose customer matches it are returned.
+        ranked: If True, requirements matching search_value are ordered by best match first when the search index
+            is available, then in the stage ordering.
+
+    Returns:
+        Requirement queryset with the customer, sales person and installer joined in, the stage reverse
+        relations prefetched and the supplier rollup annotated when the stage shows it.
+    """
+    definition = STAGES[stage]
+    statuses = definition['statuses']
+    if search_value is not None:
+        statuses = definition.get('search_statuses', statuses)
+
+    requirements = Requirement.objects.visible_to(user)
+    if statuses is not None:
+        requirements = requirements.filter(status__in=statuses)
+    ordering = [definition['ordering']]
+    if search_value is not None:
+        matching = ranked_filter(requirements, search_value) if ranked else None
+        if matching is None:
+            requirements = requirements.filter(search_filter(search_value))
+        else:
+            requirements = matching
+            ordering.insert(0, 'search_rank')
+    if definition.get('supplier_rollup'):
+        requirements = requirements.with_supplier_rollup()
+    requirements = requirements.order_by(*ordering)
+
+    return requirements.select_related(*LIST_RELATED).prefetch_related(*definition['prefetch_related'])
+
+
+def stage_page(stage, user, search_value=None, cursor=None):
+    """Returns a page of the requirements of a stage that the user can see.
+
+    Args:
+        stage: Key of STAGES.
+        user: User requesting the list.
+        search_value: Optional. If provided, only requirements whose customer matches it are returned.
+        cursor: Optional. Cursor returned with the previous page. If None the first page is returned.
+
+    Returns:
+        Tuple (requirements, next_cursor). next_cursor is None on the last page.
+
+    Raises:
+        ValueError: cursor is not valid.
+    """
+    requirements = stage_requirements(stage, user, search_value=search_value)
+    return keyset_page(requirements, STAGES[stage]['ordering'], cursor=cursor, size=PAGE_SIZE)
+
+
+@lru_cache(maxsize=None)
+def stage_accessors(stage, search=False):
+    """Returns the column accessors of a stage list or of its search results, compiled once, see compile_columns"""
+    flags = {} if search else STAGES[stage].get('list_context', {})
+    return compile_columns(stage_columns(stage, search=search), flags)
+
+
+def stage_rows_context(stage, requirements, search=False):
+    """Returns the template context requirement-rows.html needs to render the rows of a stage list.
+
+    Args:
+        stage: Key of STAGES.
+        requirements: Requirements to render.
+        search: True when rendering search results, which have no special columns.
+
+    Returns:
+        Dict with:
+            rows: list of (requirement, cells), cells being the displayed values of the columns, see customer/columns.py
+            the stage 'list_context' flags, unless search is True
+            supplierMax: number of supplier columns when supplierFlag is set
+    """
+    context = {} if search else dict(STAGES[stage].get('list_context', {}))
+    if context.get('supplierFlag'):
+        # Every page has as many supplier columns as the requirement with most suppliers
+        supplierMax = Supplier.objects.values('requirement').order_by().annotate(Count('requirement'))
+        supplierMax = [x['requirement__count'] for x in supplierMax]
+        supplierMax.append(0)
+        context['supplierMax'] = max(supplierMax)
+    context['rows'] = display_rows(requirements, stage_accessors(stage, search), context)
+    return context
+
+
+def stage_suggestions(stage, user, search_value, limit=SUGGESTIONS_LIMIT):
+    """Returns the requirements of a stage whose customer best match search_value, for type-ahead search.
+
+    Args:
+        stage: Key of STAGES.
+        user: User searching.
+        search_value: Text to find in the customer name, address, email, phone or AGM.
+        limit: Maximum number of requirements to return.
+
+    Returns:
+        List of requirements, best matches first when the search index is available, otherwise in the stage ordering.
+    """
+    # The index match, the stage and the user scope are filtered in the same query, before the limit
+    return list(stage_requirements(stage, user, search_value=search_value, ranked=True).prefetch_related(None)[:limit])
+
+
+def requirement_url(stage, requirement):
+    """Returns the url of the customer form of a requirement listed in a stage"""
+    url_view = STAGES[stage]['url_view']
+    if url_view is None:
+        # Use the most specific stage showing the requirement status
+        stages = [definition for definition in STAGES.values()
+                  if definition['url_view'] and requirement.status in (definition['statuses'] or ())]
+        if not stages:
+            return None
+        url_view = min(stages, key=lambda definition: len(definition['statuses']))['url_view']
+    return reverse(url_view, args=[requirement.customer_id])
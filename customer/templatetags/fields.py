@@ -2,6 +2,8 @@ import datetime
 
 from django import template
 
+from customer.roles import user_in_group
+
 # Custom tags to apply logic in templates.
 
 register = template.Library()
@@ -53,4 +55,5 @@ def sup(dic, key):
 
 @register.filter(name='has_group')
 def has_group(user, group_name):
-    return user.groups.filter(name=group_name).exists()
\ No newline at end of file
+    """Returns whether user belongs to the group named group_name, see customer/roles.py"""
+    return user_in_group(user, group_name)
\ No newline at end of file
@@ -1,3 +1,520 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from customer.customer_form import MISSING_DEPOSIT, save_customer_form
+from customer.duplicates import normalize_address, normalize_agm, normalize_phone, normalize_text
+from customer.imports import ImportFileError, import_customers, write_error_report
+from customer.models import CreditCard, Customer, Lead, Payment, ReportJob, Requirement, ServiceNote, Supplier
+from customer.reports import data_version, run_report_job
+from customer.search import search_index_available
+from customer.stages import stage_page, stage_requirements
+
+
+def create_requirement(status='CREATED', sales_person=None, installer=None, suppliers=(), **fields):
+    """Creates a customer with its requirement and credit card, as the new lead form does.
+
+    Args:
+        status: Status of the requirement.
+        sales_person, installer: Optional. Users set on the customer and the requirement.
+        suppliers: list of dicts of Supplier fields of the requirement.
+        fields: Requirement fields.
+
+    Returns:
+        The requirement.
+    """
+    number = Customer.objects.count() + 1
+    customer = Customer.objects.create(customer_name='Customer {}'.format(number), agm='AGM{}'.format(number),
+                                       phone_number='04120000{:02}'.format(number), sales_person=sales_person,
+                                       date_signed=date(2020, 1, number % 28 + 1))
+    requirement = Requirement.objects.create(customer=customer, status=status, installer=installer,
+                                             installation_date=date(2020, 2, number % 28 + 1), **fields)
+    CreditCard.objects.create(customer=customer)
+    for supplier in suppliers:
+        Supplier.objects.create(requirement=requirement, **supplier)
+    return requirement
+
+
+class StageListQueriesTest(TestCase):
+    """The stage lists cost a fixed number of queries, whatever the number of rows, see customer/stages.py"""
+
+    # Url of each stage list and a status listed in it
+    LISTS = (
+        ('newLead-list', 'CREATED'),
+        ('signed-list', 'DEPOSIT'),
+        ('deposit-list', 'DEPOSIT'),
+        ('on-file-list', 'ON_FILE'),
+        ('order-list', 'ORDER'),
+        ('installation-list', 'INSTALLATION'),
+        ('account-list', 'ACCOUNT'),
+        ('service-list', 'SERVICE'),
+        ('finished-list', 'FINISHED'),
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.sales = User.objects.create_user('sales')
+        self.installer = User.objects.create_user('installer')
+        self.client.force_login(self.user)
+
+    def add_rows(self, status, count):
+        for i in range(count):
+            requirement = create_requirement(status, sales_person=self.sales, installer=self.installer, suppliers=[
+                {'supplier_name': 'Paid', 'supplier_amount': 100, 'supplier_date_paid': date(2020, 3, 1)},
+                {'supplier_name': 'Unpaid', 'supplier_amount': 50},
+            ])
+            ServiceNote.objects.create(requirement=requirement, content='Note {}'.format(i))
+
+    def test_queries_do_not_grow_with_rows(self):
+        for url_name, status in self.LISTS:
+            with self.subTest(url_name):
+                url = reverse(url_name)
+                self.add_rows(status, 2)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+                self.add_rows(status, 5)
+                with self.assertNumQueries(len(queries)):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Customer {}'.format(Customer.objects.count()))
+
+
+class StagePaginationTest(TestCase):
+    """Keyset pages of the stage lists, see customer/pagination.py"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        # Signing dates with nulls and ties, on both sides of the page boundaries
+        signed = [None, date(2020, 1, 5), None, date(2020, 1, 5), date(2020, 1, 1), None, date(2020, 1, 5),
+                  date(2020, 1, 9), None, date(2020, 1, 1), date(2020, 1, 5)]
+        self.pks = set()
+        for date_signed in signed:
+            requirement = create_requirement('DEPOSIT')
+            Customer.objects.filter(pk=requirement.customer_id).update(date_signed=date_signed)
+            self.pks.add(requirement.pk)
+
+    def read_pages(self, stage):
+        pks, cursor = [], None
+        with mock.patch('customer.stages.PAGE_SIZE', 3):
+            while True:
+                requirements, cursor = stage_page(stage, self.user, cursor=cursor)
+                self.assertLessEqual(len(requirements), 3)
+                pks += [requirement.pk for requirement in requirements]
+                if cursor is None:
+                    return pks
+
+    def test_every_row_once(self):
+        # 'deposit' is ordered by the signing date, 'signed' by the signing date descending
+        for stage, nulls_first in (('deposit', True), ('signed', False)):
+            with self.subTest(stage):
+                pks = self.read_pages(stage)
+                self.assertEqual(len(pks), len(self.pks))
+                self.assertEqual(set(pks), self.pks)
+                dates = dict(Requirement.objects.filter(pk__in=pks).values_list('pk', 'customer__date_signed'))
+                nulls = [dates[pk] is None for pk in pks]
+                self.assertEqual(nulls, sorted(nulls, reverse=nulls_first))
+
+
+class SupplierRollupTest(TestCase):
+    """Supplier rollup of the order lists and totals of the account summary, see RequirementQuerySet"""
+
+    def setUp(self):
+        self.no_supplier = create_requirement('ACCOUNT', stc_amount_payment=1000, last_amount=3000,
+                                              last_amount_payment=1000, installer_amount=500)
+        self.paid = create_requirement('ACCOUNT', installer_amount=700, installer_date_paid=date(2020, 3, 1),
+                                       suppliers=[
+            {'supplier_name': 'Paid', 'supplier_amount': 100, 'supplier_date_paid': date(2020, 3, 1)},
+            {'supplier_name': 'Paid without amount', 'supplier_amount': None, 'supplier_date_paid': date(2020, 3, 1)},
+        ])
+        self.unpaid = create_requirement('ACCOUNT', stc_amount_payment=250.5, last_amount=2000, suppliers=[
+            {'supplier_name': 'Paid', 'supplier_amount': 100, 'supplier_date_paid': date(2020, 3, 1)},
+            {'supplier_name': 'Unpaid', 'supplier_amount': 50},
+            {'supplier_name': 'Unpaid without amount', 'supplier_amount': None},
+        ])
+        self.unpriced = create_requirement('ACCOUNT', installer_amount=None, suppliers=[
+            {'supplier_name': 'Unpaid without amount', 'supplier_amount': None},
+        ])
+        # Another stage, not in the summary
+        create_requirement('ORDER', stc_amount_payment=99, installer_amount=99, suppliers=[
+            {'supplier_name': 'Unpaid', 'supplier_amount': 99},
+        ])
+
+    def test_rollup(self):
+        rollups = {requirement.pk: (requirement.supplier_count, requirement.supplier_priced_count,
+                                    requirement.supplier_unpaid_amount)
+                   for requirement in Requirement.objects.with_supplier_rollup()}
+        self.assertEqual(rollups[self.no_supplier.pk], (0, 0, None))
+        self.assertEqual(rollups[self.paid.pk], (2, 2, None))
+        self.assertEqual(rollups[self.unpaid.pk], (3, 2, 50))
+        self.assertEqual(rollups[self.unpriced.pk], (1, 0, None))
+
+    def test_order_state(self):
+        expected = {
+            self.no_supplier.pk: '_',
+            self.paid.pk: 'Paid',
+            self.unpaid.pk: '$ 50.0',
+            self.unpriced.pk: '_',
+        }
+        annotated = Requirement.objects.with_supplier_rollup().filter(pk__in=expected)
+        self.assertEqual({requirement.pk: requirement.order_state for requirement in annotated}, expected)
+        # Requirements loaded without the rollup query it
+        loaded = Requirement.objects.filter(pk__in=expected)
+        self.assertEqual({requirement.pk: requirement.order_state for requirement in loaded}, expected)
+
+    def test_account_summary(self):
+        self.assertEqual(Requirement.objects.filter(status='ACCOUNT').account_summary(), {
+            'total_stc': 1250.5,
+            # 3000 - 1000 paid, and 2000 with no payment
+            'total_last_amount': 4000,
+            'total_installers': 500,
+            'total_suppliers': 50,
+        })
+
+    def test_account_summary_empty(self):
+        self.assertEqual(Requirement.objects.filter(status='FINISHED').account_summary(), {
+            'total_stc': 0,
+            'total_last_amount': 0,
+            'total_installers': 0,
+            'total_suppliers': 0,
+        })
+
+
+class ReportDataVersionTest(TransactionTestCase):
+    """The data version of the reports changes once per transaction changing the data, see customer/reports.py"""
+
+    def version_updates(self, queries):
+        return [query for query in queries if query['sql'].startswith('UPDATE "customer_appdata"')]
+
+    def test_changed_once_per_transaction(self):
+        requirement = create_requirement()
+        version = data_version()
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                requirement.customer.save()
+                requirement.save()
+                Supplier.objects.create(requirement=requirement, supplier_name='Supplier')
+                self.assertEqual(data_version(), version)
+        self.assertEqual(len(self.version_updates(queries)), 1)
+        self.assertNotEqual(data_version(), version)
+
+    def test_unchanged_if_rolled_back(self):
+        requirement = create_requirement()
+        version = data_version()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                requirement.save()
+                raise RuntimeError
+        self.assertEqual(data_version(), version)
+        # The next transaction still changes it
+        requirement.save()
+        self.assertNotEqual(data_version(), version)
+
+    def test_failed_job_recorded(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        job = ReportJob.objects.create(user=user, scope='all', data_version=data_version())
+        with mock.patch('customer.reports.report_total', side_effect=RuntimeError('disk full')), \
+                self.assertLogs('customer.reports', 'ERROR'):
+            run_report_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('FAILED', 'RuntimeError: disk full'))
+
+
+class CustomerFormTest(TestCase):
+    """Save of the customer form, see customer/customer_form.py"""
+
+    def setUp(self):
+        self.requirement = create_requirement('DEPOSIT', kw='6.6', finance='No', system_price=1000)
+        self.customer = self.requirement.customer
+        self.payment = Payment.objects.create(name='Cash')
+
+    def save(self, **data):
+        return save_customer_form(self.customer.pk, data)
+
+    def test_changed_fields(self):
+        result = self.save(kw='', panel='Jinko', customer_notes='Call back', system_price='1000.00',
+                           expires='03/2027', customer_name='Customer 1')
+        self.assertTrue(result.saved)
+        # customer_check is a checkbox, not posted when unchecked: unchanged as it is not checked
+        self.assertEqual(result.changed, ['customer_notes', 'kw', 'panel', 'expires'])
+        self.requirement.refresh_from_db()
+        self.customer.refresh_from_db()
+        # An empty field is cleared
+        self.assertEqual((self.requirement.kw, self.requirement.panel, self.requirement.system_price),
+                         (None, 'Jinko', 1000))
+        self.assertEqual(self.customer.customer_notes, 'Call back')
+        # Not posted, kept
+        self.assertEqual(self.customer.agm, 'AGM1')
+        self.assertEqual(CreditCard.objects.get(customer=self.customer).expires, date(2027, 3, 1))
+
+    def test_unchanged_not_written(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.save(kw='6.6', agm='AGM1', system_price='1000', btn_save='1')
+        self.assertEqual(result.changed, [])
+        rows = ('UPDATE "customer_requirement"', 'UPDATE "customer_creditcard"')
+        self.assertEqual([query['sql'] for query in queries if query['sql'].startswith(rows)], [])
+
+    def test_validation_errors(self):
+        result = self.save(kw='10', date_signed='31/31/2020', customer_email='not an email', expires='2027',
+                           customer_name='')
+        self.assertFalse(result.saved)
+        self.assertEqual(set(result.errors), {'date_signed', 'customer_email', 'expires', 'customer_name'})
+        self.assertEqual(result.changed, [])
+        # Nothing saved, not even the valid values
+        self.requirement.refresh_from_db()
+        self.assertEqual(self.requirement.kw, '6.6')
+
+    def test_status_moved_by_button(self):
+        result = self.save(btn_deposit_paid='1')
+        self.assertEqual((result.status, result.status_error), (None, MISSING_DEPOSIT))
+        self.assertNotIn('status', result.changed)
+
+        result = self.save(btn_deposit_paid='1', deposit_payment=str(self.payment.pk), deposit_date_paid='01/02/2020')
+        self.assertEqual((result.status, result.status_error), ('ON_FILE', None))
+        self.assertIn('status', result.changed)
+        self.requirement.refresh_from_db()
+        self.assertEqual(self.requirement.status, 'ON_FILE')
+
+    def test_status_checked_against_new_values(self):
+        result = self.save(btn_payment_order='1', deposit_payment=str(self.payment.pk), deposit_date_paid='01/02/2020')
+        self.assertEqual(result.status, None)
+        self.assertEqual(result.status_error, 'Customer has to be checked before promoting to order')
+        # The fields are saved even if the requirement didn't move
+        self.assertIn('deposit_payment', result.changed)
+
+        result = self.save(btn_payment_order='1', customer_check='on')
+        self.assertEqual((result.status, result.status_error), ('ORDER', None))
+
+        result = self.save(btn_confirm_all='1', customer_check='on')
+        self.assertEqual(result.status, 'INSTALLATION')
+        self.assertEqual(result.changed, ['status', 'order_paid'])
+
+    def test_read_only_status(self):
+        result = self.save(btn_already_signed='1')
+        self.assertEqual((result.status, result.read_only_status), ('DEPOSIT', 'SIGNED'))
+        # Already in DEPOSIT
+        self.assertEqual(result.changed, [])
+
+    def test_database_locked(self):
+        with mock.patch('customer.customer_form._save', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('customer.customer_form', 'WARNING'):
+            result = self.save(kw='10')
+        self.assertFalse(result.saved)
+        self.assertEqual(result.errors, {'': 'The customer is being saved by someone else, save again'})
+        self.assertEqual(result.requirement.pk, self.requirement.pk)
+
+        with mock.patch('customer.customer_form._save', side_effect=OperationalError('no such table')):
+            with self.assertRaises(OperationalError):
+                self.save(kw='10')
+
+
+class CustomerFormOptionTest(TransactionTestCase):
+    """A removed option fails the save when its transaction commits, see customer/customer_form.py"""
+
+    def test_removed_option(self):
+        requirement = create_requirement('DEPOSIT', kw='6.6')
+        result = save_customer_form(requirement.customer_id, {'kw': '10', 'deposit_payment': '999'})
+        self.assertFalse(result.saved)
+        self.assertEqual(result.errors, {'': 'An option selected was removed, reload the customer'})
+        self.assertEqual(result.requirement.kw, '6.6')
+        requirement.refresh_from_db()
+        self.assertEqual((requirement.kw, requirement.deposit_payment_id), ('6.6', None))
+
+
+class CustomerSearchTest(TestCase):
+    """Customer search of the stage lists, with the search index of migration 0058 or without it, see
+    customer/search.py"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.jonathan = create_requirement()
+        Customer.objects.filter(pk=self.jonathan.customer_id).update(customer_name='Jonathan Smithers')
+        # update() skips the signals, saved to index the new name
+        self.jonathan.customer.refresh_from_db()
+        self.jonathan.customer.save()
+        self.other = create_requirement()
+
+    def search(self, search_value, ranked=False):
+        with CaptureQueriesContext(connection) as queries:
+            pks = [requirement.pk for requirement in stage_requirements(
+                'created', self.user, search_value=search_value, ranked=ranked)]
+        return pks, ' '.join(query['sql'] for query in queries)
+
+    def test_index_substring_any_case(self):
+        self.assertTrue(search_index_available())
+        for ranked in (False, True):
+            with self.subTest(ranked=ranked):
+                pks, sql = self.search('THAN smi', ranked=ranked)
+                self.assertEqual(pks, [self.jonathan.pk])
+                self.assertIn('customer_search MATCH', sql)
+                # In the middle of the AGM
+                pks, sql = self.search('gm2', ranked=ranked)
+                self.assertEqual(pks, [self.other.pk])
+
+    def test_fallback_without_index(self):
+        with mock.patch('customer.search.search_index_available', return_value=False):
+            pks, sql = self.search('THAN smi')
+            self.assertEqual(pks, [self.jonathan.pk])
+            self.assertNotIn('customer_search', sql)
+            pks, sql = self.search('THAN smi', ranked=True)
+            self.assertEqual(pks, [self.jonathan.pk])
+        # Too short for the trigrams of the index
+        pks, sql = self.search('mi')
+        self.assertEqual(pks, [self.jonathan.pk])
+        self.assertNotIn('customer_search', sql)
+
+    def test_index_follows_edits(self):
+        customer = self.jonathan.customer
+        customer.customer_name = 'Jane Doe'
+        customer.save()
+        self.assertEqual(self.search('smithers')[0], [])
+        self.assertEqual(self.search('jane d')[0], [self.jonathan.pk])
+
+        pk = customer.pk
+        customer.delete()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM customer_search WHERE rowid = %s', [pk])
+            self.assertEqual(cursor.fetchone(), (0,))
+
+
+class SearchSuggestionsTest(TransactionTestCase):
+    """ETag of the search suggestions, changed by the data version once a transaction commits, see customer/views.py"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.requirement = create_requirement()
+        self.url = reverse('search-suggest') + '?q=customer&stage=created'
+
+    def test_not_modified_until_data_changes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.json()['results']], [self.requirement.customer_id])
+        etag = response['ETag']
+
+        with mock.patch('customer.views.stage_suggestions') as stage_suggestions:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        stage_suggestions.assert_not_called()
+
+        customer = self.requirement.customer
+        customer.customer_name = 'Customer renamed'
+        customer.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['customer_name'], 'Customer renamed')
+
+
+class ImportCustomersTest(TestCase):
+    """Import of a spreadsheet with valid, invalid and duplicate rows, see customer/imports.py"""
+
+    ROWS = [
+        ['Customer Name', 'AGM', 'Phone', 'Email', 'Date signed', 'Status', 'System price', 'Lead From'],
+        ['Jane Doe', 'AGM100', '0412345678', 'jane@example.com', '31/12/2020', 'Deposit', '$12,500', 'Web form'],
+        ['Bad Row', 'AGM101', '0412000101', 'not an email', '31/02/2020', '', '', ''],
+        ['Unknown Options', 'AGM102', '0412000102', '', '', 'Lost', '', 'Radio'],
+        # Jane Doe typed differently, a duplicate of a previous row
+        ['Jane Doe', 'agm 100', '61412345678', '', '', '', '', ''],
+        # Duplicate of an existing customer
+        ['Customer 1', 'agm1', '', '', '', '', '', ''],
+        ['', '', '', '', '', '', '', ''],
+        ['John Smith', '', '412000103', '', '2020-06-01', '', '', ''],
+    ]
+
+    def setUp(self):
+        Lead.objects.create(name='Web form')
+        self.existing = create_requirement().customer
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'customers.csv')
+        with open(self.path, 'w', newline='') as file:
+            csv.writer(file).writerows(self.ROWS)
+
+    def test_rows_imported(self):
+        report = import_customers(self.path, chunk_size=3)
+
+        self.assertEqual((report.rows, report.created, report.duplicates, report.rejected), (6, 2, 2, 4))
+        self.assertEqual(sorted((row, heading) for row, heading, message in report.errors), [
+            (3, 'Date signed'), (3, 'Email'), (4, 'Lead From'), (4, 'Status'), (5, 'Customer Name'),
+            (6, 'Customer Name'),
+        ])
+        jane = Customer.objects.get(customer_name='Jane Doe')
+        self.assertEqual((jane.agm, jane.phone_key, jane.date_signed, jane.leads_from.name),
+                         ('AGM100', '0412345678', date(2020, 12, 31), 'Web form'))
+        requirement = Requirement.objects.get(customer=jane)
+        self.assertEqual((requirement.status, requirement.system_price), ('DEPOSIT', 12500))
+        john = Customer.objects.get(customer_name='John Smith')
+        self.assertEqual((john.phone_key, john.date_signed), ('0412000103', date(2020, 6, 1)))
+        self.assertEqual(Requirement.objects.get(customer=john).status, 'CREATED')
+        self.assertEqual(CreditCard.objects.filter(customer__in=[jane, john]).count(), 2)
+        self.assertEqual(Customer.objects.count(), 3)
+
+        output = io.StringIO()
+        write_error_report(report, output)
+        lines = list(csv.reader(io.StringIO(output.getvalue())))
+        self.assertEqual(lines[0], ['Row', 'Column', 'Error'])
+        self.assertEqual([int(line[0]) for line in lines[1:]], [3, 3, 4, 4, 5, 6])
+        self.assertIn('Jane Doe', lines[5][2])
+        self.assertIn('Customer 1', lines[6][2])
+
+    def test_dry_run(self):
+        report = import_customers(self.path, dry_run=True)
+
+        self.assertEqual((report.rows, report.created, report.duplicates, report.rejected), (6, 0, 2, 4))
+        self.assertEqual(list(Customer.objects.all()), [self.existing])
+
+    def test_missing_customer_name_column(self):
+        with open(self.path, 'w', newline='') as file:
+            csv.writer(file).writerows([['Name', 'AGM'], ['Jane Doe', 'AGM100']])
+        with self.assertRaises(ImportFileError):
+            import_customers(self.path)
+
+
+class DuplicatesTest(TestCase):
+    """Keys and scores of the likely duplicate customers, see customer/duplicates.py"""
+
+    def test_normalized_keys(self):
+        for phone_number in ('0412345678', '0412 345 678', '+61 412 345 678', '0061412345678', '412345678'):
+            self.assertEqual(normalize_phone(phone_number), '0412345678', phone_number)
+        self.assertIsNone(normalize_phone('n/a'))
+        self.assertEqual(normalize_agm(' agm 12 '), 'AGM12')
+        self.assertIsNone(normalize_agm(''))
+        self.assertEqual(normalize_address('12, Smith St.  SYDNEY'), '12 smith st sydney')
+        self.assertIsNone(normalize_address('Sydney NSW'))
+        self.assertEqual(normalize_text(' Jane@Example.com '), 'jane@example.com')
+
+    def test_likely_duplicates(self):
+        jane = Customer.objects.create(customer_name='Jane Doe', phone_number='0412345678',
+                                       customer_email='jane@example.com', customer_address='12 Smith St Sydney')
+        Customer.objects.create(customer_name='John Smith', phone_number='0412000000', agm='AGM2')
+
+        matches = Customer.objects.likely_duplicates(Customer(
+            customer_name='jane doe', phone_number='61412345678', customer_email='JANE@example.com'))
+        self.assertEqual([(points, customer.pk, shared) for points, customer, shared in matches],
+                         [(90, jane.pk, ['phone_key', 'customer_email', 'customer_name'])])
+
+        self.assertEqual(Customer.objects.likely_duplicates(Customer(
+            customer_name='Jane Doe', phone_number='0412999999', customer_address='Sydney')), [])
+
+    def test_score_threshold(self):
+        jane = Customer.objects.create(customer_name='Jane Doe', customer_address='12 Smith St Sydney')
+        index = Customer.objects.duplicate_candidates([jane])
+
+        # The same address and name, and only the same address, e.g. another flat of a building
+        same = Customer(customer_name='Jane Doe', customer_address='12 smith st, Sydney')
+        same.update_duplicate_keys()
+        self.assertEqual(index.duplicate(same)[:2], (60, jane))
+        neighbour = Customer(customer_name='Joe Bloggs', customer_address='12 Smith St Sydney')
+        neighbour.update_duplicate_keys()
+        self.assertEqual(index.matches(neighbour)[0][0], 40)
+        self.assertIsNone(index.duplicate(neighbour))
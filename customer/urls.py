@@ -34,6 +34,10 @@ urlpatterns = [
     path('download/', views.all_download, name='all-download'),
     path('reports/', views.all_download, name='all-download'),
     path('xls/', views.export_xls, name='export_xls'),
+    path('csv/', views.export_csv, name='export_csv'),
+    path('reports/jobs/', views.report_job_start, name='report-job-start'),
+    path('reports/jobs/<int:pk>/', views.report_job_status, name='report-job-status'),
+    path('reports/jobs/<int:pk>/download/', views.report_job_download, name='report-job-download'),
     path('account/search', views.account_search, name='account-search'),
     path('account/<int:pk>', views.account_view, name='account-view'),
     path('account/add_customer',views.add_customer_via_account,name='account-add-customer'),
@@ -44,4 +48,6 @@ urlpatterns = [
     path('finished/search', views.finished_search, name='finished-search'),
     path('finished/<int:pk>', views.finished_view, name='finished-view'),
     path('global/search',views.global_search,name='global-search'),
+    path('rows/<str:stage>/', views.stage_rows, name='stage-rows'),
+    path('search/suggest/', views.search_suggestions, name='search-suggest'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,29 +1,36 @@
 from django.conf import settings
 import os
+import csv
 import json
+import hashlib
 from datetime import datetime
 
 from django.contrib import messages
-from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.files.storage import FileSystemStorage
-from django.db.models import Count
-from django.db.models import Q, Sum
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, HttpResponseRedirect
 from django.shortcuts import redirect, render
+from django.urls import reverse
 from django.template.loader import render_to_string
-from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpResponse
-import xlwt
-
-from customer.models import (AppData, CreditCard, Customer, ElectricPower,
-                             File, Lead, Payment, Requirement, RoofType,
-                             ServiceNote, Storey, Supplier)
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+
+from customer.models import (AppData, CreditCard, Customer, File, Requirement,
+                             REPORT_FORMATS, ReportJob, ServiceNote, Supplier)
+from customer.customer_form import save_customer_form
+from customer.dossier import customer_dossier
+from customer.duplicates import DUPLICATE_SCORE, describe
+from customer.export import report_rows, write_xls
+from customer.lookups import lookup
+from customer.reports import data_version, report_path, report_scope, start_report_job
+from customer.stages import (STAGES, SUGGESTIONS_LIMIT, SUGGESTIONS_MAX_LIMIT, requirement_url, stage_allowed,
+                             stage_columns, stage_page, stage_requirements, stage_rows_context, stage_suggestions)
 
 
 @login_required
 def update_app_data(request):
-    print(request.POST)
     if AppData.objects.filter(name=request.POST.get('app_data_name')).exists():
         app_data = AppData.objects.get(name=request.POST.get('app_data_name'))
         app_data.value = request.POST.get('app_data_value')
@@ -279,271 +286,45 @@ def settings_customers(request):
 def requirement(request):
     """update all information submitted in customer form. Supplier and File upload are not contained in this endpoint"""
     if request.method == 'POST':
-        # Fetch customer data
-        customer = Customer.objects.get(id=request.POST.get('pk'))
-
         if 'btn_delete' in request.POST:
             # Delete the current customer and all his data
+            customer = Customer.objects.get(id=request.POST.get('pk'))
             customer.delete()
             messages.warning(request, 'Customer {} was deleted.'.format(
                 customer.customer_name))
 
         else:
-            # Fetch requirement and credit card data
-            requirement = Requirement.objects.filter(
-                customer_id=customer.id).first()
-            credit_card = CreditCard.objects.filter(
-                customer_id=customer.id).first()
-
-            # Update any customer field from form
-            customer.leads_from_id = request.POST.get('leads_from') if request.POST.get(
-                'leads_from') else None if 'leads_from' in request.POST else customer.leads_from_id
-            customer.sales_person_id = request.POST.get('sales_person') if request.POST.get(
-                'sales_person') else None if 'sales_person' in request.POST else customer.sales_person_id
-            customer.agm = request.POST.get('agm') if request.POST.get(
-                'agm') else None if 'agm' in request.POST else customer.agm
-            customer.date_signed = datetime.strptime(request.POST.get('date_signed'), '%d/%m/%Y').strftime(
-                '%Y-%m-%d') if request.POST.get(
-                'date_signed') else None if 'date_signed' in request.POST else customer.date_signed
-            customer.customer_name = request.POST.get('customer_name') if request.POST.get(
-                'customer_name') else None if 'customer_name' in request.POST else customer.customer_name
-            customer.customer_address = request.POST.get('customer_address') if request.POST.get(
-                'customer_address') else None if 'customer_address' in request.POST else customer.customer_address
-            customer.customer_email = request.POST.get('customer_email') if request.POST.get(
-                'customer_email') else None if 'customer_email' in request.POST else customer.customer_email
-            customer.phone_number = request.POST.get('phone_number') if request.POST.get(
-                'phone_number') else None if 'phone_number' in request.POST else customer.phone_number
-            customer.follow_up = request.POST.get('follow_up') if request.POST.get(
-                'follow_up') else None if 'follow_up' in request.POST else customer.follow_up
-            customer.customer_notes = request.POST.get('customer_notes') if request.POST.get(
-                'customer_notes') else None if 'customer_notes' in request.POST else customer.customer_notes
-            customer.customer_check = True if request.POST.get(
-                'customer_check') else False
-
-            customer.save()
-
-            # Update requirement field from form
-            requirement.kw = request.POST.get('kw') if request.POST.get(
-                'kw') else None if 'kw' in request.POST else requirement.kw
-            requirement.panel = request.POST.get('panel') if request.POST.get(
-                'panel') else None if 'panel' in request.POST else requirement.panel
-            requirement.panel_pcs = request.POST.get('panel_pcs') if request.POST.get(
-                'panel_pcs') else None if 'panel_pcs' in request.POST else requirement.panel_pcs
-            requirement.inverter = request.POST.get('inverter') if request.POST.get(
-                'inverter') else None if 'inverter' in request.POST else requirement.inverter
-            requirement.inverter_pcs = request.POST.get('inverter_pcs') if request.POST.get(
-                'inverter_pcs') else None if 'inverter_pcs' in request.POST else requirement.inverter_pcs
-            requirement.roof_type_id = request.POST.get('roof_type') if request.POST.get(
-                'roof_type') else None if 'roof_type' in request.POST else requirement.roof_type_id
-            requirement.storey_id = request.POST.get('storey') if request.POST.get(
-                'storey') else None if 'storey' in request.POST else requirement.storey_id
-            requirement.electric_power_id = request.POST.get('electric_power') if request.POST.get(
-                'electric_power') else None if 'electric_power' in request.POST else requirement.electric_power_id
-            requirement.installation_notes = request.POST.get('installation_notes') if request.POST.get(
-                'installation_notes') else None if 'installation_notes' in request.POST else requirement.installation_notes
-            requirement.extra_amount = request.POST.get('extra_amount') if request.POST.get(
-                'extra_amount') else None if 'extra_amount' in request.POST else requirement.extra_amount
-            requirement.total_price = request.POST.get('total_price') if request.POST.get(
-                'total_price') else None if 'total_price' in request.POST else requirement.total_price
-            requirement.deposit_amount = request.POST.get('deposit_amount') if request.POST.get(
-                'deposit_amount') else None if 'deposit_amount' in request.POST else requirement.deposit_amount
-            requirement.last_amount = request.POST.get('last_amount') if request.POST.get(
-                'last_amount') else None if 'last_amount' in request.POST else requirement.last_amount
-
-            requirement.system_price = request.POST.get('system_price') if request.POST.get(
-                'system_price') else None if 'system_price' in request.POST else requirement.system_price
-
-            requirement.MNI = request.POST.get('MNI') if request.POST.get(
-                'MNI') else None if 'MNI' in request.POST else requirement.MNI
-
-            requirement.finance = request.POST.get('finance') if request.POST.get(
-                'finance') else None if 'finance' in request.POST else requirement.finance
-
-            requirement.application = True if request.POST.get(
-                'Application') else False
-
-            requirement.installation_date = datetime.strptime(request.POST.get('installation_date'),
-                                                              '%d/%m/%Y').strftime(
-                '%Y-%m-%d') if request.POST.get(
-                'installation_date') else None if 'installation_date' in request.POST else requirement.installation_date
-            requirement.installer_id = request.POST.get('installer') if request.POST.get(
-                'installer') else None if 'installer' in request.POST else requirement.installer_id
-
-            requirement.installer_date_paid = datetime.strptime(request.POST.get('installer_date_paid'),
-                                                                '%d/%m/%Y').strftime('%Y-%m-%d') if request.POST.get(
-                'installer_date_paid') else None if 'installer_date_paid' in request.POST else requirement.installer_date_paid
-
-            requirement.installer_amount = request.POST.get('installer_amount') if request.POST.get(
-                'installer_amount') else None if 'installer_amount' in request.POST else requirement.installer_amount
-
-            requirement.Installer_notes = request.POST.get('installer_notes') if request.POST.get(
-                'installer_notes') else None if 'installer_notes' in request.POST else requirement.Installer_notes
-
-            requirement.deposit_date_paid = datetime.strptime(request.POST.get('deposit_date_paid'),
-                                                              '%d/%m/%Y').strftime('%Y-%m-%d') if request.POST.get(
-                'deposit_date_paid') else None if 'deposit_date_paid' in request.POST else requirement.deposit_date_paid
-
-            requirement.deposit_payment_id = request.POST.get('deposit_payment') if request.POST.get(
-                'deposit_payment') else None if 'deposit_payment' in request.POST else requirement.deposit_payment_id
-
-            requirement.unit = float(request.POST.get('Unit')) if request.POST.get(
-                'Unit') else None if 'Unit' in request.POST else requirement.unit
-
-            requirement.unit_price = request.POST.get('unit_price') if request.POST.get(
-                'unit_price') else None if 'unit_price' in request.POST else requirement.unit_price
-
-            requirement.stc_application = True if request.POST.get(
-                'Stc_Application') else False
-
-            requirement.balance_due = datetime.strptime(request.POST.get('Balance_due'), '%d/%m/%Y').strftime(
-                '%Y-%m-%d') if request.POST.get(
-                'Balance_due') else None if 'Balance_due' in request.POST else requirement.balance_due
-
-
-            requirement.stc_notes = request.POST.get('stc_notes') if request.POST.get(
-                'stc_notes') else None if 'stc_notes' in request.POST else requirement.stc_notes
-
-            requirement.stc_amount = request.POST.get('Stc') if request.POST.get(
-                'Stc') else None if 'Stc' in request.POST else requirement.stc_amount
-            requirement.stc_date_paid = datetime.strptime(request.POST.get('stc_date_paid'), '%d/%m/%Y').strftime(
-                '%Y-%m-%d') if request.POST.get(
-                'stc_date_paid') else None if 'stc_date_paid' in request.POST else requirement.stc_date_paid
-            requirement.STC_PAYMENT = request.POST.get('STC_PAYMENT') if request.POST.get(
-                'STC_PAYMENT') else None if 'STC_PAYMENT' in request.POST else requirement.STC_PAYMENT
-            requirement.last_amount_paid_date = datetime.strptime(request.POST.get('last_amount_paid_date'),
-                                                                  '%d/%m/%Y').strftime(
-                '%Y-%m-%d') if request.POST.get(
-                'last_amount_paid_date') else None if 'last_amount_paid_date' in request.POST else requirement.last_amount_paid_date
-
-            requirement.last_amount_payment = request.POST.get('last_amount_payment') if request.POST.get(
-                'last_amount_payment') else None if 'last_amount_payment' in request.POST else requirement.last_amount_payment
-
-            requirement.last_amount_balance_due = request.POST.get('last_amount_balance_due') if request.POST.get(
-                'last_amount_balance_due') else None if 'last_amount_balance_due' in request.POST else requirement.last_amount_balance_due
-
-            requirement.last_amount_payment_method_id = request.POST.get(
-                'last_amount_payment_method') if request.POST.get(
-                'deposit_payment') else None if 'last_amount_payment_method' in request.POST else requirement.last_amount_payment_method_id
-
-            requirement.last_amount_notes = request.POST.get(
-                'last_amount_notes') if request.POST.get(
-                'last_amount_notes') else None if 'last_amount_notes' in request.POST else requirement.last_amount_notes
-
-            requirement.power_connection = request.POST.get('power_connection') if request.POST.get(
-                'power_connection') else None if 'power_connection' in request.POST else requirement.power_connection
-            requirement.meter_connection = request.POST.get('meter_connection') if request.POST.get(
-                'meter_connection') else None if 'meter_connection' in request.POST else requirement.meter_connection
-
+            # Validate and save the changed fields in a single transaction, see customer/customer_form.py
             try:
-                __stc = float(requirement.stc_amount)
-            except TypeError:
-                __stc = 0
-            try:
-                __stc_payment = float(requirement.STC_PAYMENT)
-            except TypeError:
-                __stc_payment = 0
-            requirement.stc_amount_payment =  __stc - __stc_payment
-
-            read_only_status = '' #for signed page
-            # Check which button was pressed
-            if 'btn_already_signed' in request.POST:
-                status = 'DEPOSIT'
-                read_only_status = 'SIGNED' # for read-only page signed
-            elif 'btn_deposit_paid' in request.POST:
-                if requirement.finance != "Yes" and all([requirement.deposit_payment, requirement.deposit_date_paid]):
-                    status = 'ON_FILE'
-                else:
-                    status = None
-                    messages.error(
-                        request, 'You need complete the "Deposite Data" section')
-            elif 'btn_payment_order' in request.POST:
-                if all([customer.customer_check]):
-                    status = 'ORDER'
-                    if requirement.finance != "Yes" and all([requirement.deposit_payment, requirement.deposit_date_paid]):
-                        status = 'ORDER'
-                    else:
-                        status = None
-                        messages.error(
-                            request, 'You need complete the "Deposite Data" section')
-                else:
-                    status = None
-                    messages.error(
-                        request, 'Customer has to be checked before promoting to order')
-
-            elif 'btn_confirm_all' in request.POST:
-                # if customer_check and deposite_date_paid or finance == Yes
-                # the status has INSTALLATION and order_paid = True
-                if all([customer.customer_check, requirement.deposit_date_paid]) or \
-                                                        requirement.finance == "Yes":
-                    status = 'INSTALLATION'
-                    requirement.order_paid = True
-                    if requirement.finance != "Yes" and all([requirement.deposit_payment, requirement.deposit_date_paid]):
-                        pass
-                    else:
-                        status = None
-                        messages.error(
-                            request, 'You need complete the "Deposite Data" section')
-
-                else:
-                    status = None
-                    messages.error(
-                        request, 'Customer has to be checked and deposit has to be paid before confirming')
-            elif 'btn_order_paid' in request.POST:
-                if all([requirement.deposit_date_paid]) or requirement.finance == "Yes":
-                    status = 'INSTALLATION'
-                    requirement.order_paid = True
-                else:
-                    status = None
-                    messages.error(
-                        request, 'Deposit has to be paid before finishing')
-            elif 'btn_finish_installation' in request.POST:
-                if requirement.finance != "Yes" and all([requirement.deposit_payment, requirement.deposit_date_paid]):
-                    status = 'ACCOUNT'
-                else:
-                    status = None
-                    messages.error(
-                        request, 'You need complete the "Deposite Data" section')
-            elif 'btn_all_paid' in request.POST:
-                if all([requirement.deposit_date_paid, requirement.stc_date_paid, requirement.last_amount_paid_date,
-                        requirement.suppliers_paid, requirement.installer_date_paid]):
-                    status = 'FINISHED'
-                else:
-                    if not customer.created_from_account:
-                        status = None
-                        messages.error(
-                            request, 'All amounts have to be paid before finishing')
-                    elif customer.created_from_account:
-                        status = 'FINISHED'
-            elif 'btn_service' in request.POST:
-                status = 'SERVICE'
-            elif 'btn_delivered' in request.POST:
-                status = 'DELIVERED'
-            elif 'btn_delivered_home' in request.POST:
-                status = 'DELIVERED_HOME'
-            elif 'btn_service_home' in request.POST:
-                status = 'SERVICE_HOME'
-            else:
-                status = None
-
-            requirement.status = status if status else requirement.status if requirement.status else None
-            requirement.save()
-
-            # Update any credit card field from form
-            credit_card.credit_card = request.POST.get('credit_card') if request.POST.get(
-                'credit_card') else None if 'credit_card' in request.POST else credit_card.credit_card
-            credit_card.expires = datetime.strptime(request.POST.get('expires'), '%m/%Y').strftime(
-                '%Y-%m-01') if request.POST.get(
-                'expires') else None if 'expires' in request.POST else credit_card.expires
-
-            credit_card.save()
+                form_save = save_customer_form(request.POST.get('pk'), request.POST)
+            except Requirement.DoesNotExist:
+                raise Http404('Customer has no requirement')
+            customer = form_save.customer
+
+            if request.is_ajax():
+                # New state of the customer for the pages saving without reloading
+                return JsonResponse({'saved': form_save.saved,
+                                     'errors': form_save.errors,
+                                     'changed': form_save.changed,
+                                     'status': form_save.status,
+                                     'status_error': form_save.status_error,
+                                     'fields': form_save.state()},
+                                    status=200 if form_save.saved else 400)
+
+            if not form_save.saved:
+                for name, error in form_save.errors.items():
+                    messages.error(request, '{}: {}'.format(name, error) if name else error)
+                return redirect(request.META.get('HTTP_REFERER', 'home'))
+            if form_save.status_error:
+                messages.error(request, form_save.status_error)
 
             # Build message to show what was updated
             status_message = ' moved to {}'.format(
-                status) if status else ' saved'
+                form_save.status) if form_save.status else ' saved'
             messages.success(request, 'Customer {}{}.'.format(
-                request.POST.get('customer_name'), status_message))
-            if read_only_status:
-                 messages.success(request,f"Customer {request.POST.get('customer_name')} moved to {read_only_status}")
+                customer.customer_name, status_message))
+            if form_save.read_only_status:
+                 messages.success(request,f"Customer {customer.customer_name} moved to {form_save.read_only_status}")
 
         if 'btn_save' in request.POST or customer.created_from_account:
             return redirect(request.META['HTTP_REFERER'])
@@ -559,35 +340,16 @@ def deposit_list(request):
     """Returns List of customers in DEPOSIT"""
     if request.method == 'GET':
         # Get all requirements in DEPOSIT status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                status="DEPOSIT").distinct().order_by('customer__date_signed')
-        else:
-            requirements = Requirement.objects.filter(Q(customer__sales_person=request.user) | Q(
-                installer=request.user), status="DEPOSIT").distinct().order_by('customer__date_signed')
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Data signed': 'customer.date_signed',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Deposit': 'deposit_paid',
-            'Finance': 'finance',
-            'Customer Check': 'customer.customer_check',
-            'Install notes': 'installation_notes',
-        }
+        requirements, next_cursor = stage_page('deposit', request.user)
+        columns = stage_columns('deposit')
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         
@@ -595,9 +357,12 @@ def deposit_list(request):
             'requirements': requirements,
             'url_view': 'deposit-view',
             'columns': columns,
+            'stage': 'deposit',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'deposit_search_field_visible': True,
-            'current_tab': 'deposit-tab'
+            'current_tab': 'deposit-tab',
+            **stage_rows_context('deposit', requirements),
         }
         # Return requirement list in DEPOSIT status
         return render(request, 'customer/requirement-list.html', context=context)
@@ -609,59 +374,31 @@ def deposit_search(request):
     if request.method == 'POST':
         # get Search Key data from search form
         search_value = request.POST.get('search_value')
-        print("========================")
 
         # Get all requirements in DEPOSIT status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                status="DEPOSIT").distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                Q(customer__sales_person=request.user) |
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value) |
-                Q(installer=request.user), status="DEPOSIT").distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Data signed': 'customer.date_signed',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Deposit': 'deposit_paid',
-            'Finance': 'finance',
-            'Customer Check': 'customer.customer_check',
-            'Install notes': 'installation_notes',
-        }
+        requirements, next_cursor = stage_page('deposit', request.user, search_value=search_value)
+        columns = stage_columns('deposit', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         context = {
             'requirements': requirements,
             'url_view': 'deposit-view',
             'columns': columns,
+            'stage': 'deposit',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'deposit_search_field_visible': True,
             'search_value': search_value,
             'current_tab': 'deposit-tab',
+            **stage_rows_context('deposit', requirements, search=True),
         }
 
         # Return requirement list in DEPOSIT status
@@ -672,7 +409,7 @@ def deposit_search(request):
 @permission_required(['customer.deposit_view'])
 def deposit_view(request, pk):
     """Returns a customer form in DEPOSIT status"""
-    customer = Customer.objects.get(id=pk)
+    dossier = customer_dossier(pk, 'credit_card', 'files')
 
     # Set context.
     # leads, sales_people, roof_types, storeys, electric_powers, payments are default options loaded in Django admin
@@ -721,16 +458,13 @@ def deposit_view(request, pk):
     }
     context = {
         'current_tab': 'deposit-tab',
-        'leads': Lead.objects.all(),
-        'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-        'roof_types': RoofType.objects.all(),
-        'storeys': Storey.objects.all(),
-        'electric_powers': ElectricPower.objects.all(),
-        'customer': customer,
-        'requirement': Requirement.objects.filter(customer_id=customer.id).first(),
-        'credit_card': CreditCard.objects.filter(customer_id=customer.id).first(),
-        'files': File.objects.filter(customer_id=customer.id),
-        'payments': Payment.objects.all(),
+        'leads': lookup('leads'),
+        'sales_people': lookup('sales_people'),
+        'roof_types': lookup('roof_types'),
+        'storeys': lookup('storeys'),
+        'electric_powers': lookup('electric_powers'),
+        **dossier,
+        'payments': lookup('payments'),
         'power_meter_connection_disable': True,
         'required_fields': required_fields,
         'options': {
@@ -765,46 +499,27 @@ def salesSigned_list(request):
     """Returns List of customers in SIGNED"""
     if request.method == 'GET':
         # Get all requirements in DEPOSIT status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(Q(status="DEPOSIT") |
-                Q(status="ON_FILE") | Q(status="ORDER") |
-                Q(status="ACCOUNT") | Q(status="INSTALLATION") |
-                Q(status="SERVICE") | Q(status="FINISHED")).distinct().order_by('-customer__date_signed')
-        else:
-            requirements = Requirement.objects.filter(Q(customer__sales_person=request.user) | Q(
-                installer=request.user), Q(status="DEPOSIT") |
-                Q(status="ON_FILE") | Q(status="ORDER") |
-                Q(status="ACCOUNT") | Q(status="INSTALLATION") |
-                Q(status="SERVICE") | Q(status="FINISHED")).distinct().order_by('-customer__date_signed')
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Date signed': 'customer.date_signed',
-            'Sales': 'customer.sales_person',
-            'Lead Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Follow Up': 'customer.follow_up',
-            'Notes': 'customer.customer_notes',
-        }
+        requirements, next_cursor = stage_page('signed', request.user)
+        columns = stage_columns('signed')
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         context = {
             'requirements': requirements,
             'columns': columns,
+            'stage': 'signed',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'signed_search_field_visible': True,
-            'current_tab': 'signed-tab'
-
+            'current_tab': 'signed-tab',
+            **stage_rows_context('signed', requirements),
         }
         # Return requirement list in SIGNED status
         return render(request, 'customer/requirement-list.html', context=context)
@@ -817,54 +532,28 @@ def salesSigned_search(request):
         search_value = request.POST.get('search_value')
 
         # Get all requirements in SIGNED status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value)).distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                Q(customer__sales_person=request.user) |
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value) |
-                Q(installer=request.user)).distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Date signed': 'customer.date_signed',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Deposit': 'deposit_paid',
-            'Finance': 'finance',
-            'Customer Check': 'customer.customer_check',
-            'Install notes': 'installation_notes',
-        }
+        requirements, next_cursor = stage_page('signed', request.user, search_value=search_value)
+        columns = stage_columns('signed', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         context = {
             'requirements': requirements,
             'columns': columns,
+            'stage': 'signed',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'signed_search_field_visible': True,
             'search_value': search_value,
             'current_tab': 'signed-tab',
+            **stage_rows_context('signed', requirements, search=True),
         }
 
         # Return requirement list in DEPOSIT status
@@ -874,7 +563,7 @@ def salesSigned_search(request):
 @permission_required(['customer.sales_signed'])
 def salesSigned_view(request,pk):
     """Returns a customer form in already SIGNED status"""
-    customer = Customer.objects.get(id=pk)
+    dossier = customer_dossier(pk, 'credit_card', 'files')
 
     # Set context.
     # leads, sales_people, roof_types, storeys, electric_powers, payments are default options loaded in Django admin
@@ -923,16 +612,13 @@ def salesSigned_view(request,pk):
     }
     context = {
         'current_tab': 'signed-tab',
-        'leads': Lead.objects.all(),
-        'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-        'roof_types': RoofType.objects.all(),
-        'storeys': Storey.objects.all(),
-        'electric_powers': ElectricPower.objects.all(),
-        'customer': customer,
-        'requirement': Requirement.objects.filter(customer_id=customer.id).first(),
-        'credit_card': CreditCard.objects.filter(customer_id=customer.id).first(),
-        'files': File.objects.filter(customer_id=customer.id),
-        'payments': Payment.objects.all(),
+        'leads': lookup('leads'),
+        'sales_people': lookup('sales_people'),
+        'roof_types': lookup('roof_types'),
+        'storeys': lookup('storeys'),
+        'electric_powers': lookup('electric_powers'),
+        **dossier,
+        'payments': lookup('payments'),
         'power_meter_connection_disable': True,
         'required_fields': required_fields,
         'options': {
@@ -964,45 +650,28 @@ def on_file_list(request):
     """Returns List of customers in ON_FILE"""
     if request.method == 'GET':
         # Get all requirements in ON_FILE status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                status="ON_FILE").distinct().order_by('customer__date_signed')
-        else:
-            requirements = Requirement.objects.filter(Q(customer__sales_person=request.user) | Q(
-                installer=request.user), status="ON_FILE").distinct().order_by('customer__date_signed')
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Data signed': 'customer.date_signed',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Deposit': 'deposit_paid',
-            'Finance': 'finance',
-            'Customer Check': 'customer.customer_check',
-            'Con/ap': 'application',
-            'Install notes': 'installation_notes',
-        }
+        requirements, next_cursor = stage_page('on_file', request.user)
+        columns = stage_columns('on_file')
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         context = {
             'requirements': requirements,
             'url_view': 'on-file-view',
             'columns': columns,
+            'stage': 'on_file',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'on_file_search_visible': True,
-            'current_tab': 'on-file-tab'
+            'current_tab': 'on-file-tab',
+            **stage_rows_context('on_file', requirements),
         }
 
         # Return requirement list in ON_FILE status
@@ -1016,59 +685,31 @@ def on_file_search(request):
 
         # get Search Key data from search form
         search_value = request.POST.get('search_value')
-        print("========================")
 
         # Get all requirements in ON_FILE status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                status="ON_FILE").distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                Q(customer__sales_person=request.user) |
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value) |
-                Q(installer=request.user), status="ON_FILE").distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Data signed': 'customer.date_signed',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Deposit': 'deposit_paid',
-            'Customer Check': 'customer.customer_check',
-            'Con/ap': 'application',
-            'Install notes': 'installation_notes',
-        }
+        requirements, next_cursor = stage_page('on_file', request.user, search_value=search_value)
+        columns = stage_columns('on_file', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         context = {
             'requirements': requirements,
             'url_view': 'on-file-view',
             'columns': columns,
+            'stage': 'on_file',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'on_file_search_visible': True,
             'search_value': search_value,
-            'current_tab': 'on-file-tab'
+            'current_tab': 'on-file-tab',
+            **stage_rows_context('on_file', requirements, search=True),
         }
 
         # Return requirement list in ON_FILE status
@@ -1079,8 +720,7 @@ def on_file_search(request):
 @permission_required(['customer.on_file_view'])
 def on_file_view(request, pk):
     """Returns a customer form in ON_FILE status"""
-    customer = Customer.objects.get(id=pk)
-    requirement = Requirement.objects.filter(customer_id=customer.id).first()
+    dossier = customer_dossier(pk, 'credit_card', 'files', 'suppliers')
 
     # Set context.
     # leads, sales_people, roof_types, storeys, electric_powers, payments, installers are default options loaded in Django admin
@@ -1143,18 +783,14 @@ def on_file_view(request, pk):
     }
     context = {
         'current_tab': 'on-file-tab',
-        'leads': Lead.objects.all(),
-        'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-        'roof_types': RoofType.objects.all(),
-        'storeys': Storey.objects.all(),
-        'electric_powers': ElectricPower.objects.all(),
-        'installers': get_user_model().objects.filter(profile__title='installer'),
-        'customer': customer,
-        'requirement': requirement,
-        'credit_card': CreditCard.objects.filter(customer_id=customer.id).first(),
-        'files': File.objects.filter(customer_id=customer.id),
-        'payments': Payment.objects.all(),
-        'suppliers': Supplier.objects.filter(requirement_id=requirement.id),
+        'leads': lookup('leads'),
+        'sales_people': lookup('sales_people'),
+        'roof_types': lookup('roof_types'),
+        'storeys': lookup('storeys'),
+        'electric_powers': lookup('electric_powers'),
+        'installers': lookup('installers'),
+        **dossier,
+        'payments': lookup('payments'),
         'required_fields': required_fields,
         'options': {
             'user_created_enabled': True,
@@ -1193,74 +829,29 @@ def order_list(request):
     """Returns List of customers in ORDER"""
     if request.method == 'GET':
         # Get all requirements in ORDER status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                status="ORDER").distinct().order_by('installation_date')
-        else:
-            requirements = Requirement.objects.filter(Q(customer__sales_person=request.user) | Q(
-                installer=request.user), status="ORDER").distinct().order_by('installation_date')
-
-        order = {}
-        for requirement in requirements:
-            suppliers = Supplier.objects.filter(requirement_id=requirement.id)
-            amount = 0
-            supplier_exisits = False
-            Amount_exists = False
-            for supplier in suppliers:
-                supplier_exisits = True
-                if supplier.supplier_date_paid is None:
-                    try:
-                        amount += supplier.supplier_amount
-                        Amount_exists = True
-
-                    except TypeError:
-                        pass
-                else:
-                    Amount_exists = True
-
-            if supplier_exisits == False:
-                order[requirement.id] = '_'
-            elif Amount_exists == False:
-                order[requirement.id] = '_'
-            elif amount == 0 and supplier_exisits:
-                order[requirement.id] = 'Paid'
-            else:
-                order[requirement.id] = '$ ' + str(amount)
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Installation Date': 'installation_date',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Order': 'True',
-            'Customer Check': 'customer.customer_check',
-            'Con/ap': 'application',
-            'Install notes': 'installation_notes',
-
-        }
+        requirements, next_cursor = stage_page('order', request.user)
+        columns = stage_columns('order')
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
+        #   OrderFlag: show the 'Order' column, see stage_rows_context
         context = {
             'requirements': requirements,
             'url_view': 'order-view',
             'columns': columns,
+            'stage': 'order',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'order_search_field_visibie': True,
             'current_tab': 'order-tab',
-            'OrderFlag': True,
-            'order': order
+            **stage_rows_context('order', requirements)
         }
 
         # Return requirement list in ORDER status
@@ -1273,59 +864,31 @@ def order_search(request):
     if request.method == 'POST':
         # get Search Key data from search form
         search_value = request.POST.get('search_value')
-        print("========================")
 
         # Get all requirements in ORDER status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                status="ORDER").distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                Q(customer__sales_person=request.user) |
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value) |
-                Q(installer=request.user), status="ORDER").distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Installation Date': 'installation_date',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Customer Check': 'customer.customer_check',
-            'Con/ap': 'application',
-            'Install notes': 'installation_notes',
-
-        }
+        requirements, next_cursor = stage_page('order', request.user, search_value=search_value)
+        columns = stage_columns('order', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         context = {
             'requirements': requirements,
             'url_view': 'order-view',
             'columns': columns,
+            'stage': 'order',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'order_search_field_visibie': True,
             'search_value': search_value,
-            'current_tab': 'order-tab'
+            'current_tab': 'order-tab',
+            **stage_rows_context('order', requirements, search=True),
         }
 
         # Return requirement list in ORDER status
@@ -1336,8 +899,7 @@ def order_search(request):
 @permission_required(['customer.order_view'])
 def order_view(request, pk):
     """Returns a customer form in ORDER status"""
-    customer = Customer.objects.get(id=pk)
-    requirement = Requirement.objects.filter(customer_id=customer.id).first()
+    dossier = customer_dossier(pk, 'credit_card', 'files', 'suppliers')
 
     # Set context.
     # leads, sales_people, roof_types, storeys, electric_powers, payments, installers are default options loaded in Django admin
@@ -1401,18 +963,14 @@ def order_view(request, pk):
     }
     context = {
         'current_tab': 'order-tab',
-        'leads': Lead.objects.all(),
-        'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-        'roof_types': RoofType.objects.all(),
-        'storeys': Storey.objects.all(),
-        'electric_powers': ElectricPower.objects.all(),
-        'installers': get_user_model().objects.filter(profile__title='installer'),
-        'customer': customer,
-        'requirement': requirement,
-        'credit_card': CreditCard.objects.filter(customer_id=customer.id).first(),
-        'files': File.objects.filter(customer_id=customer.id),
-        'suppliers': Supplier.objects.filter(requirement_id=requirement.id),
-        'payments': Payment.objects.all(),
+        'leads': lookup('leads'),
+        'sales_people': lookup('sales_people'),
+        'roof_types': lookup('roof_types'),
+        'storeys': lookup('storeys'),
+        'electric_powers': lookup('electric_powers'),
+        'installers': lookup('installers'),
+        **dossier,
+        'payments': lookup('payments'),
         'options': {
             'user_created_enabled': True,
             'customer_data_enabled': True,
@@ -1447,74 +1005,29 @@ def installation_list(request):
     """Returns List of customers in ORDER and INSTALLATION"""
     if request.method == 'GET':
         # Get all requirements in ORDER and INSTALLATION status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(status="ORDER") | Q(status="INSTALLATION")).distinct().order_by('installation_date') # order by oldest
-        else:
-            requirements = Requirement.objects.filter((Q(customer__sales_person=request.user) | Q(
-                installer=request.user)) & (Q(status="ORDER") | Q(status="INSTALLATION"))).distinct().order_by('installation_date') # order by latest
-
-        order = {}
-        for requirement in requirements:
-            suppliers = Supplier.objects.filter(requirement_id=requirement.id)
-            amount = 0
-            supplier_exisits = False
-            Amount_exists = False
-            for supplier in suppliers:
-                supplier_exisits = True
-                if supplier.supplier_date_paid is None:
-                    try:
-                        amount += supplier.supplier_amount
-                        Amount_exists = True
-
-                    except TypeError:
-                        pass
-                else:
-                    Amount_exists = True
-
-            if supplier_exisits == False:
-                order[requirement.id] = '_'
-            elif  Amount_exists == False:
-                order[requirement.id] = '_'
-            elif amount == 0 and supplier_exisits:
-                order[requirement.id] = 'Paid'
-            else:
-                order[requirement.id] = '$ ' + str(amount)
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Installation Date': 'installation_date',
-            'Installer': 'installer',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Order': 'True',
-            'Customer Check': 'customer.customer_check',
-            'Con/ap': 'application',
-            'Install notes': 'installation_notes',
-
-        }
+        requirements, next_cursor = stage_page('installation', request.user)
+        columns = stage_columns('installation')
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
+        #   OrderFlag: show the 'Order' column, see stage_rows_context
         context = {
             'requirements': requirements,
             'url_view': 'installation-view',
             'columns': columns,
+            'stage': 'installation',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'installation_search_field_visible': True,
             'current_tab': 'installation-tab',
-            'OrderFlag': True,
-            'order': order
+            **stage_rows_context('installation', requirements)
         }
 
         # Return requirement list in ORDER and INSTALLATION status
@@ -1528,59 +1041,31 @@ def installation_search(request):
 
         # get Search Key data from search form
         search_value = request.POST.get('search_value')
-        print("========================")
 
         # Get all requirements in ORDER and INSTALLATION status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                Q(status="ORDER") | Q(status="INSTALLATION")).distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                (Q(customer__sales_person=request.user) |
-                 Q(customer__sales_person=request.user) |
-                 Q(customer__customer_name__contains=search_value) |
-                 Q(customer__customer_address__contains=search_value) |
-                 Q(customer__customer_email__contains=search_value) |
-                 Q(customer__phone_number__contains=search_value) |
-                 Q(customer__agm__contains=search_value) |
-                 Q(installer=request.user)) & (Q(status="ORDER") | Q(status="INSTALLATION"))).distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Installation Date': 'installation_date',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-
-            'Customer Check': 'customer.customer_check',
-            'Con/ap': 'application',
-            'Install notes': 'installation_notes',
-        }
+        requirements, next_cursor = stage_page('installation', request.user, search_value=search_value)
+        columns = stage_columns('installation', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         context = {
             'requirements': requirements,
             'url_view': 'installation-view',
             'columns': columns,
+            'stage': 'installation',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'installation_search_field_visible': True,
             'search_value': search_value,
-            'current_tab': 'installation-tab'
+            'current_tab': 'installation-tab',
+            **stage_rows_context('installation', requirements, search=True),
         }
 
         # Return requirement list in ORDER and INSTALLATION status
@@ -1591,8 +1076,7 @@ def installation_search(request):
 @permission_required(['customer.installation_view'])
 def installation_view(request, pk):
     """Returns a customer form in ORDER and INSTALLATION status"""
-    customer = Customer.objects.get(id=pk)
-    requirement = Requirement.objects.filter(customer_id=customer.id).first()
+    dossier = customer_dossier(pk, 'credit_card', 'files', 'suppliers')
 
     # Set context.
     # leads, sales_people, roof_types, storeys, electric_powers, payments, installers are default options loaded in Django admin
@@ -1657,18 +1141,14 @@ def installation_view(request, pk):
     }
     context = {
         'current_tab': 'installation-tab',
-        'leads': Lead.objects.all(),
-        'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-        'roof_types': RoofType.objects.all(),
-        'storeys': Storey.objects.all(),
-        'electric_powers': ElectricPower.objects.all(),
-        'installers': get_user_model().objects.filter(profile__title='installer'),
-        'customer': customer,
-        'requirement': Requirement.objects.filter(customer_id=customer.id).first(),
-        'credit_card': CreditCard.objects.filter(customer_id=customer.id).first(),
-        'files': File.objects.filter(customer_id=customer.id),
-        'suppliers': Supplier.objects.filter(requirement_id=requirement.id),
-        'payments': Payment.objects.all(),
+        'leads': lookup('leads'),
+        'sales_people': lookup('sales_people'),
+        'roof_types': lookup('roof_types'),
+        'storeys': lookup('storeys'),
+        'electric_powers': lookup('electric_powers'),
+        'installers': lookup('installers'),
+        **dossier,
+        'payments': lookup('payments'),
         'required_fields': required_fields,
         'options': {
             'user_created_enabled': True,
@@ -1710,405 +1190,87 @@ def export_xls(request):
     # Initialize for excel export.
     response = HttpResponse(content_type='application/ms-excel')
     response['Content-Disposition'] = 'attachment; filename="reports.xls"'
-    wb = xlwt.Workbook(encoding='utf-8')
-    ws = wb.add_sheet('Reports', cell_overwrite_ok=True)
     
     if request.method == 'POST':
-        # Get all requirements in ONFILE and INSTALLATION status
-        if request.user.has_perm('customer.customer_view_others'):
-            onfilelist = Requirement.objects.filter(
-                status="ON_FILE").distinct().order_by('customer__date_signed')
-        else:
-            onfilelist = Requirement.objects.filter(Q(customer__sales_person=request.user) | Q(
-                installer=request.user), status="ON_FILE").distinct().order_by('customer__date_signed')
-        # Get all requirements in ORDER and INSTALLATION status
-        if request.user.has_perm('customer.customer_view_others'):
-            orderlist = Requirement.objects.filter(
-                status="ORDER").distinct().order_by('installation_date')
-        else:
-            orderlist = Requirement.objects.filter(Q(customer__sales_person=request.user) | Q(
-                installer=request.user), status="ORDER").distinct().order_by('installation_date')
-        
-        # Get all list in order status
-        order = {}
-        for requirement in orderlist:
-            suppliers = Supplier.objects.filter(requirement_id=requirement.id)
-            amount = 0
-            supplier_exisits = False
-            Amount_exists = False
-            for supplier in suppliers:
-                supplier_exisits = True
-                if supplier.supplier_date_paid is None:
-                    try:
-                        amount += supplier.supplier_amount
-                        Amount_exists = True
-
-                    except TypeError:
-                        pass
-                else:
-                    Amount_exists = True
-
-            if supplier_exisits == False:
-                order[requirement.id] = '_'
-            elif Amount_exists == False:
-                order[requirement.id] = '_'
-            elif amount == 0 and supplier_exisits:
-                order[requirement.id] = 'Paid'
-            else:
-                order[requirement.id] = '$ ' + str(amount)
-        
-        # Get all requirements in ORDER and INSTALLATION status
-        if request.user.has_perm('customer.customer_view_others'):
-            installerlist = Requirement.objects.filter(
-                Q(status="ORDER") | Q(status="INSTALLATION")).distinct().order_by('installation_date') # order by oldest
-        else:
-            requirements = Requirement.objects.filter((Q(customer__sales_person=request.user) | Q(
-                installerlist=request.user)) & (Q(status="ORDER") | Q(status="INSTALLATION"))).distinct().order_by('installation_date') # order by latest
-        
-        # Get all list in order status
-        order_install = {}
-        for requirement in installerlist:
-            suppliers = Supplier.objects.filter(requirement_id=requirement.id)
-            amount = 0
-            supplier_exisits = False
-            Amount_exists = False
-            for supplier in suppliers:
-                supplier_exisits = True
-                if supplier.supplier_date_paid is None:
-                    try:
-                        amount += supplier.supplier_amount
-                        Amount_exists = True
-
-                    except TypeError:
-                        pass
-                else:
-                    Amount_exists = True
-
-            if supplier_exisits == False:
-                order_install[requirement.id] = '_'
-            elif  Amount_exists == False:
-                order_install[requirement.id] = '_'
-            elif amount == 0 and supplier_exisits:
-                order_install[requirement.id] = 'Paid'
-            else:
-                order_install[requirement.id] = '$ ' + str(amount)
-
-        # Get all requirements in ACCOUNT and INSTALLATION status
-        if request.user.has_perm('customer.customer_view_others'):
-            acountlist = Requirement.objects.filter(Q(status="ACCOUNT")).distinct().order_by('installation_date')
-        else:
-            acountlist = Requirement.objects.filter((Q(customer__sales_person=request.user) |  Q(
-                status="ACCOUNT"))).distinct().order_by('installation_date')
-        
-        # Get all in Supplier and SupplierMax status
-        supplier = {}
-        for requirement in acountlist:
-            if requirement.last_amount_payment is not None:
-                requirement.last_amount_balance_due = requirement.last_amount - requirement.last_amount_payment
-                requirement.save()
-
-            supplier[requirement.id] = Supplier.objects.filter(requirement_id=requirement.id)
-        
-        supplierMax = Supplier.objects.values('requirement').order_by().annotate(Count('requirement'))
-        supplierMax = [x['requirement__count'] for x in supplierMax]
-        supplierMax.append(0)
-        supplierMax = max(supplierMax)
+        # On File, Order, Installation and Account sections, see customer/export.py
+        write_xls(report_rows(request.user), response)
+        return response
 
-        
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns1 = {
-            'Data signed': 'customer.date_signed',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Deposit': 'deposit_paid',
-            'Finance': 'finance',
-            'Customer Check': 'customer.customer_check',
-            'Con/ap': 'application',
-            'Install notes': 'installation_notes',
-        }
 
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns2 = {
-            'Installation Date': 'installation_date',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Order': 'Order',
-            'Customer Check':'customer.customer_check',
-            'Con/ap': 'application',
-            'Install notes': 'installation_notes'
-        }
+class Echo:
+    """File like object returning what is written to it, so csv.writer output can be streamed"""
 
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns3 = {
-            'Installation Date': 'installation_date',
-            'Installer': 'installer',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Order': 'Order',
-            'Customer Check': 'customer.customer_check',
-            'Con/ap': 'application',
-            'Install notes': 'installation_notes',
+    def write(self, value):
+        return value
 
-        }
 
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns4 = {
-            'Installation Date': 'installation_date',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'STC/ap': 'stc_application',
-            'Last amount': 'last_amount_balance_due',
-            'STC': 'stc_amount_payment',
-            'Installer': 'installer_amount',
-            'Supplier': 'Supplier',
-            'Payment notes': 'last_amount_notes'
-        }
+@login_required
+@permission_required(['customer.reports_view'])
+def export_csv(request):
+    # Same report as export_xls, streamed as csv while the requirements are read:
+    # the first rows are sent right away and memory does not grow with the number of rows.
+    writer = csv.writer(Echo())
+    rows = (writer.writerow(cells) for cells, heading in report_rows(request.user))
+    response = StreamingHttpResponse(rows, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="reports.csv"'
+    return response
+
+
+def report_job_json(job):
+    """Returns the state of a report job sent to the download page"""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'error': job.error,
+        'url': reverse('report-job-download', args=[job.id]) if job.status == 'DONE' else None,
+    }
 
-        col_num1 = 0
-        col_num2 = 0
-        col_num3 = 0
-        col_num4 = 0
-
-        # ONFILE LIST write to excel file.
-        font_style = xlwt.XFStyle()
-        font_style.font.bold = True
-        ws.write(0, 0, "On File", font_style)
-        for key,value in columns1.items():
-            ws.write(2, col_num1, key, font_style)
-            col_num1 += 1
-        
-        col_num1 = 0
-        row_num = 3
-        font_style = xlwt.XFStyle()            
-        for row in onfilelist:
-            for key,value in columns1.items():
-                if value == 'customer.date_signed':
-                    if row.customer.date_signed is None:
-                        ws.write(row_num, col_num1, '-', font_style)
-                    else:
-                        ws.write(row_num, col_num1, str(row.customer.date_signed.strftime("%m/%d/%Y")), font_style)
-                if value == 'customer.sales_person':
-                    ws.write(row_num, col_num1, str(row.customer.sales_person), font_style)
-                if value == 'customer.agm':
-                    ws.write(row_num, col_num1, row.customer.agm, font_style)
-                if value == 'customer.customer_name':
-                    ws.write(row_num, col_num1, row.customer.customer_name, font_style)
-                if value == 'customer.phone_number':
-                    ws.write(row_num, col_num1, row.customer.phone_number, font_style)
-                if value == 'customer.customer_address':
-                    ws.write(row_num, col_num1, row.customer.customer_address, font_style)
-                if value == 'deposit_paid':
-                    ws.write(row_num, col_num1, row.deposit_paid, font_style)                                        
-                if value == 'finance':
-                    ws.write(row_num, col_num1, row.finance, font_style)
-                if value == 'customer.customer_check':
-                    cus_check = 'No'
-                    if row.customer.customer_check == True:
-                        cus_check = 'Yes'
-                    ws.write(row_num, col_num1, cus_check, font_style)
-                if value == 'application':
-                    conap = 'No'
-                    if row.application == True:
-                        conap = 'Yes'
-                    ws.write(row_num, col_num1, conap, font_style)
-                if value == 'installation_notes':
-                    ws.write(row_num, col_num1, row.installation_notes, font_style)
-                col_num1 += 1
-            row_num += 1
-            col_num1 = 0
-            
-        
-        # ORDER LIST write to excel file.
-        font_style = xlwt.XFStyle()
-        font_style.font.bold = True
-        ws.write(row_num + 2, col_num2, "Order", font_style)
-        for key,value in columns2.items():
-            ws.write(row_num + 4, col_num2, key, font_style)
-            col_num2 += 1
-
-        col_num2 = 0
-        row_num = row_num + 5
-        font_style = xlwt.XFStyle()
-        
-        for row in orderlist:
-            for key,value in columns2.items():
-                if value == 'installation_date':
-                    if value == 'installation_date':
-                        if row.installation_date is None:
-                            ws.write(row_num, col_num2, '-', font_style)
-                        else:
-                            ws.write(row_num, col_num2, str(row.installation_date.strftime("%m/%d/%Y")), font_style)
-                if value == 'customer.sales_person':
-                    ws.write(row_num, col_num2, str(row.customer.sales_person), font_style)
-                if value == 'customer.agm':
-                    ws.write(row_num, col_num2, row.customer.agm, font_style)
-                if value == 'customer.customer_name':
-                    ws.write(row_num, col_num2, row.customer.customer_name, font_style)
-                if value == 'customer.phone_number':
-                    ws.write(row_num, col_num2, row.customer.phone_number, font_style)
-                if value == 'customer.customer_address':
-                    ws.write(row_num, col_num2, row.customer.customer_address, font_style)
-                if value == 'Order':
-                    ws.write(row_num, col_num2, order[row.id], font_style)
-                if value == 'customer.customer_check':
-                    cus_check = 'No'
-                    if row.customer.customer_check == True:
-                        cus_check = 'Yes'
-                    ws.write(row_num, col_num2, str(cus_check), font_style)
-                if value == 'application':
-                    conap = 'No'
-                    if row.application == True:
-                        conap = 'Yes'
-                    ws.write(row_num, col_num2, str(conap), font_style)
-                if value == 'installation_notes':
-                    ws.write(row_num, col_num2, str(row.installation_notes), font_style)
-                col_num2 += 1
-            row_num += 1
-            col_num2 = 0
-
-        # Installation LIST write to excel file.
-        font_style = xlwt.XFStyle()
-        font_style.font.bold = True
-        ws.write(row_num + 2, col_num3, "Installation", font_style)
-        for key,value in columns3.items():
-            ws.write(row_num + 4, col_num3, key, font_style)
-            col_num3 += 1
-        
-        row_num = row_num + 5
-        col_num3 = 0
-        font_style = xlwt.XFStyle()
-        for row in installerlist:
-            for key,value in columns3.items():
-                if value == 'installation_date':
-                    if value == 'installation_date':
-                        if row.installation_date is None:
-                            ws.write(row_num, col_num3, '-', font_style)
-                        else:
-                            ws.write(row_num, col_num3, str(row.installation_date.strftime("%m/%d/%Y")), font_style)
-                if value == 'installer':
-                    ws.write(row_num, col_num3, str(row.installer), font_style)
-                if value == 'customer.agm':
-                    ws.write(row_num, col_num3, row.customer.agm, font_style)
-                if value == 'customer.customer_name':
-                    ws.write(row_num, col_num3, row.customer.customer_name, font_style)
-                if value == 'customer.phone_number':
-                    ws.write(row_num, col_num3, row.customer.phone_number, font_style)
-                if value == 'customer.customer_address':
-                    ws.write(row_num, col_num3, row.customer.customer_address, font_style)
-                if value == 'Order':
-                    ws.write(row_num, col_num3, order_install[row.id], font_style)
-                if value == 'customer.customer_check':
-                    cus_check = 'No'
-                    if row.customer.customer_check == True:
-                        cus_check = 'Yes'
-                    ws.write(row_num, col_num3, str(cus_check), font_style)
-                if value == 'application':
-                    conap = 'No'
-                    if row.application == True:
-                        conap = 'Yes'
-                    ws.write(row_num, col_num3, str(conap), font_style)
-                if value == 'installation_notes':
-                    ws.write(row_num, col_num3, str(row.installation_notes), font_style)
-                col_num3 += 1
-            row_num += 1
-            col_num3 = 0
-
-        # Account LIST write to excel file.            
-        font_style = xlwt.XFStyle()
-        font_style.font.bold = True
-        ws.write(row_num + 2, col_num4, "Account", font_style)
-        supplierCnt = 0
-        for key,value in columns4.items():
-            if key == 'Supplier':
-                for x in range(0, supplierMax):
-                    ws.write(row_num + 4, col_num4, key + str(x+1), font_style)
-                    supplierCnt += 1
-                    col_num4 += 1
-            else:
-                ws.write(row_num + 4, col_num4, key, font_style)
-                col_num4 += 1
-        
-        col_num4 = -1
-        row_num = row_num + 5
-        font_style = xlwt.XFStyle()
-        for row in acountlist:
-            col_num4 = -1
-            for key,value in columns4.items():
-                col_num4 += 1
-                if value == 'installation_date':
-                    if row.installation_date is None:
-                        ws.write(row_num, col_num4, '-', font_style)
-                    else:
-                        ws.write(row_num, col_num4, str(row.installation_date.strftime("%m/%d/%Y")), font_style)
-                if value == 'customer.agm':
-                    ws.write(row_num, col_num4, row.customer.agm, font_style)
-                if value == 'customer.customer_name':
-                    ws.write(row_num, col_num4, row.customer.customer_name, font_style)
-                if value == 'customer.phone_number':
-                    ws.write(row_num, col_num4, row.customer.phone_number, font_style)
-                if value == 'stc_application':
-                    stc_app = 'No'
-                    if row.stc_application:
-                        stc_app = 'YES'
-                    ws.write(row_num, col_num4, stc_app, font_style)
-                if value == 'last_amount_balance_due':
-                    if row.last_amount_balance_due == None:
-                        row.last_amount_balance_due = '0.00'
-                    ws.write(row_num, col_num4, '$ ' + str(row.last_amount_balance_due), font_style)
-                if value == 'stc_amount_payment':
-                    if row.stc_amount_payment == '':
-                        row.stc_amount_payment = '0.00'
-                    ws.write(row_num, col_num4, '$ ' + str(row.stc_amount_payment), font_style)
-                if value == 'installer_amount':
-                    if row.installer_amount == None:
-                        ws.write(row_num, col_num4, '$ 0.0', font_style)
-                    elif row.installer_date_paid is not None:
-                        row.installer_amount = 'Paid'
-                        ws.write(row_num, col_num4, row.installer_amount, font_style)
-                    else:
-                        ws.write(row_num, col_num4, '$ ' + str(row.installer_amount), font_style)
-                if value == 'Supplier':
-                    supplierFor = supplier[row.id]
-                    for val in supplierFor:
-                        if val.supplier_date_paid is None and  val.supplier_amount is not None:
-                            ws.write(row_num, col_num4, '$ ' + str(round(val.supplier_amount, 2)), font_style)
-                        elif val.supplier_amount is None:  
-                            ws.write(row_num, col_num4, '-', font_style)
-                        else:
-                            ws.write(row_num, col_num4, 'Paid', font_style)
-                        col_num4 += 1
-                if value == 'last_amount_notes':
-                    if row.last_amount_notes is None:
-                        row.last_amount_notes = '-'
-                    ws.write(row_num, 8 + supplierCnt, str(row.last_amount_notes), font_style)
-            row_num += 1
-        wb.save(response)
-        return response
+
+def get_report_job(request, pk):
+    """Returns a report job of the scope of the user. Raises Http404 if it does not exist"""
+    job = ReportJob.objects.filter(pk=pk, scope=report_scope(request.user)).first()
+    if job is None:
+        raise Http404('Report not found')
+    return job
+
+
+@login_required
+@permission_required(['customer.reports_view'])
+def report_job_start(request):
+    """
+    Start generating the reports download in the background, or return the report already generated for
+    the current data.
+
+    Args:
+        format: Optional. 'csv' (default) or 'xls'.
+
+    Returns:
+        Json with the state of the job, see report_job_json.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    format = request.POST.get('format', 'csv')
+    if format not in dict(REPORT_FORMATS):
+        return HttpResponseBadRequest('Invalid format')
+    return JsonResponse(report_job_json(start_report_job(request.user, format)))
+
+
+@login_required
+@permission_required(['customer.reports_view'])
+def report_job_status(request, pk):
+    # Polled by the download page while the report is generated
+    return JsonResponse(report_job_json(get_report_job(request, pk)))
+
+
+@login_required
+@permission_required(['customer.reports_view'])
+def report_job_download(request, pk):
+    job = get_report_job(request, pk)
+    if job.status != 'DONE' or not os.path.exists(report_path(job)):
+        raise Http404('Report not found')
+    return FileResponse(open(report_path(job), 'rb'), as_attachment=True, filename='reports.' + job.format)
 
 
 @login_required
@@ -2119,46 +1281,17 @@ def global_search(request):
         search_value = request.POST.get('search_value')
         current_tab = request.POST.get('current_tab')
         tab = current_tab.split('-')[0]
-        print("========================")
-
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                ).distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name=search_value) |
-                Q(customer__customer_address=search_value) |
-                Q(customer__customer_email=search_value) |
-                Q(customer__phone_number=search_value) |
-                Q(customer__agm=search_value),
-                Q(customer__sales_person=request.user)).distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Created Date': 'customer.created_date',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Email': 'customer.customer_email',
-            'Status' : 'status'
-        }
+
+        requirements, next_cursor = stage_page('all', request.user, search_value=search_value)
+        columns = stage_columns('all', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         #   summary_enabled: show summary charts at the top of the view
@@ -2167,104 +1300,151 @@ def global_search(request):
             'requirements': requirements,
             'url_view': 'finished-view',
             'columns': columns,
+            'stage': 'all',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             f'{tab}_search_field_visible': True,
             'search_value': search_value,
             'current_tab': f'{current_tab}',
-            'summary_enabled': False
+            'summary_enabled': False,
+            **stage_rows_context('all', requirements, search=True),
         }
         return render(request, 'customer/requirement-list.html', context=context)
 
 
+@login_required
+def stage_rows(request, stage):
+    """Returns the next page of a stage list for the infinite scroll of requirement-list.html. Returns a JSON data.
+
+    Args:
+        stage: Key of STAGES in customer/stages.py.
+        cursor: Query param. Cursor returned with the previous page.
+        offset: Query param. Number of rows already displayed, used to number the rows.
+        search_value: Query param. Optional. If provided, returns the next page of the stage search results.
+        customer_ids: Query param. Optional. Comma separated customer ids. If provided, returns the rows of these
+            customers in the list instead of a page, e.g. the new leads pushed by mailserver/events.py.
+
+    Returns:
+        html: Rendered rows of the page
+        next_cursor: Cursor of the next page. None if this is the last page
+    """
+    if stage not in STAGES:
+        raise Http404('Unknown stage {}'.format(stage))
+    if not stage_allowed(stage, request.user):
+        raise PermissionDenied
+
+    search_value = request.GET.get('search_value')
+    search = search_value is not None
+    try:
+        if request.GET.get('customer_ids'):
+            customer_ids = [int(customer_id) for customer_id in request.GET['customer_ids'].split(',')]
+            requirements = stage_requirements(stage, request.user).filter(customer_id__in=customer_ids)
+            next_cursor = None
+            search = False
+        else:
+            requirements, next_cursor = stage_page(stage, request.user, search_value=search_value,
+                                                   cursor=request.GET.get('cursor'))
+        offset = int(request.GET.get('offset', 0))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    columns = stage_columns(stage, search=search)
+    context = {
+        'requirements': requirements,
+        'columns': columns,
+        'colspan': len(columns) + 2,
+        'offset': offset,
+        **stage_rows_context(stage, requirements, search=search)
+    }
+    html = render_to_string('customer/requirement-rows.html', context=context, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+
+@login_required
+def search_suggestions(request):
+    """Returns the best matches of a search in a stage, for the type-ahead of the search fields. Returns a JSON data.
+    Sends an ETag, so repeated searches are answered with 304 Not Modified, without searching, while the data did
+    not change.
+
+    Args:
+        q: Query param. Text to find in the customer name, address, email, phone or AGM.
+        stage: Query param. Optional. Key of STAGES in customer/stages.py. Defaults to 'all'.
+        limit: Query param. Optional. Maximum number of results.
+
+    Returns:
+        results: List of matches with the customer id, name, phone, address, AGM, requirement status and form url
+    """
+    stage = request.GET.get('stage', 'all')
+    if stage not in STAGES:
+        raise Http404('Unknown stage {}'.format(stage))
+    if not stage_allowed(stage, request.user):
+        raise PermissionDenied
+    try:
+        limit = min(int(request.GET.get('limit', SUGGESTIONS_LIMIT)), SUGGESTIONS_MAX_LIMIT)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    search_value = request.GET.get('q', '').strip()
+    # Results only change with the data, see customer/reports.py, and with the requirements the user can see
+    etag = quote_etag(hashlib.md5(json.dumps(
+        [data_version(), report_scope(request.user), stage, limit, search_value]).encode()).hexdigest())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        patch_cache_control(not_modified, private=True, max_age=0)
+        return not_modified
+
+    requirements = stage_suggestions(stage, request.user, search_value, limit=limit) if search_value else []
+    response = JsonResponse({'results': [{
+        'id': requirement.customer_id,
+        'customer_name': requirement.customer.customer_name,
+        'phone_number': requirement.customer.phone_number,
+        'customer_address': requirement.customer.customer_address,
+        'agm': requirement.customer.agm,
+        'status': requirement.status,
+        'url': requirement_url(stage, requirement),
+    } for requirement in requirements]})
+
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=0)
+    return response
+
+
 @login_required
 @permission_required(['customer.account_list'])
 def account_list(request):
     """Returns List of customers in ORDER, INSTALLATION and ACCOUNT"""
     if request.method == 'GET':
-        # Get all requirements in ORDER, INSTALLATION and ACCOUNT status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(Q(status="ACCOUNT")).distinct().order_by('installation_date')
-        else:
-            requirements = Requirement.objects.filter((Q(customer__sales_person=request.user) |  Q(
-                status="ACCOUNT"))).distinct().order_by('installation_date')
-
-        supplier = {}
-        for requirement in requirements:
-            if requirement.last_amount_payment is not None:
-                requirement.last_amount_balance_due = requirement.last_amount - requirement.last_amount_payment
-                requirement.save()
-
-            supplier[requirement.id] = Supplier.objects.filter(requirement_id=requirement.id)
-
-        supplierMax = Supplier.objects.values('requirement').order_by().annotate(Count('requirement'))
-        supplierMax = [x['requirement__count'] for x in supplierMax]
-        supplierMax.append(0)
-        supplierMax = max(supplierMax)
-
-        # Set coagmlumns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-
-            'Installation Date': 'installation_date',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'STC/ap': 'stc_application',
-            'Last amount': 'last_amount_balance_due',
-            'STC': 'stc_amount_payment',
-            'Installer': 'installer_amount',
-            'Supplier': 'Supplier',
-            'Payment notes': 'last_amount_notes'
-
-        }
+        # Get all requirements in ACCOUNT status. The summary covers all of them, the list only shows the first page
+        requirements, next_cursor = stage_page('account', request.user)
+        columns = stage_columns('account')
         
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
+        #   supplierFlag, supplierMax, installer_flag: 'Supplier' and 'Installer' columns data, see stage_rows_context
         #   summary_enabled: show summary charts at the top of the view
         #   summary: Contains all aggregated results from models
-        total_stc = 0
-        total_last_amount = 0
-        for x in requirements:
-            try:
-                total_stc += float(x.stc_amount_payment)
-            except TypeError:
-                pass
-            try:
-                total_last_amount += float(x.last_amount_balance_due)
-            except TypeError:
-                pass
+        total_bank = AppData.objects.filter(name='total_bank').first()
         context = {
             'requirements': requirements,
             'url_view': 'account-view',
             'columns': columns,
+            'stage': 'account',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'current_tab': 'account-tab',
             'summary_enabled': True,
-            'suppliers': supplier,
-            'MaxSuppliers': supplier,
-            'supplierFlag': True,
-            'supplierMax': supplierMax,
             'account_search_field_visible':True,
-            'installer_flag':True,
+            **stage_rows_context('account', requirements),
             'summary': {
-                'total_bank': AppData.objects.get(name='total_bank').value if AppData.objects.filter(
-                    name='total_bank').exists() else 0,
-
-                # i thinks this code are wrong
-                **requirements.aggregate(total_stc=Sum('stc_amount'), total_last_amount=Sum('last_amount'),
-                                         total_installers=Sum('installer_amount',filter=Q(installer_date_paid=None))),
-                'total_suppliers': sum(filter(None, [
-                    req.supplier_set.aggregate(total_suppliers=Sum('supplier_amount',filter=Q(supplier_date_paid=None))).get('total_suppliers') for req in
-                    requirements])),
-                'total_stc': total_stc,
-                'total_last_amount': total_last_amount
+                'total_bank': total_bank.value if total_bank else 0,
+                **stage_requirements('account', request.user).account_summary()
             }
         }
 
@@ -2278,75 +1458,40 @@ def account_search(request):
     if request.method == 'POST':
         # get Search Key data from search form
         search_value = request.POST.get('search_value')
-        print("========================")
-
-        # Get all requirements in ORDER, INSTALLATION and ACCOUNT status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                Q(status="ORDER") | Q(
-                    status="INSTALLATION") | Q(status="ACCOUNT")).distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                Q(customer__sales_person=request.user) |
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                (Q(customer__sales_person__contains=request.user) | Q(
-                    installer=request.user)) & (Q(status="ORDER") | Q(status="INSTALLATION") | Q(
-                    status="ACCOUNT"))).distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-
-            'Installation Date': 'installation_date',
-            'AGM': 'customer.agm',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'STC/ap': 'stc_application',
-            'Last amount': 'last_amount_balance_due',
-            'STC': 'balance_due',
-            'Installer': 'installer_amount',
-            'Payment notes': 'last_amount_notes'
 
-        }
+        # Get all requirements in ORDER, INSTALLATION and ACCOUNT status.
+        # The summary covers all of them, the list only shows the first page
+        requirements, next_cursor = stage_page('account', request.user, search_value=search_value)
+        columns = stage_columns('account', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         #   summary_enabled: show summary charts at the top of the view
         #   summary: Contains all aggregated results from models
+        total_bank = AppData.objects.filter(name='total_bank').first()
         context = {
             'requirements': requirements,
             'url_view': 'account-view',
             'columns': columns,
+            'stage': 'account',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'current_tab': 'account-tab',
             'summary_enabled': True,
             'account_search_field_visible': True,
             'search_value': search_value,
             'summary': {
-                'total_bank': AppData.objects.get(name='total_bank').value if AppData.objects.filter(
-                    name='total_bank').exists() else 0,
-                **requirements.aggregate(total_stc=Sum('stc_amount'), total_last_amount=Sum('last_amount'),
-                                         total_installers=Sum('installer_amount')),
-                'total_suppliers': sum(filter(None, [
-                    req.supplier_set.aggregate(total_suppliers=Sum('supplier_amount')).get('total_suppliers') for req in
-                    requirements]))
-            }
+                'total_bank': total_bank.value if total_bank else 0,
+                **stage_requirements('account', request.user, search_value=search_value).account_summary()
+            },
+            **stage_rows_context('account', requirements, search=True),
         }
 
         # Return requirement list in ORDER, INSTALLATION and ACCOUNT status
@@ -2357,8 +1502,7 @@ def account_search(request):
 @permission_required(['customer.account_view'])
 def account_view(request, pk):
     """Returns a customer form in ORDER, INSTALLATION and ACCOUNT status"""
-    customer = Customer.objects.get(id=pk)
-    requirement = Requirement.objects.filter(customer_id=customer.id).first()
+    dossier = customer_dossier(pk, 'credit_card', 'files', 'suppliers')
 
     # Set context.
     # leads, sales_people, roof_types, storeys, electric_powers, payments, installers are default options loaded in Django admin
@@ -2436,18 +1580,14 @@ def account_view(request, pk):
     }
     context = {
         'current_tab': 'account-tab',
-        'leads': Lead.objects.all(),
-        'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-        'roof_types': RoofType.objects.all(),
-        'storeys': Storey.objects.all(),
-        'electric_powers': ElectricPower.objects.all(),
-        'installers': get_user_model().objects.filter(profile__title='installer'),
-        'customer': customer,
-        'requirement': Requirement.objects.filter(customer_id=customer.id).first(),
-        'credit_card': CreditCard.objects.filter(customer_id=customer.id).first(),
-        'files': File.objects.filter(customer_id=customer.id),
-        'suppliers': Supplier.objects.filter(requirement_id=requirement.id),
-        'payments': Payment.objects.all(),
+        'leads': lookup('leads'),
+        'sales_people': lookup('sales_people'),
+        'roof_types': lookup('roof_types'),
+        'storeys': lookup('storeys'),
+        'electric_powers': lookup('electric_powers'),
+        'installers': lookup('installers'),
+        **dossier,
+        'payments': lookup('payments'),
         'required_fields': required_fields,
         'options': {
             'user_created_enabled': True,
@@ -2547,13 +1687,13 @@ def add_customer_via_account(request):
         context = {
                 'created_from_account' : True,
                 'current_tab': 'account-tab',
-                'leads': Lead.objects.all(),
-                'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-                'roof_types': RoofType.objects.all(),
-                'storeys': Storey.objects.all(),
-                'electric_powers': ElectricPower.objects.all(),
-                'installers': get_user_model().objects.filter(profile__title='installer'),
-                'payments': Payment.objects.all(),
+                'leads': lookup('leads'),
+                'sales_people': lookup('sales_people'),
+                'roof_types': lookup('roof_types'),
+                'storeys': lookup('storeys'),
+                'electric_powers': lookup('electric_powers'),
+                'installers': lookup('installers'),
+                'payments': lookup('payments'),
                 'required_fields' : required_fields,
                 'options': {
                     'customer_data_enabled': True,
@@ -2576,16 +1716,17 @@ def add_customer_via_account(request):
         return render(request, 'customer/add_customer_via_account.html',context=context)
 
     elif request.method == 'POST':
-        #checks if the customer name already exists
-        customer_name = request.POST.get('customer_name')
-        agm = request.POST.get('agm') if request.POST.get('agm') else None
-        phone_number = request.POST.get('phone_number')
-        try:
-            customer = Customer.objects.get(customer_name=customer_name,agm=agm,phone_number=phone_number)
-
-            messages.error(request,f'Customer {customer_name} already exists. Please enter new customer')
+        #checks if the customer already exists, see customer/duplicates.py
+        matches = Customer.objects.likely_duplicates(Customer(
+            customer_name=request.POST.get('customer_name'),
+            agm=request.POST.get('agm'),
+            phone_number=request.POST.get('phone_number'),
+            customer_address=request.POST.get('customer_address'),
+            customer_email=request.POST.get('customer_email')))
+        if matches and matches[0][0] >= DUPLICATE_SCORE:
+            messages.error(request,f'Customer {describe(matches[0])} already exists. Please enter new customer')
             return redirect('account-add-customer')
-        except ObjectDoesNotExist:
+        else:
             customer_data = {
                 'creator': request.user,
                 'leads_from_id': request.POST.get('leads_from'),
@@ -2766,6 +1907,10 @@ def add_customer_via_account(request):
                     requirement=requirement, content=request.POST.get('service_note').strip())
                 service_note.save()
 
+            if matches:
+                messages.warning(request, 'Possible duplicate of {}.'.format(
+                    '; '.join(describe(match) for match in matches[:3])))
+
             if 'btn_save' in request.POST:
                 return HttpResponseRedirect('/account')
 
@@ -2778,35 +1923,16 @@ def service_list(request):
     """Returns List of customers in SERVICE"""
     if request.method == 'GET':
         # Get all requirements in SERVICE status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(status="SERVICE") | Q(status="SERVICE_HOME")).distinct().order_by('installation_date')
-        else:
-            requirements = Requirement.objects.filter(
-                (Q(customer__sales_person=request.user) | Q(installer=request.user)) & (
-                        Q(status="SERVICE") | Q(status="SERVICE_HOME"))).distinct().order_by('installation_date')
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Installation Date': 'installation_date',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Address': 'customer.customer_address',
-            'SERIVCE notes': 'service_notes'
-        }
+        requirements, next_cursor = stage_page('service', request.user)
+        columns = stage_columns('service')
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         #   summary_enabled: show summary charts at the top of the view
@@ -2815,10 +1941,13 @@ def service_list(request):
             'requirements': requirements,
             'url_view': 'service-view',
             'columns': columns,
+            'stage': 'service',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'service_search_field_visible': True,
             'current_tab': 'service-tab',
-            'summary_enabled': False
+            'summary_enabled': False,
+            **stage_rows_context('service', requirements),
         }
 
         # Return requirement list in SERVICE status
@@ -2831,48 +1960,18 @@ def service_search(request):
     if request.method == 'POST':
         # get Search Key data from search form
         search_value = request.POST.get('search_value')
-        print("========================")
 
         # Get all requirements in SERVICE status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                Q(status="SERVICE") | Q(status="SERVICE_HOME")).distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name=search_value) |
-                Q(customer__customer_address=search_value) |
-                Q(customer__customer_email=search_value) |
-                Q(customer__phone_number=search_value) |
-                Q(customer__agm=search_value),
-                (Q(customer__sales_person=request.user) | Q(installer=request.user)) & (
-                        Q(status="SERVICE") | Q(status="SERVICE_HOME"))).distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Installation Date': 'installation_date',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Address': 'customer.customer_address',
-            'SERIVCE notes': 'service_notes'
-        }
+        requirements, next_cursor = stage_page('service', request.user, search_value=search_value)
+        columns = stage_columns('service', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         #   summary_enabled: show summary charts at the top of the view
@@ -2881,11 +1980,14 @@ def service_search(request):
             'requirements': requirements,
             'url_view': 'service-view',
             'columns': columns,
+            'stage': 'service',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'service_search_field_visible': True,
             'search_value': search_value,
             'current_tab': 'service-tab',
-            'summary_enabled': False
+            'summary_enabled': False,
+            **stage_rows_context('service', requirements, search=True),
         }
 
         # Return requirement list in SERVICE status
@@ -2896,8 +1998,8 @@ def service_search(request):
 @permission_required(['customer.service_view'])
 def service_view(request, pk):
     """Returns a customer form in SERVICE status"""
-    customer = Customer.objects.get(id=pk)
-    requirement = Requirement.objects.filter(customer_id=customer.id).first()
+    dossier = customer_dossier(pk, 'credit_card', 'files', 'suppliers', 'service_notes')
+    requirement = dossier['requirement']
 
     # Set context.
     # leads, sales_people, roof_types, storeys, electric_powers, payments, installers are default options loaded in Django admin
@@ -2918,10 +2020,8 @@ def service_view(request, pk):
     if requirement.status in ['SERVICE_HOME']:
         context = {
             'current_tab': 'service-tab',
-            'installers': get_user_model().objects.filter(profile__title='installer'),
-            'customer': customer,
-            'requirement': Requirement.objects.filter(customer_id=customer.id).first(),
-            'service_notes': ServiceNote.objects.filter(requirement_id=requirement.id),
+            'installers': lookup('installers'),
+            **dossier,
             'options': {
                 'customer_data_enabled': False,
                 'requirement_data_enabled': False,
@@ -2949,19 +2049,14 @@ def service_view(request, pk):
     elif requirement.status in ['SERVICE']:
         context = {
             'current_tab': 'service-tab',
-            'leads': Lead.objects.all(),
-            'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-            'roof_types': RoofType.objects.all(),
-            'storeys': Storey.objects.all(),
-            'electric_powers': ElectricPower.objects.all(),
-            'installers': get_user_model().objects.filter(profile__title='installer'),
-            'customer': customer,
-            'requirement': Requirement.objects.filter(customer_id=customer.id).first(),
-            'credit_card': CreditCard.objects.filter(customer_id=customer.id).first(),
-            'files': File.objects.filter(customer_id=customer.id),
-            'suppliers': Supplier.objects.filter(requirement_id=requirement.id),
-            'payments': Payment.objects.all(),
-            'service_notes': ServiceNote.objects.filter(requirement_id=requirement.id),
+            'leads': lookup('leads'),
+            'sales_people': lookup('sales_people'),
+            'roof_types': lookup('roof_types'),
+            'storeys': lookup('storeys'),
+            'electric_powers': lookup('electric_powers'),
+            'installers': lookup('installers'),
+            **dossier,
+            'payments': lookup('payments'),
             'options': {
                 'user_created_enabled': True,
                 'customer_data_enabled': True,
@@ -2996,37 +2091,16 @@ def finished_list(request):
     """Returns List of customers in FINISHED and SERVICE"""
     if request.method == 'GET':
         # Get all requirements in FINISHED and SERVICE status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(Q(status="FINISHED") | Q(
-                status="DELIVERED") | Q(status="DELIVERED_HOME")).distinct()
-        else:
-            requirements = Requirement.objects.filter(Q(customer__sales_person=request.user) | Q(
-                installer=request.user), Q(status="FINISHED") | Q(status="DELIVERED") | Q(
-                status="DELIVERED_HOME")).distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Installation Date': 'installation_date',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Email': 'customer.customer_email',
-            'Total amount': 'total_price',
-            'KW': 'kw'
-
-        }
+        requirements, next_cursor = stage_page('finished', request.user)
+        columns = stage_columns('finished')
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         #   summary_enabled: show summary charts at the top of the view
@@ -3035,10 +2109,13 @@ def finished_list(request):
             'requirements': requirements,
             'url_view': 'finished-view',
             'columns': columns,
+            'stage': 'finished',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'finished_search_field_visible': True,
             'current_tab': 'finished-tab',
-            'summary_enabled': False
+            'summary_enabled': False,
+            **stage_rows_context('finished', requirements),
         }
 
         # Return requirement list in FINISHED and SERVICE status
@@ -3052,52 +2129,18 @@ def finished_search(request):
 
         # get Search Key data from search form
         search_value = request.POST.get('search_value')
-        print("========================")
 
         # Get all requirements in FINISHED and SERVICE status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                Q(status="FINISHED") | Q(
-                    status="DELIVERED") | Q(status="DELIVERED_HOME")).distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name=search_value) |
-                Q(customer__customer_address=search_value) |
-                Q(customer__customer_email=search_value) |
-                Q(customer__phone_number=search_value) |
-                Q(customer__agm=search_value),
-                Q(customer__sales_person=request.user) | Q(
-                    installer=request.user), Q(status="FINISHED") | Q(status="DELIVERED") | Q(
-                    status="DELIVERED_HOME")).distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Installation Date': 'installation_date',
-            'Sales': 'customer.sales_person',
-            'AGM': 'customer.agm',
-
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Email': 'customer.customer_email',
-            'Total amount': 'total_price',
-            'KW': 'kw'
-
-        }
+        requirements, next_cursor = stage_page('finished', request.user, search_value=search_value)
+        columns = stage_columns('finished', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         #   summary_enabled: show summary charts at the top of the view
@@ -3106,11 +2149,14 @@ def finished_search(request):
             'requirements': requirements,
             'url_view': 'finished-view',
             'columns': columns,
+            'stage': 'finished',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'finished_search_field_visible': True,
             'search_value': search_value,
             'current_tab': 'finished-tab',
-            'summary_enabled': False
+            'summary_enabled': False,
+            **stage_rows_context('finished', requirements, search=True),
         }
 
         # Return requirement list in FINISHED and SERVICE status
@@ -3121,8 +2167,8 @@ def finished_search(request):
 @permission_required(['customer.finished_view'])
 def finished_view(request, pk):
     """Returns a customer form in FINISHED and SERVICE status"""
-    customer = Customer.objects.get(id=pk)
-    requirement = Requirement.objects.filter(customer_id=customer.id).first()
+    dossier = customer_dossier(pk, 'credit_card', 'files', 'suppliers', 'service_notes')
+    requirement = dossier['requirement']
 
     # Set context.
     # leads, sales_people, roof_types, storeys, electric_powers, payments, installers are default options loaded in Django admin
@@ -3143,10 +2189,8 @@ def finished_view(request, pk):
     if requirement.status in ['DELIVERED_HOME']:
         context = {
             'current_tab': 'finished-tab',
-            'installers': get_user_model().objects.filter(profile__title='installer'),
-            'customer': customer,
-            'requirement': Requirement.objects.filter(customer_id=customer.id).first(),
-            'service_notes': ServiceNote.objects.filter(requirement_id=requirement.id),
+            'installers': lookup('installers'),
+            **dossier,
             'options': {
                 'customer_data_enabled': False,
                 'requirement_data_enabled': False,
@@ -3173,19 +2217,14 @@ def finished_view(request, pk):
     elif requirement.status in ['FINISHED', 'DELIVERED']:
         context = {
             'current_tab': 'finished-tab',
-            'leads': Lead.objects.all(),
-            'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-            'roof_types': RoofType.objects.all(),
-            'storeys': Storey.objects.all(),
-            'electric_powers': ElectricPower.objects.all(),
-            'installers': get_user_model().objects.filter(profile__title='installer'),
-            'customer': customer,
-            'requirement': Requirement.objects.filter(customer_id=customer.id).first(),
-            'credit_card': CreditCard.objects.filter(customer_id=customer.id).first(),
-            'files': File.objects.filter(customer_id=customer.id),
-            'suppliers': Supplier.objects.filter(requirement_id=requirement.id),
-            'payments': Payment.objects.all(),
-            'service_notes': ServiceNote.objects.filter(requirement_id=requirement.id),
+            'leads': lookup('leads'),
+            'sales_people': lookup('sales_people'),
+            'roof_types': lookup('roof_types'),
+            'storeys': lookup('storeys'),
+            'electric_powers': lookup('electric_powers'),
+            'installers': lookup('installers'),
+            **dossier,
+            'payments': lookup('payments'),
             'options': {
                 'user_created_enabled': True,
                 'customer_data_enabled': True,
@@ -1,7 +1,19 @@
 from django.contrib import admin
-from mailserver.models import OutlookServerDetails
+from mailserver.models import MailNotification, OutlookServerDetails, SchedulerLease
 
 # Register your models here.
 @admin.register(OutlookServerDetails)
 class OutlookServerDetailsAdmin(admin.ModelAdmin):
-    list_display = ('user_id','subscription_id','new_message')
\ No newline at end of file
+    list_display = ('user_id','subscription_id','new_message', 'subscription_alive', 'subscription_expires',
+                    'subscription_error')
+
+
+@admin.register(MailNotification)
+class MailNotificationAdmin(admin.ModelAdmin):
+    list_display = ('message_id', 'status', 'attempts', 'customer', 'created_date')
+    list_filter = ('status',)
+
+
+@admin.register(SchedulerLease)
+class SchedulerLeaseAdmin(admin.ModelAdmin):
+    list_display = ('name', 'owner', 'expires')
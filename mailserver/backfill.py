@@ -0,0 +1,170 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from customer.bulk import bulk_create_leads
+from customer.models import Customer
+from mailserver.models import MailNotification, OutlookServerDetails
+from .utilities_dir import scrapper
+from .utilities_dir.graph_client import graph_client
+from .utilities_dir.outlook_utils import _get_token_from_cache, _load_cache
+
+# Import of the leads of the mails already in the inbox, e.g. received while the webhook subscription had lapsed.
+#
+# The inbox is read with a Graph delta query, a page of messages at a time. While a page is fetched the previous one
+# is parsed by a pool of threads and its leads are inserted in bulk, in a transaction per page. The delta link
+# returned with the last page is kept on OutlookServerDetails: the next backfill only reads the messages received or
+# changed since.
+# Every message read is recorded as an IMPORTED MailNotification, so neither a later backfill nor the webhook
+# imports it again. The message ids are unique: recording a message claims it, in the transaction creating its lead,
+# and the messages recorded meanwhile by the webhook are skipped. A lead likely the same as an existing customer, see
+# customer/duplicates.py, is linked to it instead of being created again. The mails without form are skipped.
+
+INBOX_DELTA = "me/mailFolders('Inbox')/messages/delta"
+
+# Messages per page of the delta query
+PAGE_SIZE = 50
+
+WORKERS = getattr(settings, 'MAIL_BACKFILL_WORKERS', 4)
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillError(Exception):
+    '''
+        Raised when the inbox could not be read
+    '''
+
+
+def backfill_mailbox(outlook_cache, full=False, since=None, page_size=PAGE_SIZE, workers=WORKERS):
+    '''
+        Function to import the leads of the mails of a mailbox not imported yet
+        @@Param outlook_cache: OutlookServerDetails of the mailbox
+        @@Param full: read the whole inbox instead of the changes since the last backfill
+        @@Param since: Optional. datetime of the oldest mails to read, when reading the whole inbox
+        @@Param page_size: number of messages per page
+        @@Param workers: number of threads parsing the messages
+        @@Returns dict of counts: messages read, leads created, duplicates of existing customers, already imported
+        @@Raises BackfillError if the inbox could not be read. The pages read before are imported
+    '''
+    result = _get_token_from_cache(_load_cache(outlook_cache), outlook_cache.user_id)
+    if not result or "access_token" not in result:
+        raise BackfillError('No access token: {}'.format(
+            result.get("error_description") if result else 'no account'))
+    token = result["access_token"]
+
+    if outlook_cache.delta_link and not full:
+        url, params = outlook_cache.delta_link, None
+    else:
+        url, params = INBOX_DELTA, {"$select": "id,receivedDateTime,body"}
+        if since is not None:
+            params["$filter"] = "receivedDateTime ge {}".format(since.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    headers = {"Prefer": "odata.maxpagesize={}".format(page_size)}
+
+    counts = dict.fromkeys(('messages', 'leads', 'duplicates', 'known'), 0)
+    delta_link, error = None, None
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mail-backfill') as pool:
+        parsing = None
+        while url:
+            page = graph_client().call("GET", url, token, params=params, headers=headers)
+            # The links to the following pages have the parameters
+            params = None
+            if "error" in page:
+                error = page["error"]
+                break
+            messages = [message for message in page.get("value", []) if "@removed" not in message]
+            if parsing is not None:
+                _add_counts(counts, import_messages(outlook_cache, *parsing))
+            parsing = (messages, [pool.submit(parse_message, message) for message in messages])
+            url = page.get("@odata.nextLink")
+            delta_link = page.get("@odata.deltaLink")
+        if parsing is not None:
+            _add_counts(counts, import_messages(outlook_cache, *parsing))
+
+    if error is not None:
+        raise BackfillError('Inbox not read: {}'.format(error.get("message") or error.get("code")))
+    if delta_link:
+        OutlookServerDetails.objects.filter(pk=outlook_cache.pk).update(delta_link=delta_link)
+        outlook_cache.delta_link = delta_link
+    return counts
+
+
+def _add_counts(counts, page_counts):
+    for key, count in page_counts.items():
+        counts[key] += count
+
+
+def parse_message(message):
+    '''
+        Function to read the customer details of the form of a message. Runs in a worker thread
+        @@Returns Customer fields, None if the message has no form
+    '''
+    try:
+        fields = scrapper.parse_form((message.get("body") or {}).get("content") or '')
+        if fields:
+            return scrapper.customer_details(fields, message)
+    except Exception:
+        logger.exception('Message %s not parsed', message.get("id"))
+    return None
+
+
+def import_messages(outlook_cache, messages, parsing):
+    '''
+        Function to create the leads of a page of messages and record the messages as imported
+        @@Param outlook_cache: OutlookServerDetails of the mailbox
+        @@Param messages: messages of the page
+        @@Param parsing: futures of parse_message for the messages
+        @@Returns dict of counts, see backfill_mailbox
+    '''
+    details = [future.result() for future in parsing]
+    # Message ids are unique, whatever the subscription they were notified by
+    known = set(MailNotification.objects.filter(
+        message_id__in=[message["id"] for message in messages]).values_list('message_id', flat=True))
+    creator_id = User.objects.filter(id=outlook_cache.user_id).values_list('id', flat=True).first()
+
+    with transaction.atomic():
+        # Claim the messages before creating their leads: the ones recorded since, e.g. by the webhook, are skipped
+        claimed = []
+        for message, customer_details in zip(messages, details):
+            if message["id"] in known:
+                continue
+            try:
+                with transaction.atomic():
+                    notification = MailNotification.objects.create(
+                        subscription_id=outlook_cache.subscription_id or '', message_id=message["id"],
+                        status='IMPORTED')
+            except IntegrityError:
+                known.add(message["id"])
+                continue
+            if customer_details:
+                claimed.append((notification, Customer(creator_id=creator_id, **customer_details)))
+
+        leads = [lead for notification, lead in claimed]
+        for lead in leads:
+            lead.update_duplicate_keys()
+        # Existing customers likely the same as a lead, and the new ones of the previous leads of the page
+        duplicates = Customer.objects.duplicate_candidates(leads)
+        customers, new_customers = [], []
+        for lead in leads:
+            match = duplicates.duplicate(lead)
+            if match is None:
+                duplicates.add(lead)
+                new_customers.append(lead)
+            customers.append(match[1] if match else lead)
+
+        bulk_create_leads(new_customers)
+        for (notification, lead), customer in zip(claimed, customers):
+            notification.customer = customer
+        MailNotification.objects.bulk_update([notification for notification, lead in claimed], ['customer'])
+        if new_customers:
+            OutlookServerDetails.objects.filter(pk=outlook_cache.pk).update(new_message=True)
+
+    return {
+        'messages': len(messages),
+        'leads': len(new_customers),
+        'duplicates': len(leads) - len(new_customers),
+        'known': len(known),
+    }
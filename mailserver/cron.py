@@ -1,25 +1,35 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from .models import OutlookServerDetails
-from .utilities_dir import outlook_utils as utils
-from .utilities_dir.outlook_requests import refresh_subscription_for_notification
+from apscheduler.schedulers.blocking import BlockingScheduler
+from django.utils import timezone
+from .ingestion import process_due_notifications
+from .renewal import INTERVAL, LEASE_NAME, acquire_lease, lease_owner, release_lease, renew_due_subscriptions
 
-def my_scheduled_job():
+
+def run_scheduled_jobs(owner):
     '''
-      Function to update all the subscriptions of the webhooks
+      Function to run the background jobs of the mailserver, when the current process is the leader
+      @@Param owner: name of the current process, see renewal.lease_owner()
+      @@Returns whether the jobs were run
     '''
-    subscriptions = OutlookServerDetails.objects.exclude(
-        subscription_id__isnull=True)
-    for subscription in subscriptions:
-        cache = utils._load_cache(subscription)
-        result = utils._get_token_from_cache(cache, subscription.user_id)
-        if "access_token" in result:
-            response = refresh_subscription_for_notification(result["access_token"],subscription.subscription_id)
+    if not acquire_lease(LEASE_NAME, owner):
+        return False
+    # The lease is extended while the renewals run
+    renew_due_subscriptions(lease=(LEASE_NAME, owner))
+    # Retries of the mail notifications, see ingestion.py
+    process_due_notifications()
+    return True
 
 
 def start():
     '''
-      Function to make a background job which is called from app.py file
+      Function to run the background jobs until the process is stopped, called by the run_mail_scheduler command
     '''
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(my_scheduled_job, 'interval', days=1)
-    scheduler.start()
+    owner = lease_owner()
+    scheduler = BlockingScheduler()
+    scheduler.add_job(run_scheduled_jobs, 'interval', seconds=INTERVAL.total_seconds(), args=[owner],
+                      next_run_time=timezone.now())
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        release_lease(LEASE_NAME, owner)
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import connection
+from django.db.models import Max
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+
+from mailserver.models import MailNotification
+
+# New leads pushed to the browsers with server-sent events, instead of each tab polling for them.
+#
+# The events are the customers created from the mails by mailserver/ingestion.py, sent to the user of the mailbox.
+# The id of an event is the customer id: a browser reconnecting sends the last one it received and gets the leads
+# created since. Under ASGI, solarCRM/asgi.py routes EVENTS_PATH to lead_events_application, which keeps the
+# connections open. A single task per process looks for new leads, every POLL_INTERVAL seconds or as soon as a lead
+# is created by the process, and sends them to the connections. Under WSGI the lead_events view of
+# mailserver/views.py answers the same url with the leads created so far, and the browser reconnects a minute later.
+# The leads after an id are the customers with a greater id: this relies on the customer ids being committed in
+# increasing order, true with SQLite, which commits a transaction at a time. With a database committing concurrent
+# transactions, a lead whose id was assigned before another one's but committed after it would never be sent.
+
+EVENTS_PATH = '/mailserver/events'
+
+# Seconds between two looks for the leads created by the other processes
+POLL_INTERVAL = getattr(settings, 'LEAD_EVENTS_POLL_SECONDS', 5)
+
+# Seconds between two comments sent on an idle connection, so proxies don't close it
+KEEPALIVE = 15
+
+# Milliseconds the browser waits before reconnecting
+RECONNECT_DELAY = 5000
+
+# Maximum number of leads read at once
+MAX_EVENTS = 100
+
+logger = logging.getLogger(__name__)
+
+
+def latest_lead_id():
+    '''
+        Function to get the id of the last customer created from a mail, 0 if none
+    '''
+    return MailNotification.objects.aggregate(latest=Max('customer_id'))['latest'] or 0
+
+
+def new_leads(after_id, user_id=None):
+    '''
+        Function to get the customers created from a mail after a customer, in commit order on SQLite only
+        @@Param after_id: id of the last customer already sent
+        @@Param user_id: Optional. Only the customers created from the mailbox of this user
+        @@Returns list of (customer id, user id of the mailbox), by customer id
+    '''
+    leads = MailNotification.objects.filter(status='DONE', customer_id__gt=after_id)
+    if user_id is not None:
+        leads = leads.filter(customer__creator_id=user_id)
+    return list(leads.order_by('customer_id').values_list('customer_id', 'customer__creator_id')[:MAX_EVENTS])
+
+
+def format_event(customer_id):
+    '''
+        Function to format the event of a new lead
+    '''
+    return 'id: {}\nevent: new-lead\ndata: {}\n\n'.format(customer_id, json.dumps({'customer_id': customer_id}))
+
+
+def format_last_event_id(customer_id):
+    '''
+        Function to format the id the browser sends back when reconnecting, without event
+    '''
+    return 'id: {}\n\n'.format(customer_id)
+
+
+def parse_last_event_id(value):
+    '''
+        Function to read the Last-Event-ID header sent by a reconnecting browser
+        @@Returns the customer id, None if missing or invalid
+    '''
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+class LeadEventBroker:
+    '''
+        Sends the new leads to the connections of the process, looked for by a single task
+    '''
+
+    def __init__(self):
+        # User id of each connection, by queue of the connection
+        self.subscribers = {}
+        self.loop = None
+        self.wake = None
+        self.task = None
+
+    def subscribe(self, user_id, after_id):
+        '''
+            Function to start sending the new leads of a user to a connection
+            @@Param user_id: id of the user
+            @@Param after_id: id of the last customer sent to the connection
+            @@Returns the queue the customer ids are put in
+        '''
+        queue = asyncio.Queue()
+        self.subscribers[queue] = user_id
+        if self.task is None or self.task.done():
+            self.loop = asyncio.get_event_loop()
+            self.wake = asyncio.Event()
+            self.task = self.loop.create_task(self.poll(after_id))
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.pop(queue, None)
+
+    def publish(self):
+        '''
+            Function to look for new leads right away. Can be called from any thread
+        '''
+        loop, wake = self.loop, self.wake
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    async def poll(self, last_id):
+        '''
+            Task looking for new leads while there are connections
+            @@Param last_id: id of the last customer already sent
+        '''
+        while self.subscribers:
+            try:
+                leads = await _database(new_leads, last_id)
+            except Exception:
+                logger.exception('Lead events failed')
+                leads = []
+            for customer_id, user_id in leads:
+                last_id = customer_id
+                for queue, subscriber_id in list(self.subscribers.items()):
+                    if subscriber_id == user_id:
+                        queue.put_nowait(customer_id)
+            if len(leads) == MAX_EVENTS:
+                continue
+            try:
+                await asyncio.wait_for(self.wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+
+broker = LeadEventBroker()
+
+
+async def _database(function, *args):
+    '''
+        Function to run a database query from the event loop, in a thread
+    '''
+    def run():
+        try:
+            return function(*args)
+        finally:
+            connection.close()
+    return await sync_to_async(run)()
+
+
+def _scope_user(scope):
+    '''
+        Function to get the user logged in by the session cookie of an ASGI request
+    '''
+    headers = dict(scope.get('headers') or [])
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+    request = HttpRequest()
+    request.COOKIES = cookies
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(
+        cookies.get(settings.SESSION_COOKIE_NAME))
+    user = get_user(request)
+    if user.is_authenticated and user.has_perm('mailserver.mailserver_view'):
+        return user
+    return None
+
+
+async def lead_events_application(scope, receive, send):
+    '''
+        ASGI application sending the new leads of the user as server-sent events, until the browser disconnects
+    '''
+    user = await _database(_scope_user, scope)
+    if user is None:
+        await send({'type': 'http.response.start', 'status': 403, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Forbidden'})
+        return
+
+    body = 'retry: {}\n\n'.format(RECONNECT_DELAY)
+    sent_id = parse_last_event_id(dict(scope.get('headers') or []).get(b'last-event-id', b'').decode('latin-1'))
+    if sent_id is None:
+        sent_id = await _database(latest_lead_id)
+        body += format_last_event_id(sent_id)
+
+    queue = broker.subscribe(user.pk, sent_id)
+    disconnected = asyncio.ensure_future(_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            # Don't let nginx buffer the events
+            (b'x-accel-buffering', b'no'),
+        ]})
+        # Leads created before subscribing, the following ones are put in the queue
+        for customer_id, user_id in await _database(new_leads, sent_id, user.pk):
+            body += format_event(customer_id)
+            sent_id = customer_id
+        await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+
+        while not disconnected.done():
+            lead = asyncio.ensure_future(queue.get())
+            done, pending = await asyncio.wait({lead, disconnected}, timeout=KEEPALIVE,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if lead in done:
+                customer_id = lead.result()
+                if customer_id <= sent_id:
+                    continue
+                body = format_event(customer_id)
+                sent_id = customer_id
+            else:
+                lead.cancel()
+                if disconnected.done():
+                    break
+                body = ': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+    finally:
+        broker.unsubscribe(queue)
+        disconnected.cancel()
+
+
+async def _disconnect(receive):
+    '''
+        Function returning when the browser disconnects
+    '''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
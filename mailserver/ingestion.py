@@ -0,0 +1,239 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from customer.models import CreditCard, Customer, Requirement
+from mailserver import events
+from mailserver.models import MailNotification, OutlookServerDetails
+from .utilities_dir import outlook_requests, scrapper
+from .utilities_dir.graph_client import BATCH_SIZE
+from .utilities_dir.outlook_utils import _get_outlook_cache_for_subscription_id, _get_token_from_cache
+
+# Mails notified by the outlook webhook, turned into customers in the background.
+#
+# The webhook only records a MailNotification for each message of the notification and answers, Graph expects an
+# answer within seconds. A pool of worker threads then fetches the messages, up to BATCH_SIZE messages of a mailbox
+# in one $batch request, scraps the form of each one and creates the customer. A message is recorded once, the
+# message id is unique: the notifications Graph sends again, or sends for every update of a message or for another
+# subscription of the mailbox, and the backfill of the mailbox never create the customer twice, whatever the
+# process. A worker claims a notification by moving it to RUNNING, and marks it DONE in the transaction creating
+# the customer, only if it still holds it. A lead likely the same as an existing customer, see
+# customer/duplicates.py, is linked to it instead of creating another one.
+# Failed attempts are tried again later, waiting twice as long after each failure, up to MAX_ATTEMPTS attempts.
+# process_due_notifications() is run every minute by mailserver/cron.py to start them, and to start again the
+# notifications left running by a stopped server.
+
+WORKERS = getattr(settings, 'MAIL_NOTIFICATION_WORKERS', 4)
+
+MAX_ATTEMPTS = getattr(settings, 'MAIL_NOTIFICATION_MAX_ATTEMPTS', 5)
+
+# Wait before the second attempt, doubled for each following attempt
+RETRY_DELAY = timedelta(minutes=1)
+
+# A running notification not updated for this long is considered lost and started again
+STALE_AFTER = timedelta(minutes=getattr(settings, 'MAIL_NOTIFICATION_STALE_MINUTES', 10))
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='mail-notification')
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionError(Exception):
+    '''
+        Raised when a notification can't be processed and trying again won't help
+    '''
+
+
+def enqueue_notifications(notification):
+    '''
+        Function to record the messages of a webhook notification and start processing them
+        @@Param notification: decoded body of the webhook request, with the list of notified messages in "value"
+        @@Returns the number of messages not recorded before
+    '''
+    messages = {}
+    for value in notification.get("value", []):
+        subscription_id = value.get("subscriptionId")
+        message_id = value.get("resourceData", {}).get("id")
+        if subscription_id and message_id:
+            messages.setdefault(message_id, subscription_id)
+    if not messages:
+        return 0
+
+    queued = MailNotification.objects.filter(message_id__in=messages)
+    known = set(queued.values_list('message_id', flat=True))
+    new_messages = [MailNotification(subscription_id=subscription_id, message_id=message_id)
+                    for message_id, subscription_id in messages.items() if message_id not in known]
+    # Conflicts are the same message recorded meanwhile by another request or the backfill, which creates its lead
+    MailNotification.objects.bulk_create(new_messages, ignore_conflicts=True)
+
+    pending = list(queued.filter(status='PENDING').values_list('pk', 'subscription_id'))
+    # The workers read the notifications from the database, wait for the request transaction if any
+    transaction.on_commit(lambda: _submit(pending))
+    return len(new_messages)
+
+
+def _submit(notifications):
+    '''
+        Function to start processing notifications, by groups of messages of the same subscription fetched together
+        @@Param notifications: list of (MailNotification id, subscription id)
+    '''
+    by_subscription = {}
+    for pk, subscription_id in notifications:
+        by_subscription.setdefault(subscription_id, []).append(pk)
+    for subscription_id, pks in by_subscription.items():
+        for start in range(0, len(pks), BATCH_SIZE):
+            _executor.submit(process_notifications, subscription_id, pks[start:start + BATCH_SIZE])
+
+
+def process_due_notifications():
+    '''
+        Function to start the pending notifications due for an attempt, after starting again the lost ones
+    '''
+    now = timezone.now()
+    MailNotification.objects.filter(status='RUNNING', updated_date__lt=now - STALE_AFTER).update(
+        status='PENDING', next_attempt=now, updated_date=now)
+    _submit(MailNotification.objects.filter(status='PENDING', next_attempt__lte=now).values_list(
+        'pk', 'subscription_id'))
+
+
+def process_notifications(subscription_id, pks):
+    '''
+        Function to create the customers of notified messages of a mailbox. Runs in a worker thread
+        @@Param subscription_id: webhook subscription id of the mailbox
+        @@Param pks: MailNotification ids
+    '''
+    try:
+        now = timezone.now()
+        # Claim the notifications, so a single worker processes each one even if it was submitted twice
+        claimed = [pk for pk in pks if MailNotification.objects.filter(
+            pk=pk, status='PENDING', next_attempt__lte=now).update(
+            status='RUNNING', attempts=F('attempts') + 1, updated_date=now)]
+        notifications = list(MailNotification.objects.filter(pk__in=claimed).order_by('id'))
+        if not notifications:
+            return
+
+        try:
+            outlook_cache, token = _mailbox(subscription_id)
+            mails = outlook_requests.fetch_messages_by_message_ids(
+                [notification.message_id for notification in notifications], token)
+        except Exception as e:
+            for notification in notifications:
+                _failed(notification, e)
+            return
+
+        for notification in notifications:
+            try:
+                ingest_mail(notification, mails[notification.message_id], outlook_cache)
+            except Exception as e:
+                _failed(notification, e)
+    finally:
+        # Worker threads open their own connection, don't leave it open between notifications
+        connection.close()
+
+
+def _failed(notification, error):
+    '''
+        Function to record a failed attempt, and when to try again
+    '''
+    logger.warning('Mail notification %s failed: %s', notification.pk, error,
+                   exc_info=None if isinstance(error, IngestionError) else error)
+    notification.error = str(error)
+    if isinstance(error, IngestionError) or notification.attempts >= MAX_ATTEMPTS:
+        notification.status = 'FAILED'
+    else:
+        notification.status = 'PENDING'
+        notification.next_attempt = timezone.now() + RETRY_DELAY * 2 ** (notification.attempts - 1)
+    notification.save(update_fields=['status', 'next_attempt', 'error', 'updated_date'])
+
+
+def _mailbox(subscription_id):
+    '''
+        Function to get the mailbox of a subscription and an access token to read it
+        @@Returns (OutlookServerDetails, access token)
+    '''
+    cache, outlook_cache = _get_outlook_cache_for_subscription_id(subscription_id)
+    if outlook_cache is None:
+        raise IngestionError('Unknown subscription {}'.format(subscription_id))
+
+    result = _get_token_from_cache(cache, outlook_cache.user_id)
+    if not result or "access_token" not in result:
+        raise Exception('No access token: {}'.format(result.get("error_description") if result else 'no account'))
+    return outlook_cache, result["access_token"]
+
+
+def ingest_mail(notification, mail, outlook_cache):
+    '''
+        Function to create the customer of the fetched message of a notification
+        @@Param notification: claimed MailNotification
+        @@Param mail: message fetched from Graph, or a Graph error
+        @@Param outlook_cache: OutlookServerDetails of the mailbox
+    '''
+    if mail and mail.get("error", {}).get("code") == "ErrorItemNotFound":
+        raise IngestionError('Message deleted')
+    if not mail or "error" in mail:
+        raise Exception('Message not fetched: {}'.format(mail.get("error") if mail else 'no response'))
+
+    customer_details = scrapper.scrap_customer_info_from_form(mail)
+    # Read before the transaction: SQLite fails a transaction that has read and then writes while others write
+    creator = User.objects.filter(id=outlook_cache.user_id).first()
+    duplicate = existing_customer(customer_details) if customer_details else None
+    # The customer and the notification are saved together, a notification done has its customer
+    with transaction.atomic():
+        # Written first, taking the write lock of SQLite before the transaction reads. A notification started again
+        # by another worker meanwhile, see STALE_AFTER, is left to it
+        claim = MailNotification.objects.filter(pk=notification.pk, status='RUNNING', attempts=notification.attempts)
+        if not claim.update(status='DONE', error='', updated_date=timezone.now()):
+            logger.warning('Mail notification %s taken over by another worker', notification.pk)
+            return
+        if duplicate is not None:
+            notification.customer = duplicate
+        elif customer_details:
+            notification.customer = create_customer(customer_details, creator, outlook_cache)
+        notification.status = 'DONE'
+        notification.error = ''
+        if notification.customer_id:
+            notification.save(update_fields=['customer'])
+    if notification.customer_id and duplicate is None:
+        # Send the new lead to the browsers connected to this process now, see events.py
+        events.broker.publish()
+
+
+def existing_customer(customer_details):
+    '''
+        Function to get the customer a lead is likely the same as, e.g. the form sent twice. See
+        customer/duplicates.py
+        @@Param customer_details: Customer fields
+        @@Returns the customer, None if the lead is a new customer
+    '''
+    customer = Customer(**customer_details)
+    customer.update_duplicate_keys()
+    match = Customer.objects.duplicate_candidates([customer]).duplicate(customer)
+    return match[1] if match else None
+
+
+def create_customer(customer_details, creator, outlook_cache):
+    '''
+        Function to create a new lead from the details scrapped from a form mail
+        @@Param customer_details: Customer fields
+        @@Param creator: User of the mailbox. None if deleted
+        @@Param outlook_cache: OutlookServerDetails of the mailbox
+        @@Returns the new customer
+    '''
+    if creator is not None:
+        customer_details["creator"] = creator
+
+    new_customer = Customer(**customer_details)
+    new_customer.save()
+    requirement = Requirement(customer=new_customer, status="CREATED")
+    requirement.save()
+    credit_card = CreditCard(customer=new_customer)
+    credit_card.save()
+    # update() keeps the token cache saved meanwhile by another thread
+    OutlookServerDetails.objects.filter(pk=outlook_cache.pk).update(new_message=True)
+    return new_customer
@@ -0,0 +1,52 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mailserver.backfill import PAGE_SIZE, WORKERS, BackfillError, backfill_mailbox
+from mailserver.models import OutlookServerDetails
+
+
+class Command(BaseCommand):
+    help = ('Imports the leads of the mails of the outlook inboxes that were not imported yet, e.g. received while '
+            'the webhook subscription had lapsed. Reads the changes since the last backfill, or the whole inbox the '
+            'first time')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help='Only the mailbox of this user. Default: every mailbox')
+        parser.add_argument('--full', action='store_true',
+                            help='Read the whole inbox instead of the changes since the last backfill')
+        parser.add_argument('--since', help='With --full, oldest day of the mails to read, as YYYY-MM-DD')
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Messages per page read from Graph')
+        parser.add_argument('--workers', type=int, default=WORKERS, help='Threads parsing the messages')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be a day as YYYY-MM-DD')
+
+        mailboxes = OutlookServerDetails.objects.exclude(token_cache__isnull=True).exclude(token_cache='')
+        if options['user_id'] is not None:
+            mailboxes = mailboxes.filter(user_id=options['user_id'])
+        if not mailboxes:
+            raise CommandError('No mailbox signed in')
+
+        failed = False
+        for outlook_cache in mailboxes.order_by('id'):
+            start = time.perf_counter()
+            try:
+                counts = backfill_mailbox(outlook_cache, full=options['full'] or since is not None, since=since,
+                                          page_size=options['page_size'], workers=options['workers'])
+            except BackfillError as e:
+                self.stderr.write('Mailbox of user {}: {}'.format(outlook_cache.user_id, e))
+                failed = True
+                continue
+            self.stdout.write(
+                'Mailbox of user {}: {messages} messages read, {leads} leads created, {duplicates} duplicates of '
+                'existing customers, {known} already imported in {seconds:.1f}s'.format(
+                    outlook_cache.user_id, seconds=time.perf_counter() - start, **counts))
+        if failed:
+            raise CommandError('Some mailboxes were not backfilled')
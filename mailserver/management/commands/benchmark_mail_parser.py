@@ -0,0 +1,53 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mailserver.utilities_dir.scrapper import PARSERS
+
+# Saved Graph messages of web form mails, with large signatures and quoted replies, and of a mail without form
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                      'benchmark_mails')
+
+
+class Command(BaseCommand):
+    help = ('Shows the time taken by each available parser of mailserver/utilities_dir/scrapper.py to read the form '
+            'fields of saved mails, and checks that the parsers read the same fields')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=CORPUS,
+                            help='Folder of the mails, saved as the JSON messages returned by Graph')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of runs of each parser, the best one is kept')
+
+    def handle(self, *args, **options):
+        names = sorted(name for name in os.listdir(options['corpus']) if name.endswith('.json'))
+        if not names:
+            raise CommandError('No mail in {}'.format(options['corpus']))
+        mails = []
+        for name in names:
+            with open(os.path.join(options['corpus'], name)) as f:
+                mails.append((name, json.load(f)["body"]["content"]))
+
+        totals = dict.fromkeys(PARSERS, 0)
+        for name, content in mails:
+            self.stdout.write(self.style.MIGRATE_HEADING('{} ({} KB)'.format(name, len(content) // 1024)))
+            results = {}
+            for parser, parse in PARSERS.items():
+                duration, results[parser] = measure(parse, content, options['repeat'])
+                totals[parser] += duration
+                self.stdout.write('  {:<8}{:8.2f} ms  {} fields'.format(parser, duration * 1000, len(results[parser])))
+            if len({json.dumps(fields, sort_keys=True) for fields in results.values()}) > 1:
+                self.stdout.write(self.style.WARNING('  The parsers read different fields: {}'.format(results)))
+        self.stdout.write(self.style.SUCCESS('Total: ' + ', '.join(
+            '{} {:.2f} ms'.format(parser, duration * 1000) for parser, duration in totals.items())))
+
+
+def measure(parse, content, repeat):
+    """Returns (duration in seconds of the fastest of repeat runs of parse on content, fields read)"""
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fields = parse(content)
+        durations.append(time.perf_counter() - start)
+    return min(durations), fields
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from mailserver import cron
+from mailserver.renewal import LEASE_NAME, lease_owner, release_lease
+
+
+class Command(BaseCommand):
+    help = ('Runs the background jobs of the mail server: renewal of the webhook subscriptions and retries of the '
+            'mail notifications. Several schedulers can run, a single one runs the jobs at a time')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs once, if no other scheduler is running them, and exit')
+
+    def handle(self, *args, **options):
+        if not options['once']:
+            cron.start()
+            return
+
+        owner = lease_owner()
+        try:
+            ran = cron.run_scheduled_jobs(owner)
+        finally:
+            release_lease(LEASE_NAME, owner)
+        self.stdout.write('Jobs run' if ran else 'Jobs running in another scheduler, skipped')
@@ -0,0 +1,35 @@
+# Generated by Django 3.0.6 on 2026-10-18 19:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0060_stage_list_indexes'),
+        ('mailserver', '0002_auto_20200519_1601'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('subscription_id', models.CharField(max_length=200)),
+                ('message_id', models.CharField(max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('error', models.TextField(blank=True)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='customer.Customer')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='mailnotification',
+            index=models.Index(fields=['status', 'next_attempt'], name='mailserver__status_1a9763_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailserver', '0003_mailnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outlookserverdetails',
+            name='subscription_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outlookserverdetails',
+            name='subscription_renew_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outlookserverdetails',
+            name='subscription_renewed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outlookserverdetails',
+            name='subscription_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('owner', models.CharField(max_length=200)),
+                ('expires', models.DateTimeField()),
+            ],
+        ),
+    ]
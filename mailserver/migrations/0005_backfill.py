@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailserver', '0004_subscription_renewal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outlookserverdetails',
+            name='delta_link',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='mailnotification',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed'), ('IMPORTED', 'Imported')], default='PENDING', max_length=20),
+        ),
+    ]
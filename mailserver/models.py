@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
@@ -11,6 +12,13 @@ class OutlookServerDetails(models.Model):
     token_cache = models.TextField(max_length=10000, blank=True, null=True)
     token_alive = models.BooleanField(default=False, blank=True)
     new_message = models.BooleanField(default=False, blank=True)
+    # Renewal of the webhook subscription, see mailserver/renewal.py
+    subscription_expires = models.DateTimeField(blank=True, null=True)
+    subscription_renew_at = models.DateTimeField(blank=True, null=True)
+    subscription_renewed = models.DateTimeField(blank=True, null=True)
+    subscription_error = models.TextField(blank=True, default='')
+    # Graph delta link returned by the last backfill of the inbox, see mailserver/backfill.py
+    delta_link = models.TextField(blank=True, default='')
 
     def __str__(self):
         return self.subscription_id if self.subscription_id else ''
@@ -19,3 +27,55 @@ class OutlookServerDetails(models.Model):
         permissions = [
             ("mailserver_view", "Can view the mailserver details page"),
         ]
+
+
+MAIL_NOTIFICATION_STATUS = [
+    ('PENDING', 'Pending'),
+    ('RUNNING', 'Running'),
+    ('DONE', 'Done'),
+    ('FAILED', 'Failed'),
+    # Recorded by the backfill of the mailbox, see mailserver/backfill.py
+    ('IMPORTED', 'Imported'),
+]
+
+
+class MailNotification(models.Model):
+    '''
+        New mail notification received by the outlook webhook, processed in the background by
+        mailserver/ingestion.py. A message is recorded once, whatever the number of notifications received
+        for it and the subscriptions they came from: recording it claims the creation of its lead, by the
+        webhook or by the backfill.
+    '''
+    created_date = models.DateTimeField(auto_now_add=True)
+    updated_date = models.DateTimeField(auto_now=True)
+    subscription_id = models.CharField(max_length=200)
+    # Graph message ids are unique across mailboxes
+    message_id = models.CharField(max_length=255, unique=True)
+    status = models.CharField(
+        max_length=20, choices=MAIL_NOTIFICATION_STATUS, default='PENDING')
+    # Number of processing attempts, and when to try again after a failure
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    # Customer created from the mail. None if the mail is not a form mail
+    customer = models.ForeignKey(
+        'customer.Customer', on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return '{} {}'.format(self.message_id, self.status)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+
+
+class SchedulerLease(models.Model):
+    '''
+        Lease of a background task that a single process runs at a time, see mailserver/renewal.py.
+        The process holding the lease extends it while running, another process takes it once expired.
+    '''
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=200)
+    expires = models.DateTimeField()
+
+    def __str__(self):
+        return '{} {}'.format(self.name, self.owner)
@@ -0,0 +1,168 @@
+import logging
+import os
+import socket
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from mailserver.models import OutlookServerDetails, SchedulerLease
+from .utilities_dir import outlook_requests, outlook_utils
+
+# Renewal of the webhook subscriptions of the outlook mailboxes.
+#
+# Graph deletes a subscription when it expires, two days after it was created or renewed. Each subscription is
+# renewed RENEW_BEFORE its expirationDateTime, up to RENEWAL_WORKERS at a time. Failed renewals are tried again after
+# RETRY_DELAY, and a subscription already deleted by Graph is created again. The outcome of the last renewal is
+# recorded on OutlookServerDetails.
+# The renewals, like the other background jobs of mailserver/cron.py, are run by a single process: the one holding
+# the SchedulerLease named LEASE_NAME. Several `manage.py run_mail_scheduler` can run, the others take over the lease
+# once the leader stops extending it. The leader keeps extending it every INTERVAL while the renewals run, however long
+# they take, and stops starting renewals once it lost the lease.
+
+LEASE_NAME = 'mail-scheduler'
+
+# The leader runs the jobs every INTERVAL and extends its lease each time, for longer than INTERVAL
+INTERVAL = timedelta(seconds=getattr(settings, 'MAIL_SCHEDULER_INTERVAL_SECONDS', 60))
+LEASE_DURATION = 3 * INTERVAL
+
+RENEW_BEFORE = timedelta(hours=getattr(settings, 'SUBSCRIPTION_RENEW_BEFORE_HOURS', 12))
+
+RENEWAL_WORKERS = getattr(settings, 'SUBSCRIPTION_RENEWAL_WORKERS', 4)
+
+RETRY_DELAY = timedelta(minutes=10)
+
+_executor = ThreadPoolExecutor(max_workers=RENEWAL_WORKERS, thread_name_prefix='subscription-renewal')
+
+logger = logging.getLogger(__name__)
+
+
+def lease_owner():
+    '''
+        Function to get a name for the current process, unique among the processes of all hosts
+    '''
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def acquire_lease(name, owner, duration=LEASE_DURATION):
+    '''
+        Function to take or extend a lease
+        @@Param name: name of the lease
+        @@Param owner: name of the process, see lease_owner()
+        @@Param duration: time the lease is held for without being extended
+        @@Returns whether owner holds the lease
+    '''
+    now = timezone.now()
+    if SchedulerLease.objects.filter(Q(owner=owner) | Q(expires__lte=now), name=name).update(
+            owner=owner, expires=now + duration):
+        return True
+    try:
+        with transaction.atomic():
+            SchedulerLease.objects.create(name=name, owner=owner, expires=now + duration)
+    except IntegrityError:
+        # Held by another process
+        return False
+    return True
+
+
+def release_lease(name, owner):
+    '''
+        Function to give up a lease, so another process can take it right away
+    '''
+    SchedulerLease.objects.filter(name=name, owner=owner).delete()
+
+
+def renew_due_subscriptions(lease=None):
+    '''
+        Function to renew the subscriptions due for renewal, and wait for the renewals
+        @@Param lease: optional. (name, owner) of the lease held by the current process, extended every INTERVAL
+        while the renewals run. The renewals not started yet are cancelled if the lease is lost
+        @@Returns the number of subscriptions renewed, or tried to
+    '''
+    due = OutlookServerDetails.objects.exclude(subscription_id__isnull=True).exclude(subscription_id='').filter(
+        Q(subscription_renew_at__isnull=True) | Q(subscription_renew_at__lte=timezone.now()))
+    pending = [_executor.submit(renew_subscription, pk) for pk in due.values_list('pk', flat=True)]
+    started = len(pending)
+    while pending:
+        pending = wait(pending, timeout=INTERVAL.total_seconds()).not_done
+        if pending and lease and not acquire_lease(*lease):
+            cancelled = sum(future.cancel() for future in pending)
+            logger.warning('Lease %s lost, %s subscription renewals cancelled', lease[0], cancelled)
+            started -= cancelled
+            break
+    return started
+
+
+def renew_subscription(pk):
+    '''
+        Function to renew the subscription of a mailbox and record the outcome. Runs in a worker thread
+        @@Param pk: OutlookServerDetails id
+    '''
+    try:
+        outlook_cache = OutlookServerDetails.objects.filter(pk=pk).first()
+        if outlook_cache is None or not outlook_cache.subscription_id:
+            return
+        now = timezone.now()
+        try:
+            fields = _renew(outlook_cache)
+        except Exception as e:
+            logger.warning('Subscription renewal of %s failed: %s', outlook_cache.subscription_id, e)
+            fields = {
+                'subscription_alive': bool(outlook_cache.subscription_expires and
+                                           outlook_cache.subscription_expires > now),
+                'subscription_renew_at': now + RETRY_DELAY,
+                'subscription_error': str(e),
+            }
+        # update() keeps the token cache and new_message saved meanwhile by the other threads
+        OutlookServerDetails.objects.filter(pk=pk).update(subscription_renewed=now, **fields)
+    finally:
+        # Worker threads open their own connection, don't leave it open between renewals
+        connection.close()
+
+
+def _renew(outlook_cache):
+    '''
+        Function to renew a subscription, or create it again when Graph deleted it
+        @@Param outlook_cache: OutlookServerDetails of the mailbox
+        @@Returns the OutlookServerDetails fields to update
+    '''
+    cache = outlook_utils._load_cache(outlook_cache)
+    result = outlook_utils._get_token_from_cache(cache, outlook_cache.user_id)
+    if not result or "access_token" not in result:
+        raise Exception('No access token: {}'.format(result.get("error_description") if result else 'no account'))
+    token = result["access_token"]
+
+    fields = {}
+    subscription = outlook_requests.refresh_subscription_for_notification(token, outlook_cache.subscription_id)
+    if subscription.get("error", {}).get("code") in ("ResourceNotFound", "404"):
+        subscription = outlook_requests.subscript_for_notifications(token)
+        if "id" in subscription:
+            fields['subscription_id'] = subscription["id"]
+    if "error" in subscription:
+        raise Exception(subscription["error"].get("message") or subscription["error"].get("code"))
+
+    fields.update(subscription_fields(subscription))
+    fields['subscription_error'] = ''
+    return fields
+
+
+def subscription_fields(subscription):
+    '''
+        Function to get the expiration and the next renewal of a subscription created or renewed
+        @@Param subscription: subscription returned by Graph
+        @@Returns OutlookServerDetails fields
+    '''
+    expires = parse_datetime(subscription.get("expirationDateTime") or '')
+    if expires is None:
+        # Not expected from Graph, renew it as if just created
+        expires = timezone.now() + timedelta(days=2)
+    return {
+        'subscription_alive': True,
+        'subscription_expires': expires,
+        'subscription_renew_at': expires - RENEW_BEFORE,
+    }
@@ -1,3 +1,353 @@
-from django.test import TestCase
+import json
+import os
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from customer.models import Customer, Lead
+from . import ingestion
+from .management.commands.benchmark_mail_parser import CORPUS
+from .models import MailNotification, OutlookServerDetails
+from .utilities_dir import outlook_requests, outlook_utils, scrapper
+from .utilities_dir.graph_client import BATCH_SIZE, GraphClient, GraphError
+
+
+class GraphStub(ThreadingHTTPServer):
+    '''
+        Local HTTP server standing in for Graph. Every request is recorded and answered by respond(), which
+        returns (status, body, headers). By default the responses queued in replies are returned in order,
+        then 200 {}.
+    '''
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), GraphStubHandler)
+        self.requests = []
+        self.replies = []
+        self.respond = self.next_reply
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/v1.0'.format(self.server_address[1])
+
+    def next_reply(self, method, path, body):
+        return self.replies.pop(0) if self.replies else (200, {}, {})
+
+
+class GraphStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        path = self.path.split('/v1.0', 1)[1]
+        self.server.requests.append((self.command, path, body))
+        status, reply, headers = self.server.respond(self.command, path, body)
+        data = json.dumps(reply).encode() if reply is not None else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = handle_request
+
+
+class GraphClientTest(SimpleTestCase):
+    '''
+        GraphClient against a local stub server. time.sleep is replaced to record the delays instead of waiting.
+    '''
+
+    def setUp(self):
+        self.stub = GraphStub()
+        thread = threading.Thread(target=self.stub.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+
+        self.client = GraphClient(self.stub.url, timeout=5, max_retries=3, backoff=0.5)
+        self.addCleanup(self.client.session.close)
+        sleep = mock.patch('mailserver.utilities_dir.graph_client.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def delays(self):
+        return [call.args[0] for call in self.sleep.call_args_list]
+
+    def test_throttled_waits_for_retry_after(self):
+        self.stub.replies = [
+            (429, {'error': {'code': 'TooManyRequests'}}, {'Retry-After': '7'}),
+            (200, {'id': 'message'}, {}),
+        ]
+        self.assertEqual(self.client.call('GET', 'me/messages/message', 'token'), {'id': 'message'})
+        self.assertEqual(self.delays(), [7.0])
+        self.assertEqual(len(self.stub.requests), 2)
+
+    def test_retry_after_too_long_is_returned(self):
+        self.stub.replies = [(429, {'error': {'code': 'TooManyRequests'}}, {'Retry-After': '3600'})]
+        response = self.client.call('GET', 'me/messages/message', 'token')
+        self.assertEqual(response['error']['code'], 'TooManyRequests')
+        self.assertEqual(self.delays(), [])
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_unavailable_backs_off_exponentially(self):
+        self.stub.replies = [(503, None, {}), (504, None, {}), (200, {'value': []}, {})]
+        self.assertEqual(self.client.call('GET', 'me/messages', 'token'), {'value': []})
+        first, second = self.delays()
+        self.assertTrue(0.5 <= first <= 1.0)
+        self.assertTrue(1.0 <= second <= 1.5)
+
+    def test_unavailable_returned_after_max_retries(self):
+        self.stub.replies = [(503, None, {})] * 5
+        response = self.client.call('GET', 'me/messages', 'token')
+        self.assertEqual(response['error']['code'], '503')
+        self.assertEqual(len(self.stub.requests), 4)
+        self.assertEqual(len(self.delays()), 3)
+
+    def test_server_error_not_retried(self):
+        self.stub.replies = [(500, {'error': {'code': 'InternalServerError'}}, {})]
+        response = self.client.call('POST', 'subscriptions', 'token', json={})
+        self.assertEqual(response['error']['code'], 'InternalServerError')
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_gateway_timeout_retried_if_idempotent(self):
+        self.stub.replies = [(504, None, {}), (200, {'id': 'subscription'}, {})]
+        self.assertEqual(self.client.call('PATCH', 'subscriptions/1', 'token', json={}, idempotent=True),
+                         {'id': 'subscription'})
+        # Graph may have created the subscription, not sent again
+        self.stub.replies = [(504, None, {}), (201, {'id': 'subscription'}, {})]
+        response = self.client.call('POST', 'subscriptions', 'token', json={})
+        self.assertEqual(response['error']['code'], '504')
+        self.assertEqual(len(self.stub.requests), 3)
+        # Not processed, sent again
+        self.stub.replies = [(503, None, {}), (201, {'id': 'subscription'}, {})]
+        self.assertEqual(self.client.call('POST', 'subscriptions', 'token', json={}), {'id': 'subscription'})
+
+    def test_unreachable_raises(self):
+        client = GraphClient('http://127.0.0.1:{}/v1.0'.format(self.stub.server_address[1]), max_retries=1)
+        self.stub.shutdown()
+        self.stub.server_close()
+        with self.assertRaises(GraphError):
+            client.call('GET', 'me/messages', 'token')
+        self.assertEqual(len(self.delays()), 1)
+
+    def test_unreachable_logged(self):
+        self.stub.shutdown()
+        self.stub.server_close()
+        with mock.patch('mailserver.utilities_dir.outlook_requests.graph_client', return_value=self.client), \
+                self.assertLogs('mailserver.utilities_dir.outlook_requests', 'ERROR'):
+            response = outlook_requests.fetch_message_by_message_id('message', 'token')
+            mails = outlook_requests.fetch_messages_by_message_ids(['message-1', 'message-2'], 'token')
+        self.assertEqual(response['error']['code'], 'GraphUnreachable')
+        self.assertEqual({mail['error']['code'] for mail in mails.values()}, {'GraphUnreachable'})
+
+    def batch(self, method, path, body, status=None):
+        '''
+            $batch answer of the stub: every message, in reverse order as Graph does not keep the order.
+            @@Param status: optional. Function of the message id to the status of its response, 200 by default
+        '''
+        responses = []
+        for request in body['requests']:
+            message_id = request['url'].rsplit('/', 1)[1]
+            code = status(message_id) if status else 200
+            if code == 200:
+                responses.append({'id': request['id'], 'status': 200, 'body': {'id': message_id}})
+            else:
+                responses.append({'id': request['id'], 'status': code, 'headers': {'Retry-After': '2'},
+                                  'body': {'error': {'code': str(code)}}})
+        return 200, {'responses': responses[::-1]}, {}
+
+    def test_batch_split_and_ordered(self):
+        self.stub.respond = self.batch
+        paths = ['me/messages/{}'.format(i) for i in range(2 * BATCH_SIZE + 5)]
+        results = self.client.batch_get(paths, 'token')
+        self.assertEqual(results, [{'id': str(i)} for i in range(len(paths))])
+        self.assertEqual([len(body['requests']) for method, path, body in self.stub.requests],
+                         [BATCH_SIZE, BATCH_SIZE, 5])
+        self.assertEqual({path for method, path, body in self.stub.requests}, {'/$batch'})
+
+    def test_batch_failed_items(self):
+        throttled = {'1'}
+
+        def status(message_id):
+            if message_id in throttled:
+                throttled.discard(message_id)
+                return 429
+            return 404 if message_id == '2' else 200
+
+        self.stub.respond = lambda *request: self.batch(*request, status=status)
+        results = self.client.batch_get(['me/messages/0', 'me/messages/1', 'me/messages/2'], 'token')
+        self.assertEqual(results, [{'id': '0'}, {'id': '1'}, {'error': {'code': '404'}}])
+        # Only the throttled message is sent again, after its Retry-After
+        self.assertEqual([[request['url'] for request in body['requests']]
+                          for method, path, body in self.stub.requests],
+                         [['/me/messages/0', '/me/messages/1', '/me/messages/2'], ['/me/messages/1']])
+        self.assertEqual(self.delays(), [2.0])
+
+    def test_batch_throttled_until_max_retries(self):
+        self.stub.respond = lambda *request: self.batch(*request, status=lambda message_id: 429)
+        results = self.client.batch_get(['me/messages/0'], 'token')
+        self.assertEqual(results, [{'error': {'code': '429'}}])
+        self.assertEqual(len(self.stub.requests), 4)
+
+    def test_batch_request_failed(self):
+        replies = [(200, None, {}), (400, {'error': {'code': 'BadRequest'}}, {})]
+
+        def respond(method, path, body):
+            status, reply, headers = replies.pop(0)
+            return (status, reply, headers) if reply else self.batch(method, path, body)
+
+        self.stub.respond = respond
+        paths = ['me/messages/{}'.format(i) for i in range(BATCH_SIZE + 2)]
+        results = self.client.batch_get(paths, 'token')
+        # The failed $batch request fails its own messages only
+        self.assertEqual(results[:BATCH_SIZE], [{'id': str(i)} for i in range(BATCH_SIZE)])
+        self.assertEqual(results[BATCH_SIZE:], [{'error': {'code': 'BadRequest'}}] * 2)
+
+
+@skipUnless('lxml' in scrapper.PARSERS, 'lxml is not installed')
+class MailParserTest(SimpleTestCase):
+    '''
+        The lxml and BeautifulSoup parsers of the form mails read the same fields, see utilities_dir/scrapper.py
+    '''
+
+    def test_same_fields_on_corpus(self):
+        names = sorted(name for name in os.listdir(CORPUS) if name.endswith('.json'))
+        self.assertTrue(names)
+        for name in names:
+            with self.subTest(name), open(os.path.join(CORPUS, name)) as f:
+                mail = json.load(f)
+                content = mail['body']['content']
+                fields = scrapper.parse_form_lxml(content)
+                self.assertEqual(fields, scrapper.parse_form_bs4(content))
+                with override_settings(MAIL_FORM_PARSER='bs4'):
+                    details = scrapper.scrap_customer_info_from_form(mail)
+                with override_settings(MAIL_FORM_PARSER='lxml'):
+                    self.assertEqual(scrapper.scrap_customer_info_from_form(mail), details)
+
+    @override_settings(MAIL_FORM_PARSER='lxml')
+    def test_falls_back_to_bs4(self):
+        with self.assertLogs('mailserver.utilities_dir.scrapper', 'INFO'):
+            self.assertEqual(scrapper.parse_form(''), {})
+
+
+class IngestionTest(TransactionTestCase):
+    '''
+        Mails notified by the webhook, with Graph replaced by a mock returning the form mail of the corpus, see
+        ingestion.py. The workers run in the thread submitting them.
+    '''
+
+    def setUp(self):
+        user = User.objects.create_user('mailbox')
+        # Source of the leads of the web form, see scrapper.customer_details()
+        Lead.objects.create(id=1, name='Web form')
+        self.outlook_cache = OutlookServerDetails.objects.create(user_id=user.pk, subscription_id='sub-1')
+        with open(os.path.join(CORPUS, 'form_plain.json')) as f:
+            self.mail = json.load(f)
+        self.graph = mock.Mock()
+        self.graph.batch_get.side_effect = lambda paths, token: [dict(self.mail, id=path.rsplit('/', 1)[1])
+                                                                 for path in paths]
+        for target, value in (
+                ('mailserver.utilities_dir.outlook_requests.graph_client', lambda: self.graph),
+                ('mailserver.ingestion._mailbox', lambda subscription_id: (self.outlook_cache, 'token')),
+                ('mailserver.ingestion._executor', SimpleNamespace(submit=lambda function, *args: function(*args)))):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def notify(self, *messages):
+        '''
+            Function to post a webhook notification
+            @@Param messages: (subscription id, message id) of each notified message
+        '''
+        return ingestion.enqueue_notifications({"value": [
+            {"subscriptionId": subscription_id, "resourceData": {"id": message_id}}
+            for subscription_id, message_id in messages]})
+
+    def test_message_ingested_once(self):
+        # Notified twice, and by another subscription of the mailbox
+        self.assertEqual(self.notify(('sub-1', 'message-1'), ('sub-1', 'message-1'), ('sub-2', 'message-1')), 1)
+        notification = MailNotification.objects.get()
+        self.assertEqual(notification.status, 'DONE')
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertEqual(notification.customer, Customer.objects.get())
+
+        # Sent again by Graph, and the retries of the scheduler
+        self.assertEqual(self.notify(('sub-1', 'message-1')), 0)
+        ingestion.process_due_notifications()
+        ingestion.process_notifications('sub-1', [notification.pk])
+        self.assertEqual(MailNotification.objects.count(), 1)
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertEqual(self.graph.batch_get.call_count, 1)
+
+    def test_failure_retried(self):
+        self.graph.batch_get.side_effect = lambda paths, token: [
+            {"error": {"code": "ServiceUnavailable", "message": "Try later"}} for path in paths]
+        with self.assertLogs('mailserver.ingestion', 'WARNING'):
+            self.notify(('sub-1', 'message-1'))
+        notification = MailNotification.objects.get()
+        self.assertEqual((notification.status, notification.attempts), ('PENDING', 1))
+        self.assertIn('ServiceUnavailable', notification.error)
+        self.assertGreater(notification.next_attempt, timezone.now())
+        self.assertEqual(Customer.objects.count(), 0)
+
+        # Not tried again before its next attempt
+        ingestion.process_due_notifications()
+        self.assertEqual(MailNotification.objects.get().attempts, 1)
+
+        self.graph.batch_get.side_effect = lambda paths, token: [self.mail for path in paths]
+        MailNotification.objects.update(next_attempt=timezone.now() - timedelta(seconds=1))
+        ingestion.process_due_notifications()
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts, notification.error), ('DONE', 2, ''))
+        self.assertEqual(notification.customer, Customer.objects.get())
+
+    def test_deleted_message_not_retried(self):
+        self.graph.batch_get.side_effect = lambda paths, token: [
+            {"error": {"code": "ErrorItemNotFound", "message": "Not found"}} for path in paths]
+        with self.assertLogs('mailserver.ingestion', 'WARNING'):
+            self.notify(('sub-1', 'message-1'))
+        self.assertEqual(MailNotification.objects.get().status, 'FAILED')
+
+
+class MsalAppTest(TransactionTestCase):
+    '''
+        MSAL applications kept in memory, see utilities_dir/outlook_utils.py. Building one is replaced by a mock,
+        checking the lock is not held meanwhile.
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user('mailbox')
+        OutlookServerDetails.objects.create(user_id=self.user.pk, token_cache='{}')
+        self.addCleanup(outlook_utils._forget_cache_for_user, self.user.pk)
+
+        def new_msal_app(client_config, cache=None, authority=None):
+            self.assertFalse(outlook_utils._lock.locked())
+            return mock.Mock(cache=cache)
+
+        patcher = mock.patch('mailserver.utilities_dir.outlook_utils._new_msal_app', side_effect=new_msal_app)
+        self.new_msal_app = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_app_kept_by_user(self):
+        cache = outlook_utils._load_cache_for_user(self.user.pk)
+        app = outlook_utils._build_msal_app(cache=cache, user_id=self.user.pk)
+        self.assertIs(app.cache, cache)
+        self.assertIs(outlook_utils._build_msal_app(cache=cache, user_id=self.user.pk), app)
+        self.assertEqual(self.new_msal_app.call_count, 1)
+
+        # Another token cache of the user, not the one kept in memory
+        other = outlook_utils._build_msal_app(cache=outlook_utils.msal.SerializableTokenCache(), user_id=self.user.pk)
+        self.assertIsNot(other, app)
+        self.assertIs(outlook_utils._build_msal_app(cache=cache, user_id=self.user.pk), app)
@@ -10,5 +10,7 @@ urlpatterns = [
     path('revoke_outlook_oath', views.remove_outlook_auth, name="revoke-outlook-creds"),
     path('authorized', views.outlook_authorized, name='outlook-authorized'),
     path('outlook_webhook', views.webhook, name="outlook-webhook"),
-    path('get_notification', views.get_notification, name="get_notification")
+    path('get_notification', views.get_notification, name="get_notification"),
+    # Served by mailserver/events.py under ASGI
+    path('events', views.lead_events, name="lead-events"),
 ]
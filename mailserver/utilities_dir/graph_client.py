@@ -0,0 +1,195 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import outlook_config as config
+
+# Client of the Microsoft Graph API shared by the whole process.
+#
+# Requests go through a single requests.Session, so connections are kept alive and reused instead of opening a
+# new TCP and TLS connection for every call. Every request has a timeout.
+# Throttled or unavailable responses (429, 503) are tried again after the delay of their Retry-After header, or
+# after an exponential backoff without it. Gateway timeouts (504) and network errors are only tried again for the
+# requests that are safe to send twice: Graph may have applied the request, e.g. created a subscription. A
+# Retry-After longer than MAX_RETRY_AFTER is not waited for: the response is returned, for the caller to try again
+# later.
+# The API url is GRAPH_API_URL in the settings, so the client can be pointed at a local stub server.
+
+# Statuses of the requests Graph did not process, tried again whatever the method
+RETRY_STATUSES = (429, 503)
+
+# Statuses of the requests Graph may have processed, tried again for the idempotent ones only
+IDEMPOTENT_RETRY_STATUSES = (504,)
+
+# Methods that can be sent again when the connection failed, the server may have received them
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# Maximum number of requests in a $batch request, set by Graph
+BATCH_SIZE = 20
+
+# Longest Retry-After in seconds the client waits for
+MAX_RETRY_AFTER = 60
+
+
+class GraphError(Exception):
+    '''
+        Raised when Graph could not be reached
+    '''
+
+
+class GraphClient:
+    '''
+        Client of the Microsoft Graph API
+        @@Param base_url: url of the API, e.g. https://graph.microsoft.com/v1.0
+        @@Param timeout: seconds to connect and to read the response, a number or a (connect, read) tuple
+        @@Param max_retries: number of times a request is tried again
+        @@Param backoff: seconds waited before the first retry without Retry-After, doubled for each retry
+        @@Param pool_size: number of connections kept alive
+    '''
+
+    def __init__(self, base_url, timeout=(5, 30), max_retries=3, backoff=0.5, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def url(self, path):
+        '''
+            Function to get the absolute url of a path of the API, e.g. "me/messages"
+        '''
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return '{}/{}'.format(self.base_url, path.lstrip('/'))
+
+    def retry_delay(self, headers, attempt):
+        '''
+            Function to get the seconds to wait before trying a request again
+            @@Param headers: headers of the response, with Retry-After in seconds or as a date
+            @@Param attempt: number of the attempt that failed, from 0
+        '''
+        retry_after = {name.lower(): value for name, value in (headers or {}).items()}.get('retry-after')
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+
+    def request(self, method, path, token, idempotent=None, **kwargs):
+        '''
+            Function to send a request, trying it again while it is throttled or the connection fails
+            @@Param method: HTTP method
+            @@Param path: path of the API or absolute url
+            @@Param token: access token
+            @@Param idempotent: whether the request can be sent again after a network error. Default: by method
+            @@Param kwargs: arguments of requests, e.g. json or params
+            @@Returns the last response
+            @@Raises GraphError if Graph could not be reached
+        '''
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES + IDEMPOTENT_RETRY_STATUSES if idempotent else RETRY_STATUSES
+        headers = {"Authorization": "Bearer {}".format(token)}
+        headers.update(kwargs.pop('headers', {}))
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, self.url(path), headers=headers, timeout=self.timeout,
+                                                **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # A request that could not connect was never received, it can always be sent again
+                if attempt == self.max_retries or not (idempotent or isinstance(e, requests.ConnectTimeout)):
+                    raise GraphError('{} {} failed: {}'.format(method, path, e)) from e
+                time.sleep(self.retry_delay(None, attempt))
+                continue
+
+            if response.status_code not in retry_statuses or attempt == self.max_retries:
+                return response
+            delay = self.retry_delay(response.headers, attempt)
+            if delay > MAX_RETRY_AFTER:
+                return response
+            time.sleep(delay)
+
+    def call(self, method, path, token, **kwargs):
+        '''
+            Function to send a request and decode its response
+            @@Returns the JSON body, {} when empty. Error responses are Graph errors: {"error": {"code", "message"}}
+            @@Raises GraphError if Graph could not be reached
+        '''
+        response = self.request(method, path, token, **kwargs)
+        if not response.content:
+            if response.ok:
+                return {}
+            return {"error": {"code": str(response.status_code), "message": response.reason}}
+        try:
+            return response.json()
+        except ValueError:
+            return {"error": {"code": str(response.status_code), "message": "Invalid JSON response"}}
+
+    def batch_get(self, paths, token):
+        '''
+            Function to GET several paths with $batch requests of BATCH_SIZE requests
+            @@Param paths: paths of the API, e.g. "me/messages/<id>"
+            @@Param token: access token
+            @@Returns the list of the JSON bodies in the order of paths, Graph errors for the failed ones
+            @@Raises GraphError if Graph could not be reached
+        '''
+        results = {}
+        pending = list(enumerate(paths))
+        for attempt in range(self.max_retries + 1):
+            throttled, delay = [], 0
+            for start in range(0, len(pending), BATCH_SIZE):
+                chunk = pending[start:start + BATCH_SIZE]
+                batch = {"requests": [{"id": str(index), "method": "GET", "url": '/' + path.lstrip('/')}
+                                      for index, path in chunk]}
+                # Only GET requests in the batch, it can be sent again
+                response = self.call('POST', '$batch', token, json=batch, idempotent=True)
+                if "error" in response:
+                    results.update((index, response) for index, path in chunk)
+                    continue
+                for item in response.get("responses", []):
+                    index = int(item["id"])
+                    retry = item.get("status") in RETRY_STATUSES + IDEMPOTENT_RETRY_STATUSES
+                    if retry and attempt < self.max_retries:
+                        throttled.append((index, paths[index]))
+                        delay = max(delay, self.retry_delay(item.get("headers"), attempt))
+                    else:
+                        results[index] = item.get("body") or {}
+            if not throttled or delay > MAX_RETRY_AFTER:
+                break
+            time.sleep(delay)
+            pending = throttled
+
+        missing = {"error": {"code": "TooManyRequests", "message": "Request throttled"}}
+        return [results.get(index, missing) for index in range(len(paths))]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def graph_client():
+    '''
+        Function to get the client shared by the process, created from the settings on first use
+    '''
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GraphClient(
+                getattr(settings, 'GRAPH_API_URL', config.GRAPH_URL),
+                timeout=getattr(settings, 'GRAPH_TIMEOUT', (5, 30)),
+                max_retries=getattr(settings, 'GRAPH_MAX_RETRIES', 3),
+                pool_size=getattr(settings, 'GRAPH_POOL_SIZE', 10))
+        return _client
@@ -1,7 +1,9 @@
 
-READ_MAIL_ENDPOINT = "https://graph.microsoft.com/v1.0/me/messages/"
-MAIL_NOTIFICATION_ENDPOINT = "https://graph.microsoft.com/v1.0/subscriptions"
-USER_INFO_ENDPOINT = "https://graph.microsoft.com/v1.0/users"
+# Graph API, the endpoints are relative to it. Can be replaced with GRAPH_API_URL in the settings
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+READ_MAIL_ENDPOINT = "me/messages"
+MAIL_NOTIFICATION_ENDPOINT = "subscriptions"
+USER_INFO_ENDPOINT = "users"
 AUTHORITY = "https://login.microsoftonline.com/common"
 SCOPE = ["User.Read", "User.ReadBasic.All"]
 
@@ -1,28 +1,33 @@
-import requests
+import logging
+
 from .import outlook_config as config
+from .graph_client import GraphError, graph_client
 from .outlook_utils import get_webhook_path, future_date_in_iso_formate
-#import outlook_config as config
-import json
 
+logger = logging.getLogger(__name__)
 
-def fetch_user_details(token):
+
+def _call_graph(method, path, token, **kwargs):
     '''
-        Function to fetch mail from outlook with ID and token
-        @Param id: message ID
-        @Param token: message token
+        Function to send a request to Graph with the shared client
+        @Param method: HTTP method
+        @Param path: path of the API
+        @Param token: auth token
+        @Returns the JSON response, or an "error" like the ones of Graph if it could not be reached
     '''
-    ret_value = {}
     try:
-        headers = {
-            "Authorization": "Bearer {}".format(token)
-        }
-        
-        mail_request = requests.get(config.USER_INFO_ENDPOINT, headers=headers)
-        ret_value = json.loads(mail_request.text)
+        return graph_client().call(method, path, token, **kwargs)
+    except GraphError as e:
+        logger.exception('Graph not reached: %s %s', method, path)
+        return {"error": {"code": "GraphUnreachable", "message": str(e)}}
 
-    except Exception as e:
-        pass
-    return ret_value
+
+def fetch_user_details(token):
+    '''
+        Function to fetch the users of the organization
+        @Param token: auth token
+    '''
+    return _call_graph("GET", config.USER_INFO_ENDPOINT, token)
 
 
 def fetch_message_by_message_id(id, token):
@@ -31,18 +36,23 @@ def fetch_message_by_message_id(id, token):
         @Param id: message ID
         @Param token: message token
     '''
-    ret_value = {}
-    try:
-        headers = {
-            "Authorization": "Bearer {}".format(token)
-        }
-        message_id_endpoint = config.READ_MAIL_ENDPOINT + "/{}".format(id)
-        mail_request = requests.get(message_id_endpoint, headers=headers)
-        ret_value = json.loads(mail_request.text)
+    return _call_graph("GET", "{}/{}".format(config.READ_MAIL_ENDPOINT, id), token)
 
-    except Exception as e:
-        pass
-    return ret_value
+
+def fetch_messages_by_message_ids(ids, token):
+    '''
+        Function to fetch several mails from outlook with $batch requests
+        @Param ids: message IDs
+        @Param token: auth token
+        @Returns dict of the mails by message ID, an "error" for the ones not fetched
+    '''
+    paths = ["{}/{}".format(config.READ_MAIL_ENDPOINT, id) for id in ids]
+    try:
+        mails = graph_client().batch_get(paths, token)
+    except GraphError as e:
+        logger.exception('Graph not reached, %s messages not fetched', len(ids))
+        mails = [{"error": {"code": "GraphUnreachable", "message": str(e)}}] * len(ids)
+    return dict(zip(ids, mails))
 
 
 def subscript_for_notifications(token):
@@ -51,28 +61,15 @@ def subscript_for_notifications(token):
         @Param token: auth token
 
     '''
-    ret_value = {}
-    try:
-        headers = {
-            "Authorization": "Bearer {}".format(token),
-            "Content-Type": "application/json"
-        }
-        data = {
-            "changeType": "updated",
-            "notificationUrl": get_webhook_path(),
-            "resource": "me/mailFolders('Inbox')/messages",
-            "expirationDateTime": future_date_in_iso_formate(2),
-            "clientState": "secretClientValue",
-            "latestSupportedTlsVersion": "v1_2"
-        }
-
-        mail_request = requests.post(
-            config.MAIL_NOTIFICATION_ENDPOINT, headers=headers, data=str(data))
-        ret_value = json.loads(mail_request.text)
-    except Exception as e:
-        pass
-
-    return ret_value
+    data = {
+        "changeType": "updated",
+        "notificationUrl": get_webhook_path(),
+        "resource": "me/mailFolders('Inbox')/messages",
+        "expirationDateTime": future_date_in_iso_formate(2),
+        "clientState": "secretClientValue",
+        "latestSupportedTlsVersion": "v1_2"
+    }
+    return _call_graph("POST", config.MAIL_NOTIFICATION_ENDPOINT, token, json=data)
 
 
 def refresh_subscription_for_notification(token, subscription_id):
@@ -81,24 +78,12 @@ def refresh_subscription_for_notification(token, subscription_id):
         @Param token: auth token
 
     '''
-    ret_value = {}
-    try:
-        headers = {
-            "Authorization": "Bearer {}".format(token),
-            "Content-Type": "application/json"
-        }
-        data = {
-            "expirationDateTime": future_date_in_iso_formate(2, with_microseconds=True),
-        }
-
-        mail_request = requests.patch(
-            config.MAIL_NOTIFICATION_ENDPOINT+"/{}".format(subscription_id), headers=headers, data=str(data))
-        ret_value = json.loads(mail_request.text)
-
-    except Exception as e:
-        pass
-
-    return ret_value
+    data = {
+        "expirationDateTime": future_date_in_iso_formate(2, with_microseconds=True),
+    }
+    # Setting the same expiration twice is harmless, the request can be sent again
+    return _call_graph("PATCH", "{}/{}".format(config.MAIL_NOTIFICATION_ENDPOINT, subscription_id), token,
+                       json=data, idempotent=True)
 
 
 def delete_subscription(token, subscription_id):
@@ -107,18 +92,4 @@ def delete_subscription(token, subscription_id):
         @Param token: auth token
 
     '''
-    ret_value = {}
-    try:
-        headers = {
-            "Authorization": "Bearer {}".format(token),
-            "Content-Type": "application/json"
-        }
-
-        mail_request = requests.delete(
-            config.MAIL_NOTIFICATION_ENDPOINT+"/{}".format(subscription_id), headers=headers)
-        ret_value = json.loads(mail_request.text)
-
-    except Exception as e:
-        pass
-
-    return ret_value
+    return _call_graph("DELETE", "{}/{}".format(config.MAIL_NOTIFICATION_ENDPOINT, subscription_id), token)
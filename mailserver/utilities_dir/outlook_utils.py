@@ -1,24 +1,111 @@
 
 from mailserver.models import OutlookServerDetails
 import msal
+import threading
+import time
 import uuid
 from . import outlook_config as config
 import sys
 from datetime import datetime, timedelta
 from allauth.socialaccount.models import SocialApp
+from django.conf import settings
 from django.urls import reverse
 
 
+# MSAL applications and token caches kept in memory by the process.
+#
+# Building an MSAL application reads the client config from the database and fetches the metadata of the authority
+# from Microsoft, and loading a token cache deserializes the whole cache of the user. Both are done once and kept:
+# the client config for CLIENT_CONFIG_TIMEOUT seconds, so changes in the admin are picked up, and the token cache of
+# a user until its first access token expires. The token cache is then loaded again from the database, with the
+# tokens refreshed meanwhile by the other processes, into the same cache object: the MSAL application of the user,
+# kept with their token cache, goes on using it.
+# The token cache is only written back to the database when MSAL changed it.
+# _lock only guards these dicts: the applications are built without it, a thread building one doesn't hold up the
+# token lookups of the other threads.
+
+CLIENT_CONFIG_TIMEOUT = getattr(settings, 'OUTLOOK_CLIENT_CONFIG_TIMEOUT', 300)
+
+_lock = threading.Lock()
+
+# (client_id, secret, time read)
+_client_config = None
+
+# Applications without token cache, used to build the auth urls, by (client_id, secret, authority)
+_msal_apps = {}
+
+# _UserTokens by user id, each with the MSAL application of the user
+_user_tokens = {}
+
+
+class _UserTokens:
+    '''
+        Token cache of a user kept in memory, with the MSAL application using it
+    '''
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.app = None
+        self.app_key = None
+        self.expires = _cache_expiry(cache)
+
+
+def _cache_expiry(cache):
+    '''
+        Function to get when the first access token of a token cache expires
+        @@Param cache: SerializableTokenCache
+        @@Returns a timestamp, now when the cache has no access token
+    '''
+    expires = [int(token.get("expires_on", 0))
+               for token in cache.find(msal.TokenCache.CredentialType.ACCESS_TOKEN)]
+    return min(expires) if expires else time.time()
+
+
+def _get_client_config():
+    '''
+        Function to get the client id and secret of the "Outlook Mail" social application
+        @@Returns (client_id, secret), empty strings when the application is not configured
+    '''
+    global _client_config
+    with _lock:
+        if _client_config is None or time.time() - _client_config[2] > CLIENT_CONFIG_TIMEOUT:
+            app_config = SocialApp.objects.filter(name="Outlook Mail").first()
+            if app_config is not None:
+                _client_config = (app_config.client_id, app_config.secret, time.time())
+            else:
+                _client_config = ('', '', time.time())
+        return _client_config[:2]
+
+
+def _new_msal_app(client_config, cache=None, authority=None):
+    '''
+        Function to create a MSAL application, fetching the metadata of the authority
+    '''
+    client_id, client_secret = client_config
+    return msal.ConfidentialClientApplication(
+        client_id, authority=authority or config.AUTHORITY,
+        client_credential=client_secret, token_cache=cache)
+
+
 def _load_cache(outlook_cache):
     '''
         Function to load a Serialized token Cache object\n
         @@Param outlook_cache: Modal of OutlookServerDetails
-        @@Returns: a cache object
+        @@Returns: a cache object, the one kept in memory for the user while its access tokens are valid
     '''
-    cache = msal.SerializableTokenCache()
-    if outlook_cache and outlook_cache.token_cache:
-        cache.deserialize(outlook_cache.token_cache)
-    return cache
+    if not outlook_cache:
+        return msal.SerializableTokenCache()
+    with _lock:
+        user_tokens = _user_tokens.get(outlook_cache.user_id)
+        if user_tokens is None:
+            user_tokens = _UserTokens(msal.SerializableTokenCache())
+            _user_tokens[outlook_cache.user_id] = user_tokens
+        elif user_tokens.expires > time.time():
+            return user_tokens.cache
+        # Loaded in place, the MSAL application of the user keeps using it
+        user_tokens.cache.deserialize(outlook_cache.token_cache)
+        user_tokens.expires = _cache_expiry(user_tokens.cache)
+        return user_tokens.cache
 
 
 def _load_cache_for_user(user_id):
@@ -27,11 +114,20 @@ def _load_cache_for_user(user_id):
         @@Param user_id: userid
         @@Retruns: a cache object
     '''
-    outlook_cache = OutlookServerDetails.objects.filter(
-        user_id=user_id)
-    if (len(outlook_cache)):
-        return _load_cache(outlook_cache[0])
-    return _load_cache(None)
+    with _lock:
+        user_tokens = _user_tokens.get(user_id)
+        if user_tokens is not None and user_tokens.expires > time.time():
+            return user_tokens.cache
+    return _load_cache(OutlookServerDetails.objects.filter(user_id=user_id).first())
+
+
+def _forget_cache_for_user(user_id):
+    '''
+        Function to drop the token cache kept in memory for a user, e.g. when their outlook account is removed
+        @@Param user_id: userid
+    '''
+    with _lock:
+        _user_tokens.pop(user_id, None)
 
 
 def _get_outlook_cache_for_subscription_id(subscription_id):
@@ -41,52 +137,61 @@ def _get_outlook_cache_for_subscription_id(subscription_id):
         @@Retruns: a cache object
     '''
     outlook_cache = OutlookServerDetails.objects.filter(
-        subscription_id=subscription_id)
-    if(len(outlook_cache)):
-        return _load_cache(outlook_cache[0]), outlook_cache[0]
-    return _load_cache(None), None
+        subscription_id=subscription_id).first()
+    return _load_cache(outlook_cache), outlook_cache
 
 
 def _save_cache(user_id, cache):
     '''
-        Function to save the cache object into database
+        Function to save the cache object into database, when it has changed
         @@Param cache: SerializableTokenCache
     '''
     if cache.has_state_changed:
-        outlook_cache = OutlookServerDetails.objects.filter(
-            user_id=user_id)
-        if len(outlook_cache) == 0:
-            cache_data = {
-                "user_id": user_id,
-                "token_cache": cache.serialize()
-            }
-            OutlookServerDetails(**cache_data).save()
-        else:
+        token_cache = cache.serialize()
+        # update() keeps the other fields, e.g. new_message, saved meanwhile by other threads
+        if not OutlookServerDetails.objects.filter(user_id=user_id).update(token_cache=token_cache):
+            OutlookServerDetails(user_id=user_id, token_cache=token_cache).save()
+        with _lock:
+            user_tokens = _user_tokens.get(user_id)
+            if user_tokens is not None and user_tokens.cache is cache:
+                user_tokens.expires = _cache_expiry(cache)
 
-            outlook_cache = outlook_cache[0]
-            outlook_cache.cache = cache.serialize()
-            outlook_cache.save()
 
-
-def _build_msal_app(cache=None, authority=None):
+def _build_msal_app(cache=None, authority=None, user_id=None):
     '''
-        Function to build MSAL application
+        Function to build MSAL application, or get the one already built for the token cache
         @@Param cache: SerializableTokenCache object
         @@Param authority: refer https://docs.microsoft.com/en-us/graph/security-authorization
+        @@Param user_id: userid of the token cache, its application is kept with it while it is kept in memory
         @@Returns a msal application
     '''
-    app_config = SocialApp.objects.filter(name="Outlook Mail")
-    CLIENT_ID = ''
-    CLIENT_SECRET = ''
+    client_config = _get_client_config()
+    key = client_config + (authority or config.AUTHORITY,)
+    user_tokens = None
+    with _lock:
+        if cache is None:
+            app = _msal_apps.get(key)
+        else:
+            user_tokens = _user_tokens.get(user_id)
+            if user_tokens is not None and user_tokens.cache is not cache:
+                # Token cache not kept in memory
+                user_tokens = None
+            app = user_tokens.app if user_tokens is not None and user_tokens.app_key == key else None
+    if app is not None:
+        return app
 
-    if app_config.count():
-        app_config = app_config.first()
-        CLIENT_ID = app_config.client_id
-        CLIENT_SECRET = app_config.secret
-        print(CLIENT_ID, CLIENT_SECRET)
-    return msal.ConfidentialClientApplication(
-        CLIENT_ID, authority=authority or config.AUTHORITY,
-        client_credential=CLIENT_SECRET, token_cache=cache)
+    # Built without the lock, fetching the metadata of the authority is a request to Microsoft
+    app = _new_msal_app(client_config, cache=cache, authority=authority)
+    with _lock:
+        if cache is None:
+            # Unless built meanwhile by another thread
+            return _msal_apps.setdefault(key, app)
+        if user_tokens is not None and _user_tokens.get(user_id) is user_tokens:
+            if user_tokens.app_key != key:
+                user_tokens.app = app
+                user_tokens.app_key = key
+            return user_tokens.app
+    return app
 
 
 def _get_token_from_cache(cache, user_id, scope=None):
@@ -99,7 +204,7 @@ def _get_token_from_cache(cache, user_id, scope=None):
 
     if scope == None:
         scope = config.SCOPE
-    cca = _build_msal_app(cache=cache)
+    cca = _build_msal_app(cache=cache, user_id=user_id)
     accounts = cca.get_accounts()
     if accounts:  # So all account(s) belong to the current signed-in user
         result = cca.acquire_token_silent(scope, account=accounts[0])
@@ -107,7 +212,6 @@ def _get_token_from_cache(cache, user_id, scope=None):
         return result
 
 
-
 def get_outlook_auth_redirect_path():
     '''
         Function to get the outlook auth redirect path
@@ -171,7 +275,8 @@ def future_date_in_iso_formate(days, with_microseconds=False):
         @@Param with_microseconds: data format 
         @@Retuns Date
     '''
-    future_date = datetime.now() + timedelta(days=days)
+    # In UTC, the formats end with Z
+    future_date = datetime.utcnow() + timedelta(days=days)
     date_format = "%Y-%m-%dT%H:%M:%SZ"
 
     if with_microseconds:
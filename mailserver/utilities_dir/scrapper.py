@@ -1,24 +1,166 @@
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from django.conf import settings
 import json
+import logging
 from datetime import datetime
 import sys
 import traceback
 import pprint
 
-def get_text_from_span(spans):
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+
+# Parsing of the web form mails into customer details.
+#
+# The forms are tables: each row with the heading of a field is followed by a row with its value, both in spans.
+# The fields read are given by FORM_FIELDS, compiled once in FORM_SPEC, and the rows are no longer scanned once
+# they are all found: the signatures and quoted replies after the form are skipped.
+# The mails are parsed with lxml when it is installed, several times faster, otherwise, or when lxml fails, with
+# BeautifulSoup. MAIL_FORM_PARSER in the settings forces one of PARSERS. Both are compared on the saved mails of
+# mailserver/benchmark_mails by `manage.py benchmark_mail_parser`.
+
+logger = logging.getLogger(__name__)
+
+# Customer field, or key combined by customer_details(), of the heading of each form field
+FORM_FIELDS = {
+    'First Name': "First Name",
+    'Last Name': "Last Name",
+    'Email': "customer_email",
+    'Phone Number': "phone_number",
+    'Post Code': "Post Code",
+    'Address': "customer_address",
+    'Message': "customer_notes",
+}
+
+
+class FormSpec:
     '''
-        Function to extract text from span tag
-        @@Param spans: list of span tags
-        @@Retusn text
+        Fields to read from the form mails
+        @@Param fields: customer field of each heading
     '''
-    ret_value = ''
-    try:
-        for span in spans:
-            if span.text and (span.text != '\xa0') :
-                ret_value = span.text
-                break
-    except Exception as e:
-        traceback.print_exc(file=sys.stdout)
+
+    def __init__(self, fields):
+        self.fields = dict(fields)
+        self.headings = frozenset(self.fields)
+
+    def complete(self, found):
+        '''
+            Function to know whether the value of every field was found
+            @@Param found: headings found
+        '''
+        return len(found) == len(self.headings)
+
+
+FORM_SPEC = FormSpec(FORM_FIELDS)
+
+
+def _first_text(texts):
+    '''
+        Function to get the first text of a row that is neither empty nor a non-breaking space
+        @@Param texts: iterable of the texts of the spans of the row
+    '''
+    for text in texts:
+        if text and text != '\xa0':
+            return text
+    return ''
+
+
+def _read_rows(rows, row_texts, spec):
+    '''
+        Function to read the fields of a form from its rows, by pairs of heading and value rows
+        @@Param rows: list of the table rows of the mail
+        @@Param row_texts: function returning the texts of the spans of a row
+        @@Param spec: FormSpec
+        @@Returns dict of the value of each heading found
+    '''
+    found = {}
+    for index in range(0, len(rows) - 1, 2):
+        heading = _first_text(row_texts(rows[index]))
+        if heading in spec.headings:
+            information = _first_text(row_texts(rows[index + 1]))
+            if information:
+                found[heading] = information
+                if spec.complete(found):
+                    break
+    return found
+
+
+def parse_form_bs4(content, spec=FORM_SPEC):
+    '''
+        Function to read the fields of a form mail with BeautifulSoup
+        @@Param content: HTML body of the mail
+        @@Param spec: FormSpec
+        @@Returns dict of the value of each heading found
+    '''
+    # Only the tables are kept, the rows are read from them
+    markup = BeautifulSoup(content, "html.parser", parse_only=SoupStrainer("table"))
+    return _read_rows(markup.select("table tr"), lambda row: (span.text for span in row.select("span")), spec)
+
+
+def parse_form_lxml(content, spec=FORM_SPEC):
+    '''
+        Function to read the fields of a form mail with lxml
+        @@Param content: HTML body of the mail
+        @@Param spec: FormSpec
+        @@Returns dict of the value of each heading found
+    '''
+    document = lxml_html.document_fromstring(content)
+    return _read_rows(document.xpath("//table//tr"),
+                      lambda row: (span.text_content() for span in row.iter("span")), spec)
+
+
+# Parsers by name, the first available one is used
+PARSERS = {}
+if lxml_html is not None:
+    PARSERS['lxml'] = parse_form_lxml
+PARSERS['bs4'] = parse_form_bs4
+
+
+def parse_form(content, spec=FORM_SPEC):
+    '''
+        Function to read the fields of a form mail with the parser of the settings, or the fastest one available
+        @@Param content: HTML body of the mail
+        @@Param spec: FormSpec
+        @@Returns dict of the value of each heading found
+    '''
+    parser = getattr(settings, 'MAIL_FORM_PARSER', None) or next(iter(PARSERS))
+    if parser == 'lxml' and 'lxml' in PARSERS:
+        try:
+            return parse_form_lxml(content, spec)
+        except (etree.ParserError, ValueError) as e:
+            # Empty body, or encoding declaration lxml refuses in a str
+            logger.info('lxml failed to parse the mail, parsed with BeautifulSoup: %s', e)
+    return parse_form_bs4(content, spec)
+
+
+def customer_details(fields, mail):
+    '''
+        Function to make the customer details from the fields of a form mail
+        @@Param fields: value of each heading found, see parse_form
+        @@Param mail: message fetched from Graph
+        @@Returns Customer fields
+    '''
+    ret_value = {FORM_SPEC.fields[heading]: information for heading, information in fields.items()}
+    ret_value["leads_from_id"] = 1
+
+    if "First Name" in ret_value:
+        name = ret_value["First Name"]
+        if "Last Name" in ret_value:
+            name += " "+ret_value["Last Name"]
+            del ret_value["Last Name"]
+        del ret_value["First Name"]
+        ret_value["customer_name"] = name
+
+    if "Post Code" in ret_value:
+        if "customer_address" in ret_value:
+            ret_value["customer_address"] += " ,"+ ret_value["Post Code"]
+        del ret_value["Post Code"]
+
+    mail_date = datetime.strptime(mail["receivedDateTime"],"%Y-%m-%dT%H:%M:%SZ")
+    ret_value["created_date"] = mail_date
     return ret_value
 
 
@@ -28,55 +170,10 @@ def scrap_customer_info_from_form(mail):
     '''
     ret_value = {}
 
-    filed_model_key_mapping = {
-        'First Name': "First Name",
-        'Last Name': "Last Name",
-        'Email': "customer_email",
-        'Phone Number': "phone_number",
-        'Post Code': "Post Code",
-        'Address': "customer_address",
-        'Message': "customer_notes",
-
-    }
-
     try:
-        if True:
-            if "body" in mail:
-                print("here")
-                content = mail["body"]["content"]
-                markup = BeautifulSoup(content, "html.parser")
-
-                rows = markup.select("table tr")
-                for index in range(0, len(rows), 2):
-                    spans = rows[index].select("span")
-                    heading = get_text_from_span(spans)
-                    if heading in filed_model_key_mapping:
-                        form_contexts = rows[index+1].select("span")
-
-                        information = get_text_from_span(form_contexts)
-                        if information:
-                           ret_value[filed_model_key_mapping[heading]] = information
-                ret_value["leads_from_id"] = 1
-
-                if "First Name" in ret_value:
-                    name = ret_value["First Name"]
-                    if "Last Name" in ret_value:
-                        name += " "+ret_value["Last Name"]
-                        del ret_value["Last Name"]
-                    del ret_value["First Name"]
-                    ret_value["customer_name"] = name
-                
-
-                if "Post Code" in ret_value:
-                    if "customer_address" in ret_value:
-                        ret_value["customer_address"] += " ,"+ ret_value["Post Code"]
-                    del ret_value["Post Code"]
-                
-                if True:
-                    mail_date = datetime.strptime(mail["receivedDateTime"],"%Y-%m-%dT%H:%M:%SZ")
-                    ret_value["created_date"] = mail_date
-                
+        if "body" in mail:
+            ret_value = customer_details(parse_form(mail["body"]["content"]), mail)
     except Exception as e:
         traceback.print_exc(file=sys.stdout)
-    
+
     return ret_value
@@ -1,20 +1,19 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, permission_required
-from django.contrib.auth.models import User
 from django.shortcuts import redirect, render, get_object_or_404
 from .utilities_dir.outlook_utils import (_build_preconfigured_auth_url_, _save_cache, _load_cache,
                                           _build_msal_app, get_outlook_auth_redirect_path, _get_token_from_cache,
-                                          _get_outlook_cache_for_subscription_id,
-                                          _load_cache_for_user, get_sign_out_path)
+                                          _load_cache_for_user, _forget_cache_for_user, get_sign_out_path)
 from .utilities_dir import outlook_config as app_config
 from .utilities_dir import outlook_requests
-from .utilities_dir import scrapper
 from django.views.decorators.http import require_POST
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 import json
 from mailserver.models import (OutlookServerDetails)
-from customer.models import Customer, Requirement, CreditCard
+from mailserver.ingestion import enqueue_notifications
+from mailserver.renewal import subscription_fields
+from mailserver import events
 from django.urls import reverse
 # Create your views here.
 
@@ -56,6 +55,7 @@ def remove_outlook_auth(request):
                 token, outlook_cache.subscription_id)
 
         outlook_cache.delete()
+        _forget_cache_for_user(request.user.id)
 
     return redirect(reverse("mail-server-home"))
 
@@ -80,7 +80,7 @@ def outlook_authorized(request):
     if request.GET.get('code'):
         cache = _load_cache_for_user(request.user.id)
 
-        result = _build_msal_app(cache=cache).acquire_token_by_authorization_code(
+        result = _build_msal_app(cache=cache, user_id=request.user.id).acquire_token_by_authorization_code(
             request.GET['code'],
             # Misspelled scope would cause an HTTP 400 error here
             scopes=app_config.SCOPE,
@@ -103,6 +103,8 @@ def outlook_authorized(request):
                     # Successful subscription
                     subscription_id = subscription["id"]
                     outlook_cache.subscription_id = subscription_id
+                    for field, value in subscription_fields(subscription).items():
+                        setattr(outlook_cache, field, value)
                     outlook_cache.save()
                 else:
                     print("Error while subscribing to webhook")
@@ -120,60 +122,20 @@ def outlook_authorized(request):
 @require_POST
 def webhook(request):
     '''
-        Webhook view for outlook, this is called when new notification is recieved from outlook
+        Webhook view for outlook, this is called when new notification is recieved from outlook.
+        The notified messages are only recorded here and processed in the background, see mailserver/ingestion.py
     '''
-    content = ''
     if "validationToken" in request.GET:
         content = request.GET.get("validationToken")
-    else:
-        jsondata = request.body.decode("utf-8")
-        notificaiton = json.loads(jsondata)
-        if "value" in notificaiton and len(notificaiton["value"]) > 0:
-            if "resourceData" in notificaiton["value"][0]:
-                message_id = notificaiton["value"][0]["resourceData"]["id"]
-                # Getting the cache
-                if "subscriptionId" in notificaiton["value"][0]:
-                    subscription_id = notificaiton["value"][0]["subscriptionId"]
-                    #result = _get_token_from_cache_with_subscription_id(request)
-                    cache, outlook_cache = _get_outlook_cache_for_subscription_id(
-                        subscription_id)
-                    if cache and outlook_cache:
-
-                        result = _get_token_from_cache(
-                            cache, outlook_cache.user_id)
-
-                        if "error" in result:
-                            print("ERROR in Webhook")
-
-                        current_token = result["access_token"]
-                        mail = outlook_requests.fetch_message_by_message_id(
-                            message_id, current_token)
-
-                        if not "error" in mail:
-                            customer_details = scrapper.scrap_customer_info_from_form(
-                                mail)
-                            # try:
-                            creator_id = outlook_cache.user_id
-                            creator = User.objects.filter(id=creator_id)
-                            if (len(customer_details.keys())):
-                                if(len(creator)):
-                                    customer_details["creator"] = creator[0]
-
-                                new_customer = Customer(**customer_details)
-                                new_customer.save()
-                                requirement = Requirement(
-                                    customer=new_customer, status="CREATED")
-                                requirement.save()
-                                credit_card = CreditCard(customer=new_customer)
-                                credit_card.save()
-                                outlook_cache.new_message = True
-                                outlook_cache.save()
-                            # except:
-                            #     pass
-                        else:
-                            print(mail["error"])
-
-    return HttpResponse(content=content, content_type="text/plain", status=200)
+        return HttpResponse(content=content, content_type="text/plain", status=200)
+
+    try:
+        notification = json.loads(request.body.decode("utf-8"))
+    except ValueError:
+        return HttpResponse(status=400)
+    enqueue_notifications(notification)
+
+    return HttpResponse(status=202)
 
 
 @login_required
@@ -190,9 +152,28 @@ def get_notification(request):
             "new_message": outlook_cache.new_message
         }
         if outlook_cache.new_message == True:
-            outlook_cache.new_message = False
-            outlook_cache.save()
+            # update() keeps the token cache saved meanwhile by the mail notification workers
+            OutlookServerDetails.objects.filter(pk=outlook_cache.pk).update(new_message=False)
 
         return JsonResponse(response)
 
     return HttpResponse(status=404)
+
+
+@login_required
+@permission_required(["mailserver.mailserver_view"])
+def lead_events(request):
+    '''
+        Server-sent events of the new leads, when the server runs without ASGI: answers the leads created since the
+        last event received by the browser, which reconnects a minute later. See mailserver/events.py
+    '''
+    body = 'retry: 60000\n\n'
+    last_event_id = events.parse_last_event_id(request.headers.get('Last-Event-ID'))
+    if last_event_id is None:
+        body += events.format_last_event_id(events.latest_lead_id())
+    else:
+        for customer_id, user_id in events.new_leads(last_event_id, request.user.id):
+            body += events.format_event(customer_id)
+    response = HttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
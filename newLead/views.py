@@ -2,18 +2,19 @@ import json
 from datetime import datetime
 
 from django.contrib import messages
-from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.files.storage import FileSystemStorage
-from django.db.models import Count
-from django.db.models import Q, Sum
 from django.http import JsonResponse, HttpResponseRedirect
 from django.shortcuts import redirect, render
 from django.template.loader import render_to_string
 
-from customer.models import (AppData, CreditCard, Customer, ElectricPower,
-                             File, Lead, Payment, Requirement, RoofType,
-                             ServiceNote, Storey, Supplier)
+from customer.dossier import customer_dossier
+from customer.duplicates import DUPLICATE_SCORE, describe
+from customer.lookups import lookup
+from customer.models import (AppData, CreditCard, Customer, Requirement,
+                             ServiceNote, Supplier)
+from customer.roles import user_in_group
+from customer.stages import stage_columns, stage_page, stage_rows_context
 
 from django.core.exceptions import ObjectDoesNotExist
 
@@ -27,7 +28,7 @@ from django.shortcuts import render
 @login_required
 def home(request):
     """Renders home page with default select options"""
-    if request.user.groups.filter(name='installer').exists():
+    if user_in_group(request.user, 'installer'):
         return redirect('./installation')
 
 
@@ -57,9 +58,9 @@ def home(request):
         'service_fields': service_fields
     }
     context = {
-        'leads': Lead.objects.all(),
-        'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-        'installers': get_user_model().objects.filter(profile__title='installer'),
+        'leads': lookup('leads'),
+        'sales_people': lookup('sales_people'),
+        'installers': lookup('installers'),
         'current_tab': 'home-tab',
         'required_fields': required_fields
     }
@@ -72,42 +73,29 @@ def home(request):
 def newLead_list(request):
     """POST: Creates a customer and redirects to customer requirement form. GET: Returns List of new leads."""
     if request.method == 'POST':
-        # get input data to check
-        customer_name = request.POST.get('customer_name')
-        agm = request.POST.get('agm') if request.POST.get('agm') else None
-        address = request.POST.get('customer_address') if request.POST.get('customer_address') else None
-        
-        # checks if the customer name already exists
-        customer = Customer.objects.filter(customer_name=customer_name)
-        agm_customer = Customer.objects.filter(agm=agm)
-        adress_customer = Customer.objects.filter(customer_address=address)
-        # if customer:
-        #     messages.error(request,f'Customer {customer_name} already exists.')
-        #     return redirect('home')
-        if agm:
-            if agm_customer:
-                messages.error(request,f'AGM {agm} already exists.')
-                return redirect('home')
-        elif address:
-            if adress_customer:
-                messages.error(request,f'Address {address} already exists.')
-                return redirect('home')
+        # Get data from form
+        customer_data = {
+            'creator': request.user,
+            'leads_from_id': request.POST.get('leads_from'),
+            'sales_person_id': request.POST.get('sales_person'),
+            'agm': request.POST.get('agm') if request.POST.get('agm') else None,
+            'date_signed': datetime.strptime(request.POST.get('date_signed'), '%d/%m/%Y').strftime(
+                '%Y-%m-%d') if request.POST.get('date_signed') else None,
+            'customer_name': request.POST.get('customer_name'),
+            'customer_address': request.POST.get('customer_address'),
+            'customer_email': request.POST.get('customer_email'),
+            'phone_number': request.POST.get('phone_number'),
+            'customer_notes': request.POST.get('customer_notes') if request.POST.get('customer_notes') else None
+        }
+        customer = Customer(**customer_data)
+
+        # checks if the customer already exists: same AGM, or same phone number or address and name, see
+        # customer/duplicates.py
+        matches = Customer.objects.likely_duplicates(customer)
+        if matches and matches[0][0] >= DUPLICATE_SCORE:
+            messages.error(request, f'Customer {describe(matches[0])} already exists.')
+            return redirect('home')
         else:
-            # Get data from form
-            customer_data = {
-                'creator': request.user,
-                'leads_from_id': request.POST.get('leads_from'),
-                'sales_person_id': request.POST.get('sales_person'),
-                'agm': request.POST.get('agm') if request.POST.get('agm') else None,
-                'date_signed': datetime.strptime(request.POST.get('date_signed'), '%d/%m/%Y').strftime(
-                    '%Y-%m-%d') if request.POST.get('date_signed') else None,
-                'customer_name': request.POST.get('customer_name'),
-                'customer_address': request.POST.get('customer_address'),
-                'customer_email': request.POST.get('customer_email'),
-                'phone_number': request.POST.get('phone_number'),
-                'customer_notes': request.POST.get('customer_notes') if request.POST.get('customer_notes') else None
-            }
-
             requirement_data = {
                 'installation_date': datetime.strptime(request.POST.get('installation_date'), '%d/%m/%Y').strftime(
                     '%Y-%m-%d') if request.POST.get('installation_date') else None,
@@ -115,7 +103,6 @@ def newLead_list(request):
             }
 
             # Create new customer and store it in database
-            customer = Customer(**customer_data)
             customer.save()
 
             if 'btn_create_customer' in request.POST:
@@ -137,46 +124,38 @@ def newLead_list(request):
                     requirement=requirement, content=request.POST.get('service_note').strip())
                 service_note.save()
 
+            # Customers sharing details with the new one, not enough to be the same
+            if matches:
+                messages.warning(request, 'Possible duplicate of {}.'.format(
+                    '; '.join(describe(match) for match in matches[:3])))
+
             # redirect to new customer view
             return redirect(path, pk=customer.id)
 
     elif request.method == 'GET':
         # Get all requirements in CREATED status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                status="CREATED").distinct()
-        else:
-            requirements = Requirement.objects.filter(Q(customer__sales_person=request.user) | Q(
-                installer=request.user), status="CREATED").distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Creation Date': 'customer.created_date',
-            'Sales': 'customer.sales_person',
-            'Lead Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Follow Up': 'customer.follow_up',
-            'Notes': 'customer.customer_notes',
-        }
+        requirements, next_cursor = stage_page('created', request.user)
+        columns = stage_columns('created')
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         context = {
             'requirements': requirements,
             'url_view': 'newLead-view',
             'columns': columns,
+            'stage': 'created',
+            'next_cursor': next_cursor,
             'search_field_visible': True,
             'colspan': len(columns) + 2,
-            'current_tab': 'customer-tab'
+            'current_tab': 'customer-tab',
+            **stage_rows_context('created', requirements),
         }
         # Return requirement list in CREATED status
         return render(request, 'customer/requirement-list.html', context=context)
@@ -188,56 +167,31 @@ def newLead_search(request):
 
         # get Search Key data from search form
         search_value = request.POST.get('search_value')
-        print("========================")
 
         # Get all requirements in CREATED status
-        if request.user.has_perm('customer.customer_view_others'):
-            requirements = Requirement.objects.filter(
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value),
-                status="CREATED").distinct()
-        else:
-            requirements = Requirement.objects.filter(
-                Q(customer__sales_person=request.user) |
-                Q(customer__customer_name__contains=search_value) |
-                Q(customer__customer_address__contains=search_value) |
-                Q(customer__customer_email__contains=search_value) |
-                Q(customer__phone_number__contains=search_value) |
-                Q(customer__agm__contains=search_value) |
-                Q(installer=request.user), status="CREATED").distinct()
-
-        # Set columns to display.
-        # IMPORTANT: to set columns in dict "columns",
-        # 'key' is the title of the column and 'value' is the field in requirement object,
-        # e.g. to get the customer name, 'requirement' object has an attribute 'customer' and this has an attribute 'customer_name'
-        # so to retrieve it you will use 'customer.customer_name'
-        columns = {
-            'Creation Date': 'customer.created_date',
-            'Sales': 'customer.sales_person',
-            'Customer Name': 'customer.customer_name',
-            'Phone': 'customer.phone_number',
-            'Address': 'customer.customer_address',
-            'Follow Up': 'customer.follow_up',
-            'Notes': 'customer.customer_notes',
-        }
+        requirements, next_cursor = stage_page('created', request.user, search_value=search_value)
+        columns = stage_columns('created', search=True)
 
         # Set template context
         #   requirements: Requirements data
+        #   rows: cells of the requirement rows, see stage_rows_context
         #   url_view: name of url to enter each customer form
         #   columns: colums definition
+        #   stage: stage of the list, used to load the following pages
+        #   next_cursor: cursor of the next page. None if this is the last page
         #   colspan: number of columns of the table. used to display a 'No results' message when empty
         #   current_tab: name of the current tab to set active class
         context = {
             'requirements': requirements,
             'url_view': 'newLead-view',
             'columns': columns,
+            'stage': 'created',
+            'next_cursor': next_cursor,
             'colspan': len(columns) + 2,
             'current_tab': 'customer-tab',
             'search_field_visible': True,
             'search_value': search_value,
+            **stage_rows_context('created', requirements, search=True),
         }
 
         # Return requirement list in CREATED status
@@ -248,7 +202,7 @@ def newLead_search(request):
 @permission_required(['customer.customer_view'])
 def newLead_view(request, pk):
     """Returns a customer form in CREATED status"""
-    customer = Customer.objects.get(id=pk)
+    dossier = customer_dossier(pk, 'credit_card', 'files')
 
     # Set context.
     # leads, sales_people, roof_types, storeys, electric_powers are default options loaded in Django admin
@@ -301,15 +255,12 @@ def newLead_view(request, pk):
     }
     context = {
         'current_tab': 'customer-tab',
-        'leads': Lead.objects.all(),
-        'sales_people': get_user_model().objects.filter(profile__title='salesman'),
-        'roof_types': RoofType.objects.all(),
-        'storeys': Storey.objects.all(),
-        'electric_powers': ElectricPower.objects.all(),
-        'customer': customer,
-        'requirement': Requirement.objects.filter(customer_id=customer.id).first(),
-        'credit_card': CreditCard.objects.filter(customer_id=customer.id).first(),
-        'files': File.objects.filter(customer_id=customer.id),
+        'leads': lookup('leads'),
+        'sales_people': lookup('sales_people'),
+        'roof_types': lookup('roof_types'),
+        'storeys': lookup('storeys'),
+        'electric_powers': lookup('electric_powers'),
+        **dossier,
         'power_meter_connection_disable': True,
         'required_fields': required_fields,
         'options': {
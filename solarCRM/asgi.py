@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'solarCRM.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from mailserver.events import EVENTS_PATH, lead_events_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # The new lead events keep their connection open, they are sent without going through the Django views
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        await lead_events_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
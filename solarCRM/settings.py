@@ -182,3 +182,43 @@ MESSAGE_TAGS = {
 }
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
+
+# Rows per page of the customer stage lists
+REQUIREMENT_PAGE_SIZE = 100
+
+# Reports generated in the background, see customer/reports.py
+REPORT_JOB_WORKERS = 2
+REPORT_JOB_STALE_MINUTES = 10
+
+# Seconds the option lists of the customer forms are kept in a process, see customer/lookups.py
+LOOKUP_CACHE_TIMEOUT = 60
+
+# Seconds the group memberships of a user are kept in the cache, see customer/roles.py
+GROUPS_CACHE_TIMEOUT = 60
+
+# Mails notified by the outlook webhook, processed in the background, see mailserver/ingestion.py
+MAIL_NOTIFICATION_WORKERS = 4
+MAIL_NOTIFICATION_MAX_ATTEMPTS = 5
+MAIL_NOTIFICATION_STALE_MINUTES = 10
+
+# Seconds between two looks for new leads created by the other processes, for the events pushed to the browsers, see
+# mailserver/events.py
+LEAD_EVENTS_POLL_SECONDS = 5
+
+# Background jobs of the mail server, run by `manage.py run_mail_scheduler`, see mailserver/renewal.py
+MAIL_SCHEDULER_INTERVAL_SECONDS = 60
+SUBSCRIPTION_RENEW_BEFORE_HOURS = 12
+SUBSCRIPTION_RENEWAL_WORKERS = 4
+
+# Threads parsing the mails read by `manage.py backfill_mail_leads`, see mailserver/backfill.py
+MAIL_BACKFILL_WORKERS = 4
+
+# Microsoft Graph client, see mailserver/utilities_dir/graph_client.py
+# GRAPH_API_URL = 'http://localhost:8001/v1.0'  # e.g. a local stub server
+GRAPH_TIMEOUT = (5, 30)  # seconds to connect, to read the response
+GRAPH_MAX_RETRIES = 3
+GRAPH_POOL_SIZE = 10
+
+# Seconds the client id and secret of the "Outlook Mail" social application are kept in memory, see
+# mailserver/utilities_dir/outlook_utils.py
+OUTLOOK_CLIENT_CONFIG_TIMEOUT = 300